@@ -0,0 +1,214 @@
+import contextlib
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import numpy as np
+import yaml
+from emitter_types import DEFAULT_SCHEDULE_CACHE_ENTRIES, enable_schedule_cache, schedule_cache_stats
+from estimator import estimate_scenario
+from kernels import overlap_group_starts, pri_schedule, set_backend
+from pdw_dataset import DATASET_FILE
+from pdw_io import DEFAULT_WRITE_BUFFERS
+from pdw_stream import DEFAULT_TOA_LOOKAHEAD
+
+# Batch runs: a queue of scenarios (a directory of YAML files or a manifest
+# listing them) is simulated by a pool of long-lived worker processes. Workers
+# import the simulator and set the kernel backend once, and keep a cache of
+# deterministic emitter schedules (emitter_types.schedule_table), so scenarios
+# sharing radar definitions and durations reuse them. The scenarios are
+# submitted largest estimated cost first, so the longest runs do not end up
+# alone at the tail of the batch.
+
+BATCH_MANIFEST_FILE = 'batch_manifest.json'
+SCENARIO_LOG_FILE = 'log.txt'
+
+
+def load_batch(source):
+    """
+    Read the scenario entries of a batch.
+
+    A directory contributes every *.yaml/*.yml file in it (sorted by name). A
+    manifest is a YAML or JSON file listing config paths or dictionaries with
+    'config' and optionally 'name' and 'seed'; paths are relative to the manifest.
+
+    :param source: Directory or manifest file
+    :return: List of entry dictionaries with name, config (path) and seed (or None)
+    """
+    if os.path.isdir(source):
+        paths = sorted(glob.glob(os.path.join(source, '*.yaml')) + glob.glob(os.path.join(source, '*.yml')))
+        items = [{'config': path} for path in paths]
+        base = ''
+    else:
+        with open(source) as f:
+            items = yaml.safe_load(f) or []
+        if isinstance(items, dict):
+            items = items.get('scenarios', [])
+        base = os.path.dirname(source)
+
+    entries = []
+    names = set()
+    for item in items:
+        if isinstance(item, str):
+            item = {'config': item}
+        path = os.path.join(base, item['config'])
+        name = item.get('name') or os.path.splitext(os.path.basename(path))[0]
+        if name in names:
+            raise ValueError(f"Duplicate scenario name {name} in batch {source}")
+        names.add(name)
+        entries.append({'name': name, 'config': path, 'seed': item.get('seed')})
+    if not entries:
+        raise ValueError(f"No scenarios found in {source}")
+    return entries
+
+def estimate_cost(config):
+    """
+    Relative cost of a scenario: the pulses every sensor has to process.
+
+    :param config: Configuration dictionary (as loaded from the YAML file)
+    :return: (cost, estimate dictionary from estimator.estimate_scenario)
+    """
+    estimate = estimate_scenario(config)
+    return sum(estimate['pulses'].values()) * len(config['sensors']), estimate
+
+def init_worker(backend, cache_entries):
+    """
+    Warm up a batch worker process: import the simulator, select the kernel backend,
+    compile its kernels on tiny inputs and enable the schedule cache.
+
+    :param backend: Kernel backend name or None
+    :param cache_entries: Schedule cache size, 0 to disable
+    """
+    import main  # noqa: F401 (loads the simulator modules once per worker)
+
+    if backend:
+        set_backend(backend)
+    pri_schedule(0.0, 1e-3, np.array([1e-4]))
+    overlap_group_starts(np.zeros(2), np.ones(2))
+    enable_schedule_cache(cache_entries)
+
+def run_batch_scenario(task):
+    """
+    Simulate one scenario of a batch into its own directory.
+
+    The simulator output goes to <directory>/log.txt.
+
+    :param task: Task dictionary (name, config, seed, directory and the run options)
+    :return: Result dictionary with timings, counts and schedule cache statistics
+    """
+    from main import create_scenario, load_config
+    from pdw_stream import run_sorted_simulation
+
+    os.makedirs(task['directory'], exist_ok=True)
+    cache_before = schedule_cache_stats()
+    started = time.perf_counter()
+    with open(os.path.join(task['directory'], SCENARIO_LOG_FILE), 'wt') as log, contextlib.redirect_stdout(log):
+        config = load_config(task['config'])
+        np.random.seed(task['seed'])
+        scenario = create_scenario(config)
+        created = time.perf_counter()
+        run_sorted_simulation(scenario, task['directory'], task['lookahead'], np.random.default_rng(task['seed']),
+                              task['truth'], output_format=task['output_format'], compress=task['compress'],
+                              write_buffers=task['write_buffers'])
+    finished = time.perf_counter()
+
+    with open(os.path.join(task['directory'], DATASET_FILE)) as f:
+        rows = {name: table['rows'] for name, table in json.load(f)['sensors'].items()}
+    cache_after = schedule_cache_stats()
+    simulate_time = finished - created
+    return {
+        'pulses': int(sum(radar.pulse_count for radar in scenario.radars)),
+        'pdws': rows,
+        'create_time': created - started,
+        'simulate_time': simulate_time,
+        'total_time': finished - started,
+        'pdws_per_second': sum(rows.values()) / simulate_time if simulate_time > 0 else None,
+        'worker': os.getpid(),
+        'cache_hits': cache_after['hits'] - cache_before['hits'],
+        'cache_misses': cache_after['misses'] - cache_before['misses'],
+    }
+
+def write_batch_manifest(output_dir, records, started):
+    """
+    Write batch_manifest.json with the record of every scenario.
+
+    :param output_dir: Output directory of the batch
+    :param records: Scenario records, in submission order
+    :param started: perf_counter() value at the start of the batch
+    """
+    manifest = {'elapsed': time.perf_counter() - started, 'scenarios': records}
+    with open(os.path.join(output_dir, BATCH_MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+def run_batch(source, output_dir, workers=None, seed=None, lookahead=DEFAULT_TOA_LOOKAHEAD, truth=False,
+              output_format='csv', compress=False, write_buffers=DEFAULT_WRITE_BUFFERS, backend=None,
+              cache_entries=DEFAULT_SCHEDULE_CACHE_ENTRIES):
+    """
+    Run a queue of scenarios on a pool of long-lived worker processes.
+
+    Every scenario writes a sorted run (as with --sorted-output) to
+    <output_dir>/<name>/. batch_manifest.json records the seed, estimated cost,
+    timings, PDW counts and throughput of every scenario and is rewritten after
+    each one completes; a failing scenario is recorded with its error and does
+    not stop the batch.
+
+    :param source: Directory of configuration files or batch manifest (see load_batch)
+    :param output_dir: Output directory
+    :param workers: Number of worker processes, default the number of CPUs
+    :param seed: Seed of the scenarios without their own; a random seed is recorded if None
+    :param lookahead: Bound on the TOA measurement error (seconds)
+    :param truth: Also write truth tables
+    :param output_format: 'csv' or 'columnar'
+    :param compress: Write gzip-compressed CSV files
+    :param write_buffers: Column buffers of the background writer, 0 to write in the simulation thread
+    :param backend: Kernel backend of the workers, default the current one
+    :param cache_entries: Schedule cache size of every worker, 0 to disable
+    :return: List of scenario records
+    """
+    entries = load_batch(source)
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+
+    records = []
+    for entry in entries:
+        record = {'name': entry['name'], 'config': entry['config'], 'directory': os.path.join(output_dir, entry['name'])}
+        record['seed'] = entry['seed'] if entry['seed'] is not None else seed
+        if record['seed'] is None:
+            record['seed'] = int(np.random.SeedSequence().generate_state(1)[0])
+        with open(entry['config']) as f:
+            record['estimated_cost'], estimate = estimate_cost(yaml.safe_load(f))
+        record['estimated_pdws'] = int(round(sum(estimate['pdws'].values())))
+        records.append(record)
+    records.sort(key=lambda record: record['estimated_cost'], reverse=True)
+
+    print(f"Running {len(records)} scenarios with {workers or os.cpu_count()} workers")
+    sys.stdout.flush()
+    options = {'lookahead': lookahead, 'truth': truth, 'output_format': output_format, 'compress': compress,
+               'write_buffers': write_buffers}
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(backend, cache_entries)) as executor:
+        pending = {}
+        for record in records:
+            task = dict(options, name=record['name'], config=record['config'], seed=record['seed'],
+                        directory=record['directory'])
+            pending[executor.submit(run_batch_scenario, task)] = record
+            record['status'] = 'queued'
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                record = pending.pop(future)
+                try:
+                    record.update(future.result())
+                    record['status'] = 'done'
+                    print(f"{record['name']}: {sum(record['pdws'].values())} PDWs in {record['total_time']:.2f} s, "
+                          f"{record['cache_hits']} cached schedules")
+                except Exception as error:
+                    record['status'] = 'failed'
+                    record['error'] = f"{type(error).__name__}: {error}"
+                    print(f"{record['name']}: failed ({record['error']})")
+            write_batch_manifest(output_dir, records, started)
+    print(f"Batch complete in {time.perf_counter() - started:.2f} s; manifest written to "
+          f"{os.path.join(output_dir, BATCH_MANIFEST_FILE)}")
+    return records
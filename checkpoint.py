@@ -0,0 +1,125 @@
+import os
+import pickle
+import time
+import numpy as np
+
+CHECKPOINT_VERSION = 4
+
+# Default wall clock time between checkpoints (seconds)
+DEFAULT_CHECKPOINT_INTERVAL = 300
+
+
+def save_checkpoint(filename, state):
+    """
+    Atomically write a checkpoint.
+
+    The state is pickled to a temporary file that replaces the previous
+    checkpoint only once it is complete, so a crash while saving keeps the
+    last good checkpoint.
+
+    :param filename: Checkpoint file
+    :param state: Checkpoint dictionary
+    """
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+def load_checkpoint(filename):
+    """
+    Read a checkpoint written by save_checkpoint.
+
+    :param filename: Checkpoint file
+    :return: Checkpoint dictionary
+    """
+    with open(filename, 'rb') as f:
+        state = pickle.load(f)
+    if state.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version: {state.get('version')}")
+    return state
+
+def schedule_fingerprint(scenario):
+    """
+    Summary of the radars' emission schedules, used to check that a resumed run
+    rebuilt the same scenario (e.g. the same jitter draws).
+
+    :param scenario: Scenario object
+    :return: Dictionary of radar name -> (pulse count, sum of pulse times)
+    """
+    return {radar.name: (radar.pulse_count, float(np.sum(radar.pulse_times[:radar.pulse_count])
+                                                  + radar.time_offset * radar.pulse_count))
+            for radar in scenario.radars}
+
+
+class Checkpointer:
+    """
+    Periodically saves the state of a sorted PDW run at window boundaries.
+
+    A checkpoint holds the scenario clock (next window), per-radar emission
+    cursors and pattern state, the random generator state, the pulses held back
+    by the TOA merge and overlap stages, and the byte offsets of all output
+    sinks. Its size depends on the lookahead, not on the output written so far.
+    """
+
+    def __init__(self, filename, scenario, options, interval=DEFAULT_CHECKPOINT_INTERVAL):
+        """
+        :param filename: Checkpoint file
+        :param scenario: Scenario object being simulated
+        :param options: Run options that must not change on resume (dictionary)
+        :param interval: Wall clock time between checkpoints (seconds)
+        """
+        self.filename = filename
+        self.scenario = scenario
+        self.options = options
+        self.interval = interval
+        self.fingerprint = schedule_fingerprint(scenario)
+        self.last_save = time.monotonic()
+
+    def due(self):
+        return time.monotonic() - self.last_save >= self.interval
+
+    def save(self, next_window, window_start, stage, output, cache_writer=None):
+        """
+        Write a checkpoint after all windows before next_window have been processed.
+
+        :param next_window: Index of the first window still to simulate
+        :param window_start: Start time of that window (seconds)
+        :param stage: pdw_stream.MeasurementStage of the run
+        :param output: pdw_stream.SortedOutput of the run
+        :param cache_writer: Optional TruePulseCacheWriter of the run
+        """
+        state = {
+            'version': CHECKPOINT_VERSION,
+            'options': self.options,
+            'fingerprint': self.fingerprint,
+            'window': next_window,
+            'time': window_start,
+            'radars': {radar.name: radar.emission_state(window_start) for radar in self.scenario.radars},
+            'rng': stage.rng.bit_generator.state if hasattr(stage.rng, 'bit_generator') else None,
+            'stage': stage.get_state(),
+            'outputs': output.tell(),
+            'cache': cache_writer.tell() if cache_writer is not None else None,
+        }
+        save_checkpoint(self.filename, state)
+        self.last_save = time.monotonic()
+
+    def verify(self, state):
+        """
+        Check that a checkpoint belongs to this scenario and these options.
+
+        :param state: Checkpoint dictionary
+        """
+        if state['options'] != self.options:
+            raise ValueError(f"Checkpoint options {state['options']} differ from the current options {self.options}")
+        if state['fingerprint'] != self.fingerprint:
+            raise ValueError("Radar emission schedules differ from the checkpoint; "
+                             "resume with the same configuration and --seed")
+        for radar in self.scenario.radars:
+            if radar.emission_state(state['time']) != state['radars'][radar.name]:
+                raise ValueError(f"Emission state of {radar.name} differs from the checkpoint")
+
+    def remove(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
@@ -28,4 +28,5 @@ def print_sensor_properties(sensors):
         print(f"  Systematic: {sensor.aoa_error_syst(0):.2f}")
         print(f"  Arbitrary: {sensor.aoa_error_arb(1)[0]:.2f} (example)")
         
-        print(f"{'='*50}")
\ No newline at end of file
+        print(f"{'='*50}")
+
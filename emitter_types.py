@@ -0,0 +1,192 @@
+import json
+import numpy as np
+from radar_properties import generate_frequencies, generate_pulse_times, generate_pulse_widths
+from precision import PrecisionPolicy
+
+# Fields an emitter type defines for all its instances
+EMITTER_TYPE_FIELDS = ('power', 'pri_type', 'pri_params', 'frequency_type', 'frequency_params',
+                       'pulse_width_type', 'pulse_width_params', 'lobe_pattern', 'rotation_type', 'rotation_params')
+
+# Fields an instance may set to differ from its type (start phase of the antenna, power)
+INSTANCE_OVERRIDES = ('power', 'rotation_type', 'rotation_params')
+
+# Deterministic schedules kept across scenarios by long-lived processes (batch
+# workers), keyed by their canonical parameters; disabled unless
+# enable_schedule_cache() is called
+DEFAULT_SCHEDULE_CACHE_ENTRIES = 256
+
+# Precision field of every schedule kind (None: always float64)
+SCHEDULE_FIELDS = {'pri': None, 'frequency': 'Frequency', 'pulse_width': 'PulseWidth'}
+
+_schedule_cache = None
+_schedule_cache_limit = DEFAULT_SCHEDULE_CACHE_ENTRIES
+_schedule_cache_stats = {'hits': 0, 'misses': 0}
+
+
+def enable_schedule_cache(max_entries=DEFAULT_SCHEDULE_CACHE_ENTRIES):
+    """
+    Keep deterministic schedules in memory and reuse them for later scenarios.
+
+    :param max_entries: Maximum number of cached schedules (oldest evicted first), 0 to disable
+    """
+    global _schedule_cache, _schedule_cache_limit
+    _schedule_cache = {} if max_entries else None
+    _schedule_cache_limit = max_entries
+
+def schedule_cache_stats():
+    """
+    :return: Dictionary with cache hits, misses, entries and bytes
+    """
+    cache = _schedule_cache or {}
+    return dict(_schedule_cache_stats, entries=len(cache), bytes=sum(table.nbytes for table in cache.values()))
+
+def schedule_table(kind, schedule_type, params, start_time, end_time, precision):
+    """
+    PRI, frequency or pulse width schedule, taken from the schedule cache when enabled.
+
+    Jittered schedules are random draws and are never cached.
+
+    :param kind: 'pri' (pulse times), 'frequency' or 'pulse_width'
+    :param schedule_type: 'fixed', 'stagger', 'switched' or 'jitter'
+    :param params: Parameters of the schedule from the radar configuration
+    :param start_time: Start time (seconds)
+    :param end_time: End time (seconds)
+    :param precision: PrecisionPolicy of the scenario
+    :return: Array (read-only when cached)
+    """
+    field = SCHEDULE_FIELDS[kind]
+    generate = {'pri': generate_pulse_times, 'frequency': generate_frequencies,
+                'pulse_width': generate_pulse_widths}[kind]
+
+    def build():
+        values = generate(schedule_type, params, start_time, end_time)
+        return values if field is None else precision.array(values, field)
+
+    if _schedule_cache is None or schedule_type == 'jitter':
+        return build()
+    key = json.dumps([kind, schedule_type, params, float(start_time), float(end_time),
+                      precision.dtype(field).name if field else 'float64'], sort_keys=True, default=float)
+    table = _schedule_cache.get(key)
+    if table is not None:
+        _schedule_cache_stats['hits'] += 1
+        return table
+    _schedule_cache_stats['misses'] += 1
+    table = read_only(build())
+    if len(_schedule_cache) >= _schedule_cache_limit:
+        del _schedule_cache[next(iter(_schedule_cache))]
+    _schedule_cache[key] = table
+    return table
+
+
+def read_only(array):
+    """
+    :param array: NumPy array
+    :return: Read-only view of the array
+    """
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+class EmitterType:
+    """
+    A radar type shared by many instances of a laydown.
+
+    Deterministic schedules (PRI, frequency and pulse width tables of every
+    type other than 'jitter') are built once per type, starting at time 0, and
+    handed to the instances as read-only views; each instance shifts the pulse
+    times by its own start time at lookup time. Jittered schedules are random
+    draws, so every instance still builds its own.
+
+    The tables cover the longest instance, so every instance must be added
+    before the first table is built (load_emitter_types adds the radars of
+    the configuration).
+    """
+
+    def __init__(self, name, config, precision=None):
+        """
+        :param name: Type name
+        :param config: Type configuration (the radar fields of EMITTER_TYPE_FIELDS)
+        :param precision: PrecisionPolicy of the scenario
+        """
+        unknown = set(config) - set(EMITTER_TYPE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields in emitter type {name}: {sorted(unknown)}")
+        self.name = name
+        self.config = config
+        self.precision = precision or PrecisionPolicy()
+        self.duration = 0.0
+        self.tables = {}
+
+    def instance_config(self, config):
+        """
+        Configuration of an instance: the type fields, then the instance fields.
+
+        The parameter dictionaries are the type's own objects, not copies.
+
+        :param config: Instance configuration (name, positions, start time, ...)
+        :return: Complete radar configuration
+        """
+        overridden = [field for field in EMITTER_TYPE_FIELDS
+                      if field in config and field not in INSTANCE_OVERRIDES]
+        if overridden:
+            raise ValueError(f"Radar {config['name']} of type {self.name} cannot override {overridden}; "
+                             f"define another emitter type instead.")
+        merged = dict(self.config)
+        merged.update(config)
+        del merged['type']
+        return merged
+
+    def shares(self, kind):
+        """
+        :param kind: 'pri', 'frequency' or 'pulse_width'
+        :return: True if the schedule of this kind is deterministic and shared by the instances
+        """
+        return self.config[f"{kind}_type"] != 'jitter'
+
+    def add_instance(self, start_time, end_time):
+        """
+        Extend the shared schedules to cover an instance emitting from start_time to end_time.
+
+        :param start_time: Start time of the instance (seconds)
+        :param end_time: End time of the simulation (seconds)
+        """
+        duration = end_time - start_time
+        if duration > self.duration:
+            if self.tables:
+                # Instances holding the built tables would keep schedules that are too short
+                raise ValueError(f"Emitter type {self.name}: an instance emitting for {duration} s was added "
+                                 f"after its schedules were built for {self.duration} s")
+            self.duration = duration
+
+    def table(self, kind):
+        """
+        Shared schedule of one kind, relative to the instance start time.
+
+        :param kind: 'pri' (pulse times), 'frequency' or 'pulse_width'
+        :return: Read-only array
+        """
+        if kind not in self.tables:
+            self.tables[kind] = read_only(schedule_table(kind, self.config[f"{kind}_type"], self.config[f"{kind}_params"],
+                                                         0.0, self.duration, self.precision))
+        return self.tables[kind]
+
+    def nbytes(self):
+        return sum(table.nbytes for table in self.tables.values())
+
+
+def load_emitter_types(config, precision=None):
+    """
+    Build the emitter types of a configuration, sized for their longest radar instance.
+
+    :param config: Configuration dictionary (as loaded from the YAML file)
+    :param precision: PrecisionPolicy of the scenario
+    :return: Dictionary of type name -> EmitterType
+    """
+    emitter_types = {name: EmitterType(name, type_config, precision)
+                     for name, type_config in (config.get('emitter_types') or {}).items()}
+    for radar_config in config['radars']:
+        if radar_config.get('type') in emitter_types:
+            emitter_types[radar_config['type']].add_instance(radar_config.get('start_time', 0),
+                                                             config['scenario']['end_time'])
+    return emitter_types
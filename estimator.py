@@ -0,0 +1,369 @@
+import io
+import numpy as np
+from scipy import stats
+from emitter_types import load_emitter_types
+from models import Scenario, Radar, Sensor
+from pdw_batch import PDW_COLUMNS, SPEED_OF_LIGHT, TRUTH_COLUMNS, wrap_angle
+from pdw_dataset import DEFAULT_INDEX_BLOCK, INDEX_DTYPE, OUTPUT_FORMATS, output_columns
+from pdw_io import DEFAULT_BUFFER_ROWS, DEFAULT_WRITE_BUFFERS, format_column
+from kernels import get_backend
+from scenario_geometry_functions import get_unit_registry
+from sensor_properties import detection_probability
+
+ureg = get_unit_registry()
+
+# Geometry samples per (sensor, radar) link, spread evenly over the emission time
+GEOMETRY_SAMPLES = 64
+
+# Antenna angles per geometry sample: the antenna turns many times while the
+# geometry barely changes, so every sample averages the detection probability
+# over a full turn (0.18 deg resolution, well inside typical main lobes)
+ANGLE_SAMPLES = 2048
+
+# Rows formatted per link to measure the CSV row length
+CSV_SAMPLE_ROWS = 64
+
+# Per-value tables of frequencies and pulse widths hold one value per millisecond
+# (see radar_properties.fixed_frequency)
+EMISSION_TABLE_INTERVAL = 0.001
+
+# Python string objects created per CSV field while formatting a batch
+CSV_FIELD_OVERHEAD = 64
+
+# Resident memory of the interpreter with NumPy, SciPy, Pint and PyYAML loaded,
+# before any simulation array (measured on CPython 3.11, Linux x86-64)
+INTERPRETER_BASELINE = 110e6
+
+# Additional resident memory of Numba, LLVM and the compiled kernels
+NUMBA_BASELINE = 105e6
+
+
+def cyclic_pulse_count(pri_sequence, duration):
+    """
+    Number of pulses of a cyclic PRI sequence in [0, duration), as in kernels.pri_schedule.
+
+    :param pri_sequence: PRI values in emission order (seconds)
+    :param duration: Time since the first pulse (seconds)
+    :return: Pulse count
+    """
+    if duration <= 0:
+        return 0
+    pri_sequence = np.asarray(pri_sequence, dtype=np.float64)
+    cycles, remainder = divmod(duration, pri_sequence.sum())
+    offsets = np.concatenate(([0.0], np.cumsum(pri_sequence)[:-1]))
+    return int(cycles) * len(pri_sequence) + int(np.searchsorted(offsets, remainder, side='left'))
+
+
+def mean_jittered_pri(mean_pri, jitter_percentage):
+    """
+    Mean of the truncated normal PRI drawn by radar_properties.jitter_pri.
+
+    :param mean_pri: Mean PRI value (seconds)
+    :param jitter_percentage: Jitter as a percentage of mean PRI
+    :return: Expected PRI (seconds)
+    """
+    std_dev = mean_pri * (jitter_percentage / 100)
+    if std_dev == 0:
+        return mean_pri
+    return float(stats.truncnorm((0 - mean_pri) / std_dev, np.inf, loc=mean_pri, scale=std_dev).mean())
+
+
+def expected_pulse_count(pri_type, pri_params, duration):
+    """
+    Number of pulses a radar emits in its first `duration` seconds, in closed form.
+
+    Exact for fixed, stagger and switched PRIs, the expected value for jitter.
+
+    :param pri_type: 'fixed', 'stagger', 'switched' or 'jitter'
+    :param pri_params: PRI parameters of the radar configuration
+    :param duration: Time since the radar's first pulse (seconds)
+    :return: Pulse count
+    """
+    if duration <= 0:
+        return 0
+    if pri_type == 'fixed':
+        return int(np.ceil(duration / pri_params['pri']))
+    elif pri_type == 'stagger':
+        return cyclic_pulse_count(pri_params['pri_pattern'], duration)
+    elif pri_type == 'switched':
+        return cyclic_pulse_count(np.repeat(pri_params['pri_pattern'], pri_params['repetitions']), duration)
+    elif pri_type == 'jitter':
+        # First pulse at the start, then one per expected PRI
+        return int(round(1 + duration / mean_jittered_pri(pri_params['mean_pri'], pri_params['jitter_percentage'])))
+    else:
+        raise ValueError(f"Invalid PRI type: {pri_type}")
+
+
+def link_sample(sensor, radar, times):
+    """
+    Link budget of a radar at a sensor over a grid of times and antenna angles.
+
+    :param sensor: Sensor object
+    :param radar: Radar object
+    :param times: Array of sample times (seconds)
+    :return: Tuple (amplitude dB of shape (len(times), ANGLE_SAMPLES), distance m, bearing rad)
+    """
+    distance_vector = sensor.path.positions_at(times) - radar.path.positions_at(times)
+    distance = np.hypot(distance_vector[:, 0], distance_vector[:, 1])
+    bearing = np.arctan2(distance_vector[:, 1], distance_vector[:, 0])
+    antenna = np.linspace(-np.pi, np.pi, ANGLE_SAMPLES, endpoint=False)
+    theta = wrap_angle(bearing[:, None] - antenna[None, :])
+    with np.errstate(divide='ignore'):
+        amplitude = (10 * np.log10(radar.power.to('watt').magnitude)
+                     - 20 * np.log10(distance)[:, None] + radar.gain_at(theta))
+    return amplitude, distance, bearing
+
+
+def mean_detection_probability(sensor, amplitude):
+    """
+    :param sensor: Sensor object
+    :param amplitude: Array of received amplitudes (dB)
+    :return: Mean detection probability, saturated pulses counting as detected
+    """
+    probability = detection_probability(amplitude, sensor.detection_thresholds, sensor.detection_steps,
+                                        sensor.detection_interpolation)
+    return float(np.mean(np.where(amplitude > sensor.saturation_db, 1.0, probability)))
+
+
+def emission_sample(radar, n):
+    """
+    Frequencies and pulse widths of the first n pulses of a radar.
+
+    :param radar: Radar object (its tables are overwritten)
+    :param n: Number of pulses
+    :return: Tuple of (frequency Hz, pulse width s) arrays
+    """
+    end_time = radar.start_time + (n + 1) * EMISSION_TABLE_INTERVAL * ureg.second
+    radar.calculate_frequencies(end_time)
+    radar.calculate_pulse_widths(end_time)
+    index = np.arange(n)
+    return radar.frequencies_at(index), radar.pulse_widths_at(index)
+
+
+def sample_rows(sensor, radar, times, amplitude, distance, bearing, rng):
+    """
+    Representative measured PDW rows of a link, for measuring the text row length.
+
+    :return: Tuple (PDW batch, truth batch)
+    """
+    n = len(times)
+    true_amplitude = amplitude[np.arange(n), rng.integers(0, amplitude.shape[1], n)]
+    true_amplitude = np.where(np.isfinite(true_amplitude), true_amplitude, 0.0)
+    frequency, pulse_width = emission_sample(radar, n)
+    true_toa = times + distance / SPEED_OF_LIGHT
+    true_aoa = wrap_angle(bearing + np.pi)
+    measured = sensor.measure_batch(true_amplitude, true_toa, frequency, pulse_width, true_aoa, rng)
+    index = np.arange(n)
+    pdw = dict(zip(['Amplitude', 'TOA', 'Frequency', 'PulseWidth', 'AOA'], measured))
+    pdw.update({'SensorID': np.full(n, sensor.name), 'RadarID': np.full(n, radar.name), 'PulseIndex': index})
+    truth = {'SensorID': pdw['SensorID'], 'RadarID': pdw['RadarID'], 'PulseIndex': index, 'EmissionTime': times,
+             'TOA': true_toa, 'Amplitude': true_amplitude, 'Frequency': frequency, 'PulseWidth': pulse_width,
+             'AOA': true_aoa, 'Detected': np.ones(n, dtype=bool), 'Delivered': np.ones(n, dtype=bool),
+             'OverlapGroup': np.full(n, -1, dtype=np.int64)}
+    return sensor.precision.cast(pdw), sensor.precision.cast(truth)
+
+
+def csv_row_bytes(batch, columns, precision):
+    """
+    Mean length of the CSV lines CsvSink writes for a batch.
+
+    :return: Bytes per row
+    """
+    output = precision.to_output(batch)
+    names = [precision.output_name(name) for name in columns]
+    rows = zip(*(format_column(output[name]) for name in names))
+    return float(np.mean([len(','.join(row)) + 1 for row in rows]))
+
+
+def columnar_row_bytes(columns):
+    """
+    :param columns: Dictionary of output column name -> dtype string
+    :return: Bytes per row of a ColumnarSink table
+    """
+    return sum(np.dtype('int32' if dtype == 'category' else dtype).itemsize for dtype in columns.values())
+
+
+def npy_header_bytes(dtype):
+    """
+    :param dtype: Array dtype
+    :return: Header size of a 1-D array of this dtype saved with np.save
+    """
+    buffer = io.BytesIO()
+    np.save(buffer, np.empty(0, dtype=dtype))
+    return buffer.tell()
+
+
+def memory_row_bytes(batch):
+    """
+    :return: Bytes per row of a batch held in memory
+    """
+    return sum(column.itemsize for column in batch.values())
+
+
+def estimate_scenario(config, chunk_sizes=None, seed=0, write_buffers=DEFAULT_WRITE_BUFFERS):
+    """
+    Estimate the size of a run without simulating it.
+
+    Pulse counts come in closed form from the PRI parameters of every radar.
+    Detection counts come from a sampled link budget: GEOMETRY_SAMPLES positions
+    per (sensor, radar) link, each averaged over a full antenna turn. Pulses
+    removed by receiver overlap rules are not subtracted, so the PDW counts are
+    an upper bound for sensors with an overlap rule. The cost does not depend
+    on the scenario length.
+
+    The peak memory adds the interpreter and library baseline and the column
+    buffers of the background writer to the simulation arrays.
+
+    :param config: Configuration dictionary (as loaded from the YAML file)
+    :param chunk_sizes: Optional simulation window lengths to estimate the peak memory for
+                        (seconds, default: the scenario time step)
+    :param seed: Seed of the generator drawing the sample measurement errors
+    :param write_buffers: Column buffers of the background writer (--write-buffers)
+    :return: Dictionary with pulse, PDW and byte counts
+    """
+    rng = np.random.default_rng(seed)
+    scenario = Scenario(config['scenario'])
+    precision = scenario.precision
+    start = scenario.start_time.to('second').magnitude
+    end = scenario.end_time.to('second').magnitude
+    time_step = scenario.time_step.to('second').magnitude
+    duration = max(end - start, 0.0)
+    emitter_types = load_emitter_types(config, precision)
+    radars = [Radar(radar_config, precision, emitter_types) for radar_config in config['radars']]
+    sensors = [Sensor(sensor_config, precision) for sensor_config in config['sensors']]
+    chunk_sizes = list(chunk_sizes or [time_step])
+
+    pulses = {}
+    for radar in radars:
+        radar_start = radar.start_time.to('second').magnitude
+        # Pulses before the scenario start are never emitted
+        pulses[radar.name] = (expected_pulse_count(radar.pri_type, radar.pri_params, end - radar_start)
+                              - expected_pulse_count(radar.pri_type, radar.pri_params, start - radar_start))
+
+    links = {}
+    pdw_samples, truth_samples = [], []
+    for sensor in sensors:
+        for radar in radars:
+            first = max(start, radar.start_time.to('second').magnitude)
+            if end <= first:
+                links[(sensor.name, radar.name)] = {'pulses': 0, 'pd': 0.0, 'pdws': 0.0}
+                continue
+            times = first + (np.arange(GEOMETRY_SAMPLES) + 0.5) * (end - first) / GEOMETRY_SAMPLES
+            amplitude, distance, bearing = link_sample(sensor, radar, times)
+            pd = mean_detection_probability(sensor, amplitude)
+            links[(sensor.name, radar.name)] = {'pulses': pulses[radar.name], 'pd': pd,
+                                                'pdws': pulses[radar.name] * pd}
+            rows = np.linspace(0, GEOMETRY_SAMPLES - 1, CSV_SAMPLE_ROWS).astype(int)
+            pdw, truth = sample_rows(sensor, radar, times[rows], amplitude[rows], distance[rows], bearing[rows], rng)
+            pdw_samples.append(pdw)
+            truth_samples.append(truth)
+
+    pdws = {sensor.name: sum(links[(sensor.name, radar.name)]['pdws'] for radar in radars) for sensor in sensors}
+    truth_rows = {sensor.name: sum(pulses.values()) for sensor in sensors}
+    n_sensors = len(sensors)
+    pdw_columns = output_columns(PDW_COLUMNS, precision)
+    truth_columns = output_columns(TRUTH_COLUMNS, precision)
+
+    sizes = {}
+    if pdw_samples:
+        csv_pdw_row = np.mean([csv_row_bytes(batch, PDW_COLUMNS, precision) for batch in pdw_samples])
+        csv_truth_row = np.mean([csv_row_bytes(batch, TRUTH_COLUMNS, precision) for batch in truth_samples])
+    else:
+        csv_pdw_row = csv_truth_row = 0.0
+    index_bytes = n_sensors * (npy_header_bytes(INDEX_DTYPE)
+                               + int(np.ceil(duration / DEFAULT_INDEX_BLOCK)) * INDEX_DTYPE.itemsize)
+    sizes['csv'] = {
+        'pdw': sum(len(','.join(pdw_columns)) + 1 + rows * csv_pdw_row for rows in pdws.values()),
+        'truth': sum(len(','.join(truth_columns)) + 1 + rows * csv_truth_row for rows in truth_rows.values()),
+        'index': index_bytes,
+    }
+    sizes['columnar'] = {
+        'pdw': sum(pdws.values()) * columnar_row_bytes(pdw_columns),
+        'truth': sum(truth_rows.values()) * columnar_row_bytes(truth_columns),
+        'index': index_bytes,
+    }
+
+    # Emission tables, trajectories and rotation tables live for the whole run
+    steps = int(np.ceil(duration / time_step)) + 1 if time_step > 0 else 1
+    # (schedules shared by the instances of an emitter type count once)
+    table_bytes = {'pri': 8, 'frequency': precision.dtype('Frequency').itemsize,
+                   'pulse_width': precision.dtype('PulseWidth').itemsize}
+    schedules = {}
+    for radar in radars:
+        for kind, itemsize in table_bytes.items():
+            length = pulses[radar.name] if kind == 'pri' else int(duration / EMISSION_TABLE_INTERVAL)
+            shared = radar.emitter_type is not None and radar.emitter_type.shares(kind)
+            key = (radar.emitter_type.name if shared else radar.name, kind)
+            schedules[key] = max(schedules.get(key, 0), length * itemsize)
+    tables = sum(schedules.values())
+    tables += (len(radars) + n_sensors) * steps * 3 * precision.dtype('Position').itemsize
+    tables += len(radars) * steps * 3 * precision.dtype('Rotation').itemsize
+    # Every window holds the true pulses of all links and the measured PDWs
+    true_row = memory_row_bytes(truth_samples[0]) if truth_samples else 0
+    pdw_row = memory_row_bytes(pdw_samples[0]) if pdw_samples else 0
+    total_pdws = sum(pdws.values())
+    total_pulses = sum(pulses.values())
+    baseline = INTERPRETER_BASELINE + (NUMBA_BASELINE if get_backend() == 'numba' else 0.0)
+    memory = {}
+    for chunk in chunk_sizes:
+        window_pulses = sum(expected_pulse_count(radar.pri_type, radar.pri_params, chunk) for radar in radars)
+        window_pdws = total_pdws / total_pulses * window_pulses if total_pulses else 0.0
+        working = n_sensors * window_pulses * true_row + window_pdws * pdw_row
+        # Writer buffers hold DEFAULT_BUFFER_ROWS rows, or grow to a whole window of one sensor
+        buffer_rows = max(DEFAULT_BUFFER_ROWS, window_pdws / n_sensors if n_sensors else 0.0)
+        buffers = write_buffers * buffer_rows * pdw_row
+        memory[chunk] = {
+            'csv': baseline + tables + working + buffers + window_pdws * len(PDW_COLUMNS) * CSV_FIELD_OVERHEAD,
+            'columnar': baseline + tables + working + buffers,
+            'simulation': tables + working,
+            'write_buffers': buffers,
+        }
+
+    return {
+        'duration': duration,
+        'pulses': pulses,
+        'links': links,
+        'pdws': pdws,
+        'sizes': sizes,
+        'baseline': baseline,
+        'memory': memory,
+    }
+
+
+def format_bytes(n):
+    """
+    :param n: Byte count
+    :return: Human-readable size
+    """
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if abs(n) < 1000:
+            return f"{n:.1f} {unit}"
+        n /= 1000
+    return f"{n:.1f} TB"
+
+
+def print_estimate(estimate):
+    """
+    Print the result of estimate_scenario.
+
+    :param estimate: Dictionary returned by estimate_scenario
+    """
+    print(f"Scenario duration: {estimate['duration']} s")
+    for name, count in estimate['pulses'].items():
+        print(f"{name}: {count} pulses")
+    for (sensor, radar), link in estimate['links'].items():
+        print(f"{sensor} <- {radar}: mean Pd {link['pd']:.4f}, {link['pdws']:.0f} PDWs")
+    for name, count in estimate['pdws'].items():
+        print(f"{name}: {count:.0f} PDWs")
+    print(f"Expected PDW count: {sum(estimate['pdws'].values()):.0f}")
+    for output_format in OUTPUT_FORMATS:
+        size = estimate['sizes'][output_format]
+        print(f"Output size ({output_format}): {format_bytes(size['pdw'] + size['index'])} PDWs + index, "
+              f"{format_bytes(size['truth'])} more with --truth")
+    for chunk, memory in estimate['memory'].items():
+        print(f"Peak memory with {chunk} s windows: "
+              + ', '.join(f"{format_bytes(memory[output_format])} ({output_format})"
+                          for output_format in OUTPUT_FORMATS)
+              + f": {format_bytes(estimate['baseline'])} interpreter and libraries, "
+                f"{format_bytes(memory['simulation'])} simulation arrays, "
+                f"{format_bytes(memory['write_buffers'])} write buffers")
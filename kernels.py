@@ -0,0 +1,236 @@
+import os
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Inner loops that are sequential by nature, with a pure NumPy implementation and
+# an optional Numba-compiled one. The backend is chosen with set_backend() or the
+# PDW_SIM_BACKEND environment variable ('auto', 'numpy' or 'numba'); 'auto' uses
+# Numba when it is installed. Both backends give identical results.
+BACKENDS = ('numpy', 'numba')
+
+_backend = None
+
+# Pulses per cumulative sum when the NumPy backend builds a window of a PRI schedule
+PRI_WINDOW_BLOCK = 65536
+
+
+def available_backends():
+    """
+    :return: List of backends usable in this environment
+    """
+    return [name for name in BACKENDS if name == 'numpy' or numba is not None]
+
+def set_backend(name='auto'):
+    """
+    Select the kernel backend.
+
+    'auto' picks Numba when installed, otherwise NumPy. Asking for 'numba'
+    without Numba installed falls back to NumPy with a message.
+
+    :param name: 'auto', 'numpy' or 'numba'
+    :return: Name of the selected backend
+    """
+    global _backend
+    if name == 'auto':
+        name = 'numba' if numba is not None else 'numpy'
+    if name not in BACKENDS:
+        raise ValueError(f"Invalid kernel backend: {name}. Must be 'auto' or one of {BACKENDS}.")
+    if name == 'numba' and numba is None:
+        print("Numba is not installed, using the NumPy kernels")
+        name = 'numpy'
+    _backend = name
+    return _backend
+
+def get_backend():
+    if _backend is None:
+        set_backend(os.environ.get('PDW_SIM_BACKEND', 'auto'))
+    return _backend
+
+
+########## PRI schedules ############
+
+def pri_schedule_numpy(start_time, end_time, pri_sequence):
+    # Upper bound on the pulse count, then one sequential cumulative sum
+    # (np.add.accumulate adds left to right, like the loop)
+    cycles = int(np.ceil((end_time - start_time) / np.sum(pri_sequence))) + 1
+    times = np.cumsum(np.concatenate(([start_time], np.tile(pri_sequence, cycles))))
+    return times[:np.searchsorted(times, end_time, side='left')]
+
+def pri_schedule(start_time, end_time, pri_sequence, backend=None):
+    """
+    Pulse times for a cyclic sequence of PRIs.
+
+    Pulses start at start_time; each following pulse comes one PRI later, the
+    PRIs cycling through pri_sequence, until end_time (exclusive).
+
+    :param start_time: Start time (seconds)
+    :param end_time: End time (seconds)
+    :param pri_sequence: PRI values in emission order (seconds)
+    :param backend: Optional backend overriding get_backend()
+    :return: Array of pulse times
+    """
+    pri_sequence = np.asarray(pri_sequence, dtype=np.float64)
+    if end_time <= start_time:
+        return np.empty(0)
+    if (backend or get_backend()) == 'numba':
+        return _pri_schedule_numba(float(start_time), float(end_time), pri_sequence)
+    return pri_schedule_numpy(float(start_time), float(end_time), pri_sequence)
+
+def pri_schedule_window_numpy(start_time, end_time, pri_sequence, window_start, block=PRI_WINDOW_BLOCK):
+    # Same sequential sums as pri_schedule_numpy, block by block, keeping only
+    # the pulses from window_start on (end_time is already clipped to the window end)
+    cycles = max(1, block // len(pri_sequence))
+    chunk = np.tile(pri_sequence, cycles)
+    current_time = start_time
+    first_index = 0
+    parts = []
+    while current_time < end_time:
+        times = np.cumsum(np.concatenate(([current_time], chunk)))
+        pulses = times[:-1]
+        lo, hi = np.searchsorted(pulses, [window_start, end_time], side='left')
+        first_index += min(lo, hi)
+        if hi > lo:
+            parts.append(pulses[lo:hi])
+        if hi < len(pulses):
+            break
+        current_time = times[-1]
+    return first_index, np.concatenate(parts) if parts else np.empty(0)
+
+def pri_schedule_window(start_time, end_time, pri_sequence, window_start, window_end, backend=None):
+    """
+    The pulses of pri_schedule(start_time, end_time, pri_sequence) emitted in
+    [window_start, window_end), without storing the earlier ones.
+
+    The times are the same values as in the full schedule: the sums before the
+    window are still computed, one pulse after the other.
+
+    :param start_time: Start time (seconds)
+    :param end_time: End time (seconds)
+    :param pri_sequence: PRI values in emission order (seconds)
+    :param window_start: Start of the window (seconds, inclusive)
+    :param window_end: End of the window (seconds, exclusive)
+    :param backend: Optional backend overriding get_backend()
+    :return: Tuple (index of the first pulse in the full schedule, array of pulse times)
+    """
+    pri_sequence = np.asarray(pri_sequence, dtype=np.float64)
+    end_time = min(end_time, window_end)
+    if end_time <= start_time:
+        return 0, np.empty(0)
+    if (backend or get_backend()) == 'numba':
+        first_index, times = _pri_schedule_window_numba(float(start_time), float(end_time), pri_sequence,
+                                                        float(window_start))
+        return int(first_index), times
+    return pri_schedule_window_numpy(float(start_time), float(end_time), pri_sequence, float(window_start))
+
+
+########## Detection threshold walk ############
+
+def threshold_walk_numpy(amplitude, thresholds, steps, saturated, uniform):
+    return saturated | (uniform < steps[np.searchsorted(thresholds, amplitude, side='left')])
+
+def threshold_walk(amplitude, thresholds, steps, saturated, uniform, backend=None):
+    """
+    Detection decisions on a compiled step detection curve.
+
+    A pulse is detected when saturated, or when its uniform draw is below the
+    probability of the interval its amplitude falls in (steps[i] above exactly
+    i thresholds; NaN amplitudes count as above all of them, like searchsorted).
+
+    :param amplitude: Array of amplitudes (dB)
+    :param thresholds: Sorted thresholds (dB), see sensor_properties.compile_detection_curve
+    :param steps: Probability above exactly i thresholds in steps[i]
+    :param saturated: Boolean array, True for pulses above the saturation level
+    :param uniform: One uniform [0, 1) draw per pulse
+    :param backend: Optional backend overriding get_backend()
+    :return: Boolean array, True for detected pulses
+    """
+    if (backend or get_backend()) == 'numba':
+        return _threshold_walk_numba(np.asarray(amplitude, dtype=np.float64), np.asarray(thresholds, dtype=np.float64),
+                                     np.asarray(steps, dtype=np.float64), np.asarray(saturated, dtype=np.bool_),
+                                     np.asarray(uniform, dtype=np.float64))
+    return threshold_walk_numpy(amplitude, thresholds, steps, saturated, uniform)
+
+
+########## Overlap sweep ############
+
+def overlap_group_starts_numpy(toa, busy_end):
+    starts = np.empty(len(toa), dtype=bool)
+    starts[:1] = True
+    starts[1:] = toa[1:] >= np.maximum.accumulate(busy_end)[:-1]
+    return starts
+
+def overlap_group_starts(toa, busy_end, backend=None):
+    """
+    Sweep over TOA-sorted busy intervals [toa, busy_end): a pulse starts a new
+    group when it arrives after every earlier interval has ended.
+
+    :param toa: TOA-sorted arrival times (seconds)
+    :param busy_end: End of each pulse's busy interval (seconds)
+    :param backend: Optional backend overriding get_backend()
+    :return: Boolean array, True where a new group starts
+    """
+    toa = np.asarray(toa, dtype=np.float64)
+    busy_end = np.asarray(busy_end, dtype=np.float64)
+    if (backend or get_backend()) == 'numba':
+        return _overlap_group_starts_numba(toa, busy_end)
+    return overlap_group_starts_numpy(toa, busy_end)
+
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _pri_schedule_numba(start_time, end_time, pri_sequence):
+        n_max = int(np.ceil((end_time - start_time) / pri_sequence.min())) + 1
+        times = np.empty(n_max)
+        current_time = start_time
+        n = 0
+        while current_time < end_time:
+            times[n] = current_time
+            current_time += pri_sequence[n % len(pri_sequence)]
+            n += 1
+        return times[:n]
+
+    @numba.njit(cache=True)
+    def _pri_schedule_window_numba(start_time, end_time, pri_sequence, window_start):
+        current_time = start_time
+        n = 0
+        while current_time < window_start and current_time < end_time:
+            current_time += pri_sequence[n % len(pri_sequence)]
+            n += 1
+        first_index = n
+        n_max = int(np.ceil((end_time - current_time) / pri_sequence.min())) + 1 if current_time < end_time else 0
+        times = np.empty(n_max)
+        k = 0
+        while current_time < end_time:
+            times[k] = current_time
+            current_time += pri_sequence[n % len(pri_sequence)]
+            n += 1
+            k += 1
+        return first_index, times[:k]
+
+    @numba.njit(cache=True)
+    def _threshold_walk_numba(amplitude, thresholds, steps, saturated, uniform):
+        detected = np.empty(len(amplitude), dtype=np.bool_)
+        for i in range(len(amplitude)):
+            if saturated[i]:
+                detected[i] = True
+                continue
+            level = 0
+            if amplitude[i] != amplitude[i]:
+                level = len(thresholds)
+            while level < len(thresholds) and amplitude[i] > thresholds[level]:
+                level += 1
+            detected[i] = uniform[i] < steps[level]
+        return detected
+
+    @numba.njit(cache=True)
+    def _overlap_group_starts_numba(toa, busy_end):
+        starts = np.empty(len(toa), dtype=np.bool_)
+        running_end = -np.inf
+        for i in range(len(toa)):
+            starts[i] = toa[i] >= running_end
+            running_end = max(running_end, busy_end[i])
+        return starts
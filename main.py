@@ -1,12 +1,24 @@
+import argparse
 import yaml
 import numpy as np
 from scenario_geometry_functions import calculate_trajectory, get_unit_registry
 from radar_properties import *
 from sensor_properties import *
 from models import Scenario, Radar, Sensor
+from emitter_types import DEFAULT_SCHEDULE_CACHE_ENTRIES, load_emitter_types
+from pdw_stream import DEFAULT_TOA_LOOKAHEAD, run_remeasure, run_sorted_simulation
+from checkpoint import DEFAULT_CHECKPOINT_INTERVAL
+from precision import PRESETS, PrecisionPolicy
+from kernels import BACKENDS, set_backend
+from sharding import LocalProcessLauncher, run_sharded_aggregate, run_sharded_simulation
+from pdw_stats import run_aggregate_simulation
+from pdw_server import DEFAULT_FRAME_INTERVAL, run_server
+from pdw_dataset import OUTPUT_FORMATS
+from pdw_io import DEFAULT_WRITE_BUFFERS
+from estimator import estimate_scenario, print_estimate
+from batch_runner import run_batch
 import sys
 
-sys.stdout=open('output.txt','wt')
 # Get the unit registry from scenario_geometry_functions
 ureg = get_unit_registry()
 
@@ -16,18 +28,22 @@ def load_config(filename):
     with open(filename, 'r') as file:
         return yaml.safe_load(file)
 
-def create_scenario(config):
+def create_scenario(config, window=None):
+    # window: optional (start, end) in seconds, to build only the radar pulses emitted in it (time shards)
     scenario = Scenario(config['scenario'])
+    emitter_types = load_emitter_types(config, scenario.precision)
     
     for radar_config in config['radars']:
-        radar = Radar(radar_config)
-        radar.calculate_trajectory(scenario.end_time, scenario.time_step)
+        radar = Radar(radar_config, scenario.precision, emitter_types)
+        radar.calculate_trajectory(scenario.end_time, scenario.time_step, window)
         scenario.radars.append(radar)
         print(f"Added {radar.name} to scenario")
+    for emitter_type in emitter_types.values():
+        print(f"Emitter type {emitter_type.name}: {emitter_type.nbytes()} bytes of shared schedules")
     
     for sensor_config in config['sensors']:
-        sensor = Sensor(sensor_config)
-        sensor.calculate_trajectory(scenario.end_time, scenario.time_step)
+        sensor = Sensor(sensor_config, scenario.precision)
+        sensor.calculate_trajectory(scenario.end_time, scenario.time_step, window)
         scenario.sensors.append(sensor)
     
     return scenario
@@ -105,15 +121,164 @@ def generate_pdw(sensor, radar, current_time):
         return None
 
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="PDW simulator")
+    parser.add_argument('--config', default='config.yaml', help="Scenario configuration file")
+    parser.add_argument('--output', default='pdw_output.csv', help="PDW output file")
+    parser.add_argument('--sorted-output', metavar='DIR',
+                        help="Write one TOA-sorted PDW file per sensor to DIR instead of --output")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv',
+                        help="With --sorted-output, write CSV files or memory-mappable binary column tables")
+    parser.add_argument('--compress', action='store_true',
+                        help="With --sorted-output and --format csv, write gzip-compressed files (.csv.gz)")
+    parser.add_argument('--write-buffers', type=int, default=DEFAULT_WRITE_BUFFERS,
+                        help="With --sorted-output, batches buffered for the background writer thread "
+                             "(0: write in the simulation thread)")
+    parser.add_argument('--aggregate', metavar='FILE',
+                        help="Aggregate-only mode: write per (sensor, radar) statistics to FILE (JSON) "
+                             "instead of PDW rows; sensor overlap rules are not applied")
+    parser.add_argument('--estimate', metavar='SECONDS', type=float, nargs='*', default=None,
+                        help="Dry run: print the expected pulse and PDW counts, output sizes and peak memory "
+                             "for simulation windows of the given lengths (default: scenario.time_step)")
+    parser.add_argument('--lookahead', type=float, default=DEFAULT_TOA_LOOKAHEAD,
+                        help="Bound on the TOA measurement error used by the sorted merge (seconds)")
+    parser.add_argument('--truth', action='store_true',
+                        help="With --sorted-output, also write truth_<sensor>.csv with every emitted pulse")
+    parser.add_argument('--cache', metavar='DIR',
+                        help="With --sorted-output, also store the true pulses at every sensor in DIR")
+    parser.add_argument('--remeasure', metavar='DIR',
+                        help="Rerun only detection and measurement on the true pulses cached in DIR, "
+                             "using the sensors of --config")
+    parser.add_argument('--checkpoint', metavar='FILE',
+                        help="With --sorted-output, periodically save the run state to FILE")
+    parser.add_argument('--checkpoint-interval', type=float, default=DEFAULT_CHECKPOINT_INTERVAL,
+                        help="Wall clock time between checkpoints (seconds)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue from --checkpoint (use the same --config and --seed)")
+    parser.add_argument('--shards', type=int, default=None,
+                        help="With --sorted-output or --aggregate, split the scenario time range into this many shards "
+                             "simulated in parallel processes")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of processes for --shards (default: number of CPUs)")
+    parser.add_argument('--keep-shards', action='store_true',
+                        help="Keep the per-shard tables in <sorted-output>/shards")
+    parser.add_argument('--serve', metavar='ADDRESS',
+                        help="Stream TOA-ordered PDW frames paced to the wall clock to one client on "
+                             "tcp://host:port or unix:///path")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="With --serve, scenario seconds per wall clock second (0: as fast as possible)")
+    parser.add_argument('--frame-interval', type=float, default=DEFAULT_FRAME_INTERVAL,
+                        help="With --serve, scenario time covered by one frame (seconds)")
+    parser.add_argument('--max-delay', type=float, default=None,
+                        help="With --serve, drop frames that are more than this behind schedule (seconds)")
+    parser.add_argument('--precision', choices=sorted(PRESETS),
+                        help="Precision preset for internal arrays and outputs (overrides scenario.precision)")
+    parser.add_argument('--backend', choices=['auto'] + list(BACKENDS), default=None,
+                        help="Kernel backend (default: PDW_SIM_BACKEND or auto, Numba when installed)")
+    parser.add_argument('--seed', type=int, default=None, help="Random seed")
+    return parser.parse_args(argv)
+
+def parse_batch_args(argv):
+    parser = argparse.ArgumentParser(prog='main.py batch', description="Run a queue of scenarios")
+    parser.add_argument('source', help="Directory of configuration files or batch manifest (YAML/JSON list)")
+    parser.add_argument('--output', default='batch_output', help="Output directory (one subdirectory per scenario)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: number of CPUs)")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv', help="Table format")
+    parser.add_argument('--compress', action='store_true', help="Write gzip-compressed CSV files")
+    parser.add_argument('--write-buffers', type=int, default=DEFAULT_WRITE_BUFFERS,
+                        help="Column buffers of the background writer (0: write in the simulation thread)")
+    parser.add_argument('--truth', action='store_true', help="Also write truth tables")
+    parser.add_argument('--lookahead', type=float, default=DEFAULT_TOA_LOOKAHEAD,
+                        help="Bound on the TOA measurement error in seconds")
+    parser.add_argument('--cache-entries', type=int, default=DEFAULT_SCHEDULE_CACHE_ENTRIES,
+                        help="Emitter schedules cached by every worker (0: no cache)")
+    parser.add_argument('--backend', choices=['auto'] + list(BACKENDS), default=None,
+                        help="Kernel backend of the workers")
+    parser.add_argument('--seed', type=int, default=None, help="Seed of the scenarios without their own")
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """
     Brief Explanation 
     
     """
-    config = load_config('config.yaml')
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == 'batch':
+        args = parse_batch_args(argv[1:])
+        run_batch(args.source, args.output, args.workers, args.seed, args.lookahead, args.truth, args.format,
+                  args.compress, args.write_buffers, args.backend, args.cache_entries)
+        return
+    args = parse_args(argv)
+    if args.backend:
+        set_backend(args.backend)
+    if args.seed is not None:
+        np.random.seed(args.seed)
+    config = load_config(args.config)
+    if args.precision:
+        config['scenario']['precision'] = args.precision
+
+    if args.estimate is not None:
+        print_estimate(estimate_scenario(config, args.estimate, write_buffers=args.write_buffers))
+        return
+
+    # Simulation runs log to output.txt; the estimate above and batch runs report on the console
+    sys.stdout=open('output.txt','wt')
+
+    if args.remeasure:
+        precision = PrecisionPolicy(config['scenario'].get('precision'))
+        sensors = [Sensor(sensor_config, precision) for sensor_config in config['sensors']]
+        output_dir = args.sorted_output or 'pdw_output'
+        rng = np.random.default_rng(args.seed)
+        run_remeasure(args.remeasure, sensors, output_dir, args.lookahead, rng, args.truth, precision, args.format,
+                      args.compress, args.write_buffers)
+        print(f"Remeasurement complete. TOA-sorted PDW data written to {output_dir}")
+        return
+
+    if args.aggregate:
+        if args.shards:
+            seed = args.seed if args.seed is not None else int(np.random.SeedSequence().generate_state(1)[0])
+            run_sharded_aggregate(config, args.shards, args.aggregate, seed, LocalProcessLauncher(args.workers),
+                                  args.keep_shards)
+        else:
+            scenario = create_scenario(config)
+            run_aggregate_simulation(scenario, args.aggregate, np.random.default_rng(args.seed))
+        print(f"Simulation complete. Statistics written to {args.aggregate}")
+        return
+
+    if args.serve:
+        scenario = create_scenario(config)
+        rng = np.random.default_rng(args.seed)
+        run_server(scenario, args.serve, args.speed, args.frame_interval, args.lookahead, rng, args.max_delay)
+        return
+
+    if args.sorted_output and args.shards:
+        if args.cache or args.checkpoint:
+            raise ValueError("--shards cannot be combined with --cache or --checkpoint")
+        seed = args.seed
+        if seed is None:
+            # Every shard must rebuild the same emission schedules
+            seed = int(np.random.SeedSequence().generate_state(1)[0])
+            print(f"Using random seed {seed} for all shards")
+        run_sharded_simulation(config, args.shards, args.sorted_output, seed, args.lookahead, args.truth,
+                               LocalProcessLauncher(args.workers), args.keep_shards, args.format, args.compress,
+                               args.write_buffers)
+        print(f"Simulation complete. TOA-sorted PDW data written to {args.sorted_output}")
+        return
+
+    if args.compress and args.checkpoint:
+        raise ValueError("--compress cannot be combined with --checkpoint (compressed files cannot be resumed)")
+
     scenario = create_scenario(config)
     
-    output_file = 'pdw_output.csv'
+    if args.sorted_output:
+        rng = np.random.default_rng(args.seed)
+        run_sorted_simulation(scenario, args.sorted_output, args.lookahead, rng, args.truth, args.cache,
+                              args.checkpoint, args.checkpoint_interval, args.resume, args.format, args.compress,
+                              args.write_buffers)
+        print(f"Simulation complete. TOA-sorted PDW data written to {args.sorted_output}")
+        return
+
+    output_file = args.output
     run_simulation(scenario, output_file)
     
     print(f"Simulation complete. PDW data written to {output_file}")
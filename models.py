@@ -1,13 +1,16 @@
 import numpy as np
-from scenario_geometry_functions import calculate_trajectory, get_unit_registry
+from scenario_geometry_functions import calculate_trajectory, create_trajectory, get_unit_registry
 from radar_properties import *
 from sensor_properties import *
+from precision import PrecisionPolicy
+from emitter_types import schedule_table
 
 class Scenario:
     def __init__(self, config):
         self.start_time = config['start_time'] * ureg.second
         self.end_time = config['end_time'] * ureg.second
         self.time_step = config['time_step'] * ureg.second
+        self.precision = PrecisionPolicy(config.get('precision'))
         self.current_time = self.start_time
         self.radars = []
         self.sensors = []
@@ -19,30 +22,75 @@ class Scenario:
         for sensor in self.sensors:
             sensor.update_position(self.current_time)
 
+    def time_windows(self):
+        """
+        Split the scenario time range into consecutive simulation windows.
+
+        :return: Generator of (window_start, window_end) pairs in seconds
+        """
+        start = self.start_time.to(ureg.second).magnitude
+        end = self.end_time.to(ureg.second).magnitude
+        step = self.time_step.to(ureg.second).magnitude
+        n_windows = int(np.ceil((end - start) / step - 1e-9))
+        for i in range(n_windows):
+            yield start + i * step, min(start + (i + 1) * step, end)
+
+    def set_time(self, current_time):
+        """
+        Move the scenario clock to a given time and update all positions.
+
+        :param current_time: New scenario time (seconds)
+        """
+        self.current_time = current_time * ureg.second
+        for radar in self.radars:
+            radar.update_position(self.current_time)
+        for sensor in self.sensors:
+            sensor.update_position(self.current_time)
+
 class Radar:
-    def __init__(self, config):
+    def __init__(self, config, precision=None, emitter_types=None):
+        self.emitter_type = None
+        if 'type' in config:
+            if config['type'] not in (emitter_types or {}):
+                raise ValueError(f"Unknown emitter type for {config['name']}: {config['type']}")
+            self.emitter_type = emitter_types[config['type']]
+            config = self.emitter_type.instance_config(config)
         self.name = config['name']
-        self.start_position = np.array(config['start_position']) * ureg.meter
+        self.precision = precision or PrecisionPolicy()
         self.velocity = np.array(config.get('velocity', [0, 0])) * ureg('meter/second')
         self.start_time = config.get('start_time', 0) * ureg.second
+        self.path = create_trajectory(config, self.start_time.magnitude)
+        self.has_waypoints = 'trajectory' in config
+        self.start_position = self.path.positions_at(self.start_time.magnitude) * ureg.meter
         self.current_time = self.start_time
         
         # Rotation period parameters
         self.rotation_type = config['rotation_type']
         self.rotation_params = config['rotation_params']
+        self.rotation_times = None
         self.rotation_data = None
         self.current_angle = self.rotation_params['alpha0']
         self.current_period = self.rotation_params['T_rot'] * ureg.second
         # self.frequency = config['frequency'] * ureg.hertz
         # self.pulse_width = config['pulse_width'] * ureg.second
         self.power = config['power'] * ureg.watt
+        self.trajectory_times = None
         self.trajectory = None
         self.current_position = self.start_position
 
         ## PRI 
         self.pri_type=config['pri_type']
         self.pri_params=config['pri_params']
+        # Pulse times are pulse_times[i] + time_offset; the offset is the start time
+        # for deterministic schedules, which are built from time 0 (and may be shared
+        # by the instances of an emitter type), and 0 for jittered ones.
+        # When only a time window of the schedules is built (time shards),
+        # pulse_times[0] is pulse number pulse_base and the frequency and pulse
+        # width tables hold one value per pulse of pulse_times.
         self.pulse_times=None
+        self.time_offset = 0.0
+        self.pulse_base = 0
+        self.pulse_count = 0
 
 
         ## Frequency 
@@ -70,9 +118,10 @@ class Radar:
         """
         if self.pulse_times is None:
             return None
-        next_pulse_index = np.searchsorted(self.pulse_times, current_time.magnitude, side='left')
-        if next_pulse_index < len(self.pulse_times):
-            return self.pulse_times[next_pulse_index] * ureg.second
+        next_pulse_index = self.pulse_base + np.searchsorted(self.pulse_times, current_time.magnitude - self.time_offset,
+                                                             side='left')
+        if next_pulse_index < self.pulse_count:
+            return self.emission_times(next_pulse_index) * ureg.second
         return None
 
     def get_current_frequency(self):
@@ -110,99 +159,239 @@ class Radar:
         else:
             raise ValueError(f"Unsupported lobe pattern type: {self.lobe_pattern_type}")
 
+    def gain_at(self, theta):
+        """
+        Antenna gain for an array of angles from the boresight.
+
+        :param theta: Array of angles from the boresight (radians)
+        :return: Array of gains (dB)
+        """
+        if self.lobe_pattern_type == 'Sinc':
+            return sinc_lobe_gain(theta, self.theta_ml.to(ureg.radian).magnitude,
+                                  self.P_ml.magnitude, self.P_bl.magnitude)
+        else:
+            raise ValueError(f"Unsupported lobe pattern type: {self.lobe_pattern_type}")
+
+    def antenna_angles_at(self, times):
+        """
+        Antenna pointing angle at arbitrary times.
+
+        :param times: Array of times (seconds)
+        :return: Array of antenna angles (radians)
+        """
+        return rotation_angle(times, self.rotation_type, self.rotation_params)
+
+    def pulse_indices(self, window_start, window_end):
+        """
+        Get the indices of the pulses emitted inside a time window.
+
+        :param window_start: Start of the window (seconds, inclusive)
+        :param window_end: End of the window (seconds, exclusive)
+        :return: Array of pulse indices
+        """
+        if self.pulse_times is None:
+            return np.empty(0, dtype=np.int64)
+        first, last = self.pulse_base + np.searchsorted(
+            self.pulse_times, [window_start - self.time_offset, window_end - self.time_offset], side='left')
+        return np.arange(min(first, self.pulse_count), min(last, self.pulse_count))
+
+    def emission_times(self, pulse_indices):
+        """
+        Get the emission times of the given pulses.
+
+        :param pulse_indices: Array of pulse indices
+        :return: Array of emission times (seconds)
+        """
+        return self.pulse_times[pulse_indices - self.pulse_base] + self.time_offset
+
+    def emission_state(self, current_time):
+        """
+        Emission cursor and pattern state at a given time.
+
+        :param current_time: Time (seconds)
+        :return: Dictionary with the index of the next pulse, the position inside the
+                 PRI pattern and the antenna angle
+        """
+        cursor = min(self.pulse_base + int(np.searchsorted(self.pulse_times, current_time - self.time_offset,
+                                                           side='left')), self.pulse_count)
+        if self.pri_type == 'stagger':
+            pattern_length = len(self.pri_params['pri_pattern'])
+        elif self.pri_type == 'switched':
+            pattern_length = int(sum(self.pri_params['repetitions']))
+        else:
+            pattern_length = 1
+        return {
+            'pulse_index': cursor,
+            'pattern_phase': cursor % pattern_length,
+            'antenna_angle': float(self.antenna_angles_at(current_time)),
+        }
+
+    def frequencies_at(self, pulse_indices):
+        """
+        Get the frequencies of the given pulses.
+
+        :param pulse_indices: Array of pulse indices
+        :return: Array of frequencies (Hz)
+        """
+        return np.take(self.frequencies, pulse_indices - self.pulse_base, mode='wrap')
+
+    def pulse_widths_at(self, pulse_indices):
+        """
+        Get the pulse widths of the given pulses.
+
+        :param pulse_indices: Array of pulse indices
+        :return: Array of pulse widths (seconds)
+        """
+        return np.take(self.pulse_widths, pulse_indices - self.pulse_base, mode='wrap')
+
     def get_current_angle(self):
         return self.current_angle * ureg.radian
 
     def get_current_period(self):
         return self.current_period
     
+    def shared_table(self, kind, end_time):
+        """
+        Read-only schedule of the radar's emitter type, if it shares one of this kind.
+
+        :param kind: 'pri', 'frequency' or 'pulse_width'
+        :param end_time: End time of the simulation
+        :return: Array relative to the start time, or None
+        """
+        if self.emitter_type is None or not self.emitter_type.shares(kind):
+            return None
+        self.emitter_type.add_instance(self.start_time.magnitude, end_time.magnitude)
+        return self.emitter_type.table(kind)
+
     def calculate_pulse_times(self, end_time):
-        if self.pri_type == 'fixed':
-            self.pulse_times = fixed_pri(self.start_time.magnitude, end_time.magnitude, self.pri_params['pri'])
-        elif self.pri_type == 'stagger':
-            self.pulse_times = stagger_pri(self.start_time.magnitude, end_time.magnitude, self.pri_params['pri_pattern'])
-        elif self.pri_type == 'switched':
-            self.pulse_times = switched_pri(self.start_time.magnitude, end_time.magnitude, 
-                                            self.pri_params['pri_pattern'], self.pri_params['repetitions'])
-        elif self.pri_type == 'jitter':
-            self.pulse_times = jitter_pri(self.start_time.magnitude, end_time.magnitude, 
-                                          self.pri_params['mean_pri'], self.pri_params['jitter_percentage'])
+        shared = self.shared_table('pri', end_time)
+        start, end, self.time_offset = self.schedule_span('pri', end_time)
+        if shared is not None:
+            self.pulse_times = shared
         else:
-            raise ValueError(f"Invalid PRI type: {self.pri_type}")
-        
+            self.pulse_times = schedule_table('pri', self.pri_type, self.pri_params, start, end, self.precision)
+        self.pulse_count = int(np.searchsorted(self.pulse_times, end_time.magnitude - self.time_offset, side='left'))
+
     def calculate_frequencies(self, end_time):
-            if self.frequency_type == 'fixed':
-                self.frequencies = fixed_frequency(self.start_time.magnitude, end_time.magnitude, self.frequency_params['frequency'])
-            elif self.frequency_type == 'stagger':
-                self.frequencies = stagger_frequency(self.start_time.magnitude, end_time.magnitude, self.frequency_params['frequency_pattern'])
-            elif self.frequency_type == 'switched':
-                self.frequencies = switched_frequency(self.start_time.magnitude, end_time.magnitude, 
-                                                    self.frequency_params['frequency_pattern'], self.frequency_params['repetitions'])
-            elif self.frequency_type == 'jitter':
-                self.frequencies = jitter_frequency(self.start_time.magnitude, end_time.magnitude, 
-                                                    self.frequency_params['mean_frequency'], self.frequency_params['jitter_percentage'])
-            else:
-                raise ValueError(f"Invalid frequency type: {self.frequency_type}")
+        shared = self.shared_table('frequency', end_time)
+        if shared is not None:
+            self.frequencies = shared
+            return
+        self.frequencies = schedule_table('frequency', self.frequency_type, self.frequency_params,
+                                          self.start_time.magnitude, end_time.magnitude, self.precision)
 
     def calculate_pulse_widths(self, end_time):
-        if self.pulse_width_type == 'fixed':
-            self.pulse_widths = fixed_pulse_width(self.start_time.magnitude, end_time.magnitude, self.pulse_width_params['pulse_width'])
-        elif self.pulse_width_type == 'stagger':
-            self.pulse_widths = stagger_pulse_width(self.start_time.magnitude, end_time.magnitude, self.pulse_width_params['pulse_width_pattern'])
-        elif self.pulse_width_type == 'switched':
-            self.pulse_widths = switched_pulse_width(self.start_time.magnitude, end_time.magnitude, 
-                                                     self.pulse_width_params['pulse_width_pattern'], self.pulse_width_params['repetitions'])
-        elif self.pulse_width_type == 'jitter':
-            self.pulse_widths = jitter_pulse_width(self.start_time.magnitude, end_time.magnitude, 
-                                                   self.pulse_width_params['mean_pulse_width'], self.pulse_width_params['jitter_percentage'])
-        else:
-            raise ValueError(f"Invalid pulse width type: {self.pulse_width_type}")
-        
-    def calculate_trajectory(self, end_time, time_step):
-        if np.any(self.velocity != 0):
+        shared = self.shared_table('pulse_width', end_time)
+        if shared is not None:
+            self.pulse_widths = shared
+            return
+        self.pulse_widths = schedule_table('pulse_width', self.pulse_width_type, self.pulse_width_params,
+                                           self.start_time.magnitude, end_time.magnitude, self.precision)
+
+    def schedule_span(self, kind, end_time):
+        """
+        Time range and offset of the radar's schedule of one kind.
+
+        :param kind: 'pri', 'frequency' or 'pulse_width'
+        :param end_time: End time of the simulation
+        :return: Tuple (start, end, offset) in seconds: the emitter type's range from 0 for
+                 shared schedules, the radar's range shifted to 0 for its own deterministic
+                 schedules (the same pulse times as a shared one), else the radar's own range
+                 with offset 0
+        """
+        if self.emitter_type is not None and self.emitter_type.shares(kind):
+            self.emitter_type.add_instance(self.start_time.magnitude, end_time.magnitude)
+            return 0.0, self.emitter_type.duration, self.start_time.magnitude
+        if getattr(self, f"{kind}_type") != 'jitter':
+            return 0.0, end_time.magnitude - self.start_time.magnitude, self.start_time.magnitude
+        return self.start_time.magnitude, end_time.magnitude, 0.0
+
+    def calculate_window(self, end_time, window):
+        """
+        Build only the pulses emitted in a time window, with the values and pulse
+        indices of the full schedules.
+
+        :param end_time: End time of the simulation
+        :param window: (start, end) of the window in seconds
+        """
+        start, end, self.time_offset = self.schedule_span('pri', end_time)
+        self.pulse_base, self.pulse_times = pulse_time_window(self.pri_type, self.pri_params, start, end,
+                                                              window[0] - self.time_offset,
+                                                              window[1] - self.time_offset)
+        self.pulse_count = self.pulse_base + int(np.searchsorted(self.pulse_times,
+                                                                 end_time.magnitude - self.time_offset, side='left'))
+        count = len(self.pulse_times)
+        start, end, _ = self.schedule_span('frequency', end_time)
+        self.frequencies = self.precision.array(table_window(
+            self.frequency_type, self.frequency_params, 'frequency', start, end, self.pulse_base, count),
+            'Frequency')
+        start, end, _ = self.schedule_span('pulse_width', end_time)
+        self.pulse_widths = self.precision.array(table_window(
+            self.pulse_width_type, self.pulse_width_params, 'pulse_width', start, end, self.pulse_base, count),
+            'PulseWidth')
+
+    def calculate_trajectory(self, end_time, time_step, window=None):
+        """
+        Build the trajectory, rotation and emission schedules up to end_time.
+
+        :param end_time: End time of the simulation
+        :param time_step: Time step of the trajectory and rotation tables
+        :param window: Optional (start, end) in seconds: only build the pulses emitted in it, and
+                       skip the per-step trajectory and rotation tables (pulse batches evaluate
+                       motion and rotation in closed form; only the legacy per-step path reads them)
+        """
+        if window is not None:
+            self.calculate_window(end_time, window)
+            print(f"Initialized {self.name} with pulses {self.pulse_base} to "
+                  f"{self.pulse_base + len(self.pulse_times)} of {window[0]} - {window[1]} s")
+            return
+        if self.has_waypoints:
+            self.trajectory = self.path.sample(end_time.magnitude, time_step.magnitude, self.start_time.magnitude)
+        elif np.any(self.velocity != 0):
             self.trajectory = calculate_trajectory(
                 self.start_position.magnitude, end_time.magnitude, time_step.magnitude,
                 self.velocity.magnitude, self.start_time.magnitude)
         else:
             self.trajectory = calculate_trajectory(
                 self.start_position.magnitude, end_time.magnitude, time_step.magnitude)
+        self.trajectory_times, self.trajectory = self.precision.time_table(self.trajectory, 'Position')
             
         self.calculate_pulse_times(end_time)
-        print(f"Initialized {self.name} with {len(self.pulse_times)} pulse times")
+        print(f"Initialized {self.name} with {self.pulse_count} pulse times")
         self.calculate_frequencies(end_time)
         self.calculate_pulse_widths(end_time)
         
         # Calculate rotation angles and periods
-        self.rotation_data = calculate_rotation_angles(
+        self.rotation_times, self.rotation_data = self.precision.time_table(calculate_rotation_angles(
             self.start_time.magnitude, end_time.magnitude, time_step.magnitude,
-            self.rotation_type, self.rotation_params)
+            self.rotation_type, self.rotation_params), 'Rotation')
 
     def update_position(self, current_time):
         if self.trajectory is not None:
-            idx = np.searchsorted([t[0] for t in self.trajectory], current_time.magnitude)
+            idx = np.searchsorted(self.trajectory_times, current_time.magnitude)
             if idx < len(self.trajectory):
-                self.current_position = np.array([self.trajectory[idx][1], self.trajectory[idx][2]]) * ureg.meter
+                self.current_position = np.array([self.trajectory[idx][0], self.trajectory[idx][1]]) * ureg.meter
         
         # Update rotation angle and period
         if self.rotation_data is not None:
-            idx = np.searchsorted([t[0] for t in self.rotation_data], current_time.magnitude)
+            idx = np.searchsorted(self.rotation_times, current_time.magnitude)
             if idx < len(self.rotation_data):
-                self.current_angle = self.rotation_data[idx][1]
-                self.current_period = self.rotation_data[idx][2] * ureg.second
+                self.current_angle = self.rotation_data[idx][0]
+                self.current_period = self.rotation_data[idx][1] * ureg.second
 
 
     def get_current_angle(self):
         if self.rotation_data is not None:
-            idx = np.searchsorted([t[0] for t in self.rotation_data], self.current_time.magnitude)
+            idx = np.searchsorted(self.rotation_times, self.current_time.magnitude)
             if idx < len(self.rotation_data):
-                return self.rotation_data[idx][1] * ureg.radian
+                return self.rotation_data[idx][0] * ureg.radian
         return 0 * ureg.radian
 
     def get_current_period(self):
         if self.rotation_data is not None:
-            idx = np.searchsorted([t[0] for t in self.rotation_data], self.current_time.magnitude)
+            idx = np.searchsorted(self.rotation_times, self.current_time.magnitude)
             if idx < len(self.rotation_data):
-                return self.rotation_data[idx][2] * ureg.second
+                return self.rotation_data[idx][1] * ureg.second
         return self.rotation_params['T_rot'] * ureg.second
     
     def update(self, current_time):
@@ -212,16 +401,16 @@ class Radar:
 
     def update_position(self, current_time):
         if self.trajectory is not None:
-            idx = np.searchsorted([t[0] for t in self.trajectory], current_time.magnitude)
+            idx = np.searchsorted(self.trajectory_times, current_time.magnitude)
             if idx < len(self.trajectory):
-                self.current_position = np.array([self.trajectory[idx][1], self.trajectory[idx][2]]) * ureg.meter
+                self.current_position = np.array([self.trajectory[idx][0], self.trajectory[idx][1]]) * ureg.meter
 
     def update_rotation(self, current_time):
         if self.rotation_data is not None:
-            idx = np.searchsorted([t[0] for t in self.rotation_data], current_time.magnitude)
+            idx = np.searchsorted(self.rotation_times, current_time.magnitude)
             if idx < len(self.rotation_data):
-                self.current_angle = self.rotation_data[idx][1]
-                self.current_period = self.rotation_data[idx][2] * ureg.second
+                self.current_angle = self.rotation_data[idx][0]
+                self.current_period = self.rotation_data[idx][1] * ureg.second
 
     def get_current_angle(self):
         return self.current_angle * ureg.radian
@@ -232,11 +421,15 @@ class Radar:
 
 
 class Sensor:
-    def __init__(self, config):
+    def __init__(self, config, precision=None):
         self.name = config['name']
-        self.start_position = np.array(config['start_position']) * ureg.meter
+        self.precision = precision or PrecisionPolicy()
         self.velocity = np.array(config.get('velocity', [0, 0])) * ureg('meter/second')
         self.start_time = config.get('start_time', 0) * ureg.second
+        self.path = create_trajectory(config, self.start_time.magnitude)
+        self.has_waypoints = 'trajectory' in config
+        self.start_position = self.path.positions_at(self.start_time.magnitude) * ureg.meter
+        self.trajectory_times = None
         self.trajectory = None
         self.current_position = self.start_position
         self.current_time = self.start_time
@@ -250,6 +443,13 @@ class Sensor:
         # self.detection_probabilities = np.array(config['detection_probability']['probability']) / 100
         self.detection_levels = [level * ureg.dB for level in config['detection_probability']['level']]
         self.detection_probabilities = [prob / 100 for prob in config['detection_probability']['probability']]
+        self.detection_interpolation = config['detection_probability'].get('interpolation', 'step')
+        if self.detection_interpolation not in DETECTION_INTERPOLATIONS:
+            raise ValueError(f"Invalid detection interpolation: {self.detection_interpolation}. "
+                             f"Must be one of {DETECTION_INTERPOLATIONS}.")
+        self.detection_thresholds, self.detection_steps = compile_detection_curve(
+            [level.to('dB').magnitude for level in self.detection_levels], self.detection_probabilities)
+        self.saturation_db = self.saturation_level.to('dB').magnitude
 
         # Error models
         self.amplitude_error_syst = create_error_model(config['amplitude_error']['systematic'])
@@ -263,8 +463,28 @@ class Sensor:
         self.aoa_error_syst = create_error_model(config['aoa_error']['systematic'])
         self.aoa_error_arb = create_error_model(config['aoa_error']['arbitrary'])
 
-    def detect_pulse(self, amplitude):
-        return detect_pulse(amplitude, self.detection_levels, self.detection_probabilities, self.saturation_level)
+        # Receiver overlap handling (optional)
+        overlap_config = config.get('overlap')
+        self.overlap_rule = None
+        self.dead_time = 0.0
+        if overlap_config:
+            self.overlap_rule = overlap_config['rule']
+            value, unit = parse_value_and_unit(overlap_config.get('dead_time', '0 s'))
+            self.dead_time = (value * ureg(unit)).to(ureg.second).magnitude
+
+    def detect_pulse(self, amplitude, rng=np.random):
+        return bool(self.detect_pulses(np.atleast_1d(amplitude.to('dB').magnitude), rng)[0])
+
+    def detect_pulses(self, amplitudes, rng=np.random):
+        """
+        Detection decision for a batch of pulses.
+
+        :param amplitudes: Array of received amplitudes (dB)
+        :param rng: Random generator used for the detection draws
+        :return: Boolean array, True for detected pulses
+        """
+        return detect_pulses(amplitudes, self.detection_thresholds, self.detection_steps, self.saturation_db,
+                             rng.random(len(amplitudes)), self.detection_interpolation)
 
     def measure_amplitude(self, true_amplitude, r, P_theta, t, P0):
         return measure_amplitude(true_amplitude, r, P_theta, t, P0, self.amplitude_error_syst, self.amplitude_error_arb)
@@ -281,18 +501,38 @@ class Sensor:
     def measure_aoa(self, true_aoa, t):
         return measure_aoa(true_aoa, t, self.aoa_error_syst, self.aoa_error_arb)
 
-    def calculate_trajectory(self, end_time, time_step):
-        if np.any(self.velocity != 0):
+    def measure_batch(self, true_amplitude, true_toa, true_frequency, true_pw, true_aoa, rng=np.random):
+        """
+        Apply the sensor error models to a batch of detected pulses.
+
+        Systematic errors are evaluated at each pulse's true TOA.
+
+        :return: Tuple of measured (amplitude dB, TOA s, frequency Hz, pulse width s, AOA deg) arrays
+        """
+        return (measure_amplitudes(true_amplitude, true_toa, self.amplitude_error_syst, self.amplitude_error_arb, rng),
+                measure_toas(true_toa, self.toa_error_syst, self.toa_error_arb, rng),
+                measure_frequencies(true_frequency, true_toa, self.frequency_error_syst, self.frequency_error_arb, rng),
+                measure_pulse_widths(true_pw, true_toa, self.pw_error_syst, self.pw_error_arb, rng),
+                measure_aoas(true_aoa, true_toa, self.aoa_error_syst, self.aoa_error_arb, rng))
+
+    def calculate_trajectory(self, end_time, time_step, window=None):
+        if window is not None:
+            # Time shards only simulate pulse batches, which evaluate the path in closed form
+            return
+        if self.has_waypoints:
+            self.trajectory = self.path.sample(end_time.magnitude, time_step.magnitude, self.start_time.magnitude)
+        elif np.any(self.velocity != 0):
             self.trajectory = calculate_trajectory(
                 self.start_position.magnitude, end_time.magnitude, time_step.magnitude,
                 self.velocity.magnitude, self.start_time.magnitude)
         else:
             self.trajectory = calculate_trajectory(
                 self.start_position.magnitude, end_time.magnitude, time_step.magnitude)
+        self.trajectory_times, self.trajectory = self.precision.time_table(self.trajectory, 'Position')
 
     def update_position(self, current_time):
         self.current_time = current_time
         if self.trajectory is not None:
-            idx = np.searchsorted([t[0] for t in self.trajectory], current_time.magnitude)
+            idx = np.searchsorted(self.trajectory_times, current_time.magnitude)
             if idx < len(self.trajectory):
-                self.current_position = np.array([self.trajectory[idx][1], self.trajectory[idx][2]]) * ureg.meter
+                self.current_position = np.array([self.trajectory[idx][0], self.trajectory[idx][1]]) * ureg.meter
@@ -0,0 +1,194 @@
+import numpy as np
+from scenario_geometry_functions import get_unit_registry
+
+ureg = get_unit_registry()
+
+SPEED_OF_LIGHT = 299792458.0  # m/s
+
+# Columns of a measured PDW batch, in output order. (SensorID, RadarID, PulseIndex)
+# identifies the emitted pulse and joins a PDW to its truth row.
+PDW_COLUMNS = ['SensorID', 'RadarID', 'PulseIndex', 'TOA', 'Amplitude', 'Frequency', 'PulseWidth', 'AOA']
+
+# Columns of a truth batch: true parameters of every emitted pulse at a sensor,
+# detected or not. Detected: the pulse passed the detection draw. Delivered: a
+# PDW with its RadarID and PulseIndex is in the output, i.e. it also survived
+# the sensor's overlap rule. OverlapGroup: number of the overlap group of the
+# pulse (-1 when the sensor has no overlap rule or the pulse was not detected);
+# the pulses merged into a PDW share the group of the delivered pulse.
+TRUTH_COLUMNS = ['SensorID', 'RadarID', 'PulseIndex', 'EmissionTime', 'TOA', 'Amplitude',
+                 'Frequency', 'PulseWidth', 'AOA', 'Detected', 'Delivered', 'OverlapGroup']
+
+
+########## Column batches ############
+# A batch is a dictionary of equally long NumPy arrays, one per column.
+
+def batch_length(batch):
+    """
+    Number of rows in a batch.
+
+    :param batch: Dictionary of column arrays
+    :return: Row count
+    """
+    return len(next(iter(batch.values()))) if batch else 0
+
+def empty_batch(columns):
+    """
+    Create a batch without rows.
+
+    :param columns: Column names
+    :return: Dictionary of empty column arrays
+    """
+    return {name: np.empty(0) for name in columns}
+
+def take_batch(batch, index):
+    """
+    Select rows of a batch.
+
+    :param batch: Dictionary of column arrays
+    :param index: Slice, integer index array or boolean mask
+    :return: New batch with the selected rows
+    """
+    return {name: column[index] for name, column in batch.items()}
+
+def concat_batches(batches):
+    """
+    Concatenate batches with the same columns.
+
+    :param batches: List of batches
+    :return: Single batch
+    """
+    batches = [b for b in batches if batch_length(b)]
+    if not batches:
+        return None
+    if len(batches) == 1:
+        return batches[0]
+    return {name: np.concatenate([b[name] for b in batches]) for name in batches[0]}
+
+def sort_batch(batch, key='TOA'):
+    """
+    Sort the rows of a batch by one column (stable).
+
+    :param batch: Dictionary of column arrays
+    :param key: Column to sort on
+    :return: Sorted batch
+    """
+    order = np.argsort(batch[key], kind='stable')
+    return take_batch(batch, order)
+
+
+########## Pulse generation ############
+
+def wrap_angle(angle):
+    """
+    Wrap angles to [-pi, pi).
+
+    :param angle: Array of angles (radians)
+    :return: Wrapped angles (radians)
+    """
+    return (angle + np.pi) % (2 * np.pi) - np.pi
+
+def true_pulse_batch(sensor, radar, window_start, window_end):
+    """
+    True parameters at a sensor of every pulse a radar emits inside a time window.
+
+    Radar and sensor positions and the antenna angle are evaluated at each
+    pulse's emission time.
+
+    :param sensor: Sensor object
+    :param radar: Radar object
+    :param window_start: Start of the window (seconds, inclusive)
+    :param window_end: End of the window (seconds, exclusive)
+    :return: Dictionary of column arrays, or None if no pulse is emitted in the window
+    """
+    pulse_index = radar.pulse_indices(window_start, window_end)
+    if pulse_index.size == 0:
+        return None
+    emission_time = radar.emission_times(pulse_index)
+
+    distance_vector = sensor.path.positions_at(emission_time) - radar.path.positions_at(emission_time)
+    distance = np.hypot(distance_vector[:, 0], distance_vector[:, 1])
+    bearing = np.arctan2(distance_vector[:, 1], distance_vector[:, 0])  # radar -> sensor
+
+    theta = wrap_angle(bearing - radar.antenna_angles_at(emission_time))
+    # Received amplitude: omnidirectional power - spreading loss + antenna gain
+    with np.errstate(divide='ignore'):
+        amplitude = (10 * np.log10(radar.power.to(ureg.watt).magnitude)
+                     - 20 * np.log10(distance) + radar.gain_at(theta))
+
+    return radar.precision.cast({
+        'PulseIndex': pulse_index,
+        'EmissionTime': emission_time,
+        'TOA': emission_time + distance / SPEED_OF_LIGHT,
+        'Amplitude': amplitude,
+        'Frequency': radar.frequencies_at(pulse_index),
+        'PulseWidth': radar.pulse_widths_at(pulse_index),
+        'AOA': wrap_angle(bearing + np.pi),  # sensor -> radar
+    })
+
+def measure_pulse_batch(sensor, radar_name, true_batch, rng=np.random):
+    """
+    Detect and measure a batch of true pulses at a sensor.
+
+    Only needs the sensor's detection and error models, so it can run on true
+    pulses loaded from a cache as well as on freshly emitted ones.
+
+    :param sensor: Sensor object
+    :param radar_name: Name of the radar the pulses come from
+    :param true_batch: Batch returned by true_pulse_batch
+    :param rng: Random generator used for detection and measurement errors
+    :return: Tuple (PDW batch with PDW_COLUMNS, truth batch with TRUTH_COLUMNS)
+    """
+    detected = sensor.detect_pulses(true_batch['Amplitude'], rng)
+    true = take_batch(true_batch, detected)
+    n = len(true['TOA'])
+    amplitude, toa, frequency, pw, aoa = sensor.measure_batch(
+        true['Amplitude'], true['TOA'], true['Frequency'], true['PulseWidth'], true['AOA'], rng)
+    pdw_batch = sensor.precision.cast({
+        'SensorID': np.full(n, sensor.name),
+        'RadarID': np.full(n, radar_name),
+        'PulseIndex': true['PulseIndex'],
+        'TOA': toa,
+        'Amplitude': amplitude,
+        'Frequency': frequency,
+        'PulseWidth': pw,
+        'AOA': aoa,
+    })
+    return pdw_batch, truth_batch(sensor, radar_name, true_batch, detected)
+
+def truth_batch(sensor, radar_name, true_batch, detected):
+    """
+    Truth rows for a batch of true pulses, sharing the arrays of the true batch.
+
+    :param sensor: Sensor object
+    :param radar_name: Name of the radar the pulses come from
+    :param true_batch: Batch returned by true_pulse_batch
+    :param detected: Boolean detection flags of the pulses
+    :return: Truth batch with TRUTH_COLUMNS, every detected pulse marked as delivered
+             (overlap rules are applied later, see pulse_overlap.TruthJoiner)
+    """
+    n = len(detected)
+    truth = dict(true_batch)
+    truth['SensorID'] = np.full(n, sensor.name)
+    truth['RadarID'] = np.full(n, radar_name)
+    truth['AOA'] = np.degrees(true_batch['AOA'])
+    truth['Detected'] = detected
+    truth['Delivered'] = detected
+    truth['OverlapGroup'] = np.full(n, -1, dtype=np.int64)
+    return sensor.precision.cast(truth)
+
+def generate_pdw_batch(sensor, radar, window_start, window_end, rng=np.random):
+    """
+    Vectorized counterpart of generate_pdw: all PDWs a sensor measures from one
+    radar inside a time window.
+
+    :param sensor: Sensor object
+    :param radar: Radar object
+    :param window_start: Start of the window (seconds, inclusive)
+    :param window_end: End of the window (seconds, exclusive)
+    :param rng: Random generator used for detection and measurement errors
+    :return: Tuple (PDW batch, truth batch), or (None, None) if no pulse is emitted in the window
+    """
+    true_batch = true_pulse_batch(sensor, radar, window_start, window_end)
+    if true_batch is None:
+        return None, None
+    return measure_pulse_batch(sensor, radar.name, true_batch, rng)
@@ -0,0 +1,282 @@
+import csv
+import gzip
+import json
+import os
+import numpy as np
+from pdw_batch import batch_length, concat_batches, take_batch
+from pdw_io import decode_categories, load_columns, truncate_to
+from precision import TICKS_PER_SECOND
+
+OUTPUT_FORMATS = ('csv', 'columnar')
+
+# Scenario time covered by one block of the sidecar index (seconds)
+DEFAULT_INDEX_BLOCK = 1.0
+
+# One entry per (sensor file, time block): the rows [row_start, row_stop) and, for
+# CSV files, the bytes [byte_start, byte_stop) holding the block, and its TOA range
+# in seconds
+INDEX_DTYPE = np.dtype([
+    ('block', '<i8'), ('row_start', '<i8'), ('row_stop', '<i8'), ('byte_start', '<i8'), ('byte_stop', '<i8'),
+    ('toa_min', '<f8'), ('toa_max', '<f8'),
+])
+
+DATASET_FILE = 'dataset.json'
+
+
+def output_columns(columns, precision):
+    """
+    Output column names and dtypes of a table written under a precision policy.
+
+    :param columns: Column names (PDW_COLUMNS or TRUTH_COLUMNS)
+    :param precision: PrecisionPolicy
+    :return: Dictionary of output column name -> dtype string ('category' for strings)
+    """
+    dtypes = {'SensorID': 'category', 'RadarID': 'category', 'PulseIndex': 'int64', 'Detected': 'bool',
+              'Delivered': 'bool', 'OverlapGroup': 'int64'}
+    return {precision.output_name(name): dtypes.get(name)
+            or ('int64' if precision.fields[name] == 'int64_ps' else precision.dtype(name).name)
+            for name in columns}
+
+
+class IndexedSink:
+    """
+    Wraps a CsvSink or ColumnarSink of TOA-sorted rows and records a sidecar index
+    of time blocks while writing. Every block of a compressed CSV file is its own
+    gzip member, so the byte range of an entry can be decompressed on its own.
+
+    Only the entry of the current block is kept in memory: closed entries are
+    appended to a raw <index_filename>.part file, which close() converts into
+    the .npy index. A checkpoint position therefore holds the number of closed
+    entries and the open one, whatever the length of the run; resuming
+    truncates the closed entries to that number.
+    """
+
+    def __init__(self, sink, index_filename, toa_column='TOA', toa_scale=1, block_duration=DEFAULT_INDEX_BLOCK,
+                 resume=None):
+        """
+        :param sink: CsvSink or ColumnarSink receiving the rows
+        :param index_filename: File receiving the index (.npy)
+        :param toa_column: Name of the TOA column in the written batches
+        :param toa_scale: TOA column units per second (TICKS_PER_SECOND for picosecond ticks)
+        :param block_duration: Scenario time covered by one index block (seconds)
+        :param resume: Optional index position returned by tell(); the closed entries are truncated there
+        """
+        self.sink = sink
+        self.index_filename = index_filename
+        self.toa_column = toa_column
+        self.toa_scale = toa_scale
+        self.block_duration = block_duration
+        self.part_filename = index_filename + '.part'
+        self.closed = resume['closed'] if resume else 0
+        self.entry = list(resume['open']) if resume and resume['open'] else None
+        if resume is None:
+            self.part = open(self.part_filename, 'wb')
+        elif os.path.exists(self.part_filename):
+            self.part = open(self.part_filename, 'r+b')
+            truncate_to(self.part, self.closed * INDEX_DTYPE.itemsize)
+        else:
+            # The interrupted run was closed cleanly: its .npy index starts with the closed entries
+            entries = np.load(index_filename)
+            if len(entries) < self.closed:
+                raise ValueError(f"{index_filename} is shorter than the resume position "
+                                 f"({len(entries)} < {self.closed} entries)")
+            self.part = open(self.part_filename, 'wb')
+            self.part.write(entries[:self.closed].tobytes())
+
+    @property
+    def rows(self):
+        return self.sink.rows
+
+    @property
+    def filename(self):
+        return getattr(self.sink, 'filename', None) or self.sink.directory
+
+    def position(self):
+        return getattr(self.sink, 'bytes', 0)
+
+    def close_entry(self):
+        if self.entry is not None:
+            if hasattr(self.sink, 'end_member'):
+                self.entry[4] = self.sink.end_member()
+            self.part.write(np.array([tuple(self.entry)], dtype=INDEX_DTYPE).tobytes())
+            self.closed += 1
+            self.entry = None
+
+    def write(self, batch):
+        """
+        Append the rows of a TOA-sorted batch, splitting it at block boundaries.
+
+        :param batch: Dictionary of column arrays
+        """
+        n = batch_length(batch)
+        if n == 0:
+            return
+        toa = batch[self.toa_column] / self.toa_scale
+        block = np.floor(toa / self.block_duration).astype(np.int64)
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(block)) + 1, [n]))
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            toa_min, toa_max = float(toa[lo:hi].min()), float(toa[lo:hi].max())
+            if self.entry is not None and self.entry[0] == block[lo]:
+                self.sink.write(take_batch(batch, slice(lo, hi)))
+                self.entry[2], self.entry[4] = self.rows, self.position()
+                self.entry[5], self.entry[6] = min(self.entry[5], toa_min), max(self.entry[6], toa_max)
+            else:
+                # Closing the previous entry ends its gzip member before the new block is written
+                self.close_entry()
+                row_start, byte_start = self.rows, self.position()
+                self.sink.write(take_batch(batch, slice(lo, hi)))
+                self.entry = [int(block[lo]), row_start, self.rows, byte_start, self.position(), toa_min, toa_max]
+
+    def tell(self):
+        self.part.flush()
+        return {'sink': self.sink.tell(), 'index': {'closed': self.closed, 'open': self.entry}}
+
+    def close(self):
+        if self.entry is not None and hasattr(self.sink, 'end_member'):
+            self.entry[4] = self.sink.end_member()
+        self.sink.close()
+        self.part.close()
+        entries = np.fromfile(self.part_filename, dtype=INDEX_DTYPE)
+        if self.entry is not None:
+            entries = np.concatenate((entries, np.array([tuple(self.entry)], dtype=INDEX_DTYPE)))
+        np.save(self.index_filename, entries)
+        os.remove(self.part_filename)
+
+
+def write_dataset_metadata(output_dir, output_format, columns, tables, block_duration, precision):
+    """
+    Write dataset.json describing the PDW tables of a sorted run for PdwDataset.
+
+    :param output_dir: Output directory
+    :param output_format: 'csv' or 'columnar'
+    :param columns: Dictionary of output column name -> dtype string
+    :param tables: Dictionary of sensor name -> (table path, index path, rows), relative to output_dir
+    :param block_duration: Scenario time covered by one index block (seconds)
+    :param precision: PrecisionPolicy of the output
+    """
+    toa_column = precision.output_name('TOA')
+    metadata = {
+        'format': output_format,
+        'columns': columns,
+        'toa_column': toa_column,
+        'toa_scale': TICKS_PER_SECOND if toa_column != 'TOA' else 1,
+        'block_duration': block_duration,
+        'sensors': {name: {'path': path, 'index': index, 'rows': rows} for name, (path, index, rows) in tables.items()},
+    }
+    with open(os.path.join(output_dir, DATASET_FILE), 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+
+class PdwDataset:
+    """
+    Reader for the TOA-sorted PDW tables of a sorted run.
+
+    Queries use the sidecar index to read only the time blocks they need:
+    columnar tables are memory-mapped, CSV files are read from the byte range
+    of the selected blocks (whole gzip members for .csv.gz files).
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: Output directory of a sorted run (containing dataset.json)
+        """
+        self.directory = directory
+        with open(os.path.join(directory, DATASET_FILE)) as f:
+            self.metadata = json.load(f)
+        self.format = self.metadata['format']
+        self.columns = self.metadata['columns']
+        self.toa_column = self.metadata['toa_column']
+        self.toa_scale = self.metadata['toa_scale']
+        self.tables = {}
+        self.indexes = {}
+
+    @property
+    def sensors(self):
+        return list(self.metadata['sensors'])
+
+    def path(self, sensor, key):
+        return os.path.join(self.directory, self.metadata['sensors'][sensor][key])
+
+    def index(self, sensor):
+        """
+        :param sensor: Sensor name
+        :return: Index array of INDEX_DTYPE
+        """
+        if sensor not in self.indexes:
+            self.indexes[sensor] = np.load(self.path(sensor, 'index'), mmap_mode='r')
+        return self.indexes[sensor]
+
+    def blocks(self, sensor, toa=None):
+        """
+        Range of index entries overlapping a TOA interval.
+
+        :param sensor: Sensor name
+        :param toa: Optional (t0, t1) interval in seconds, t1 exclusive
+        :return: Tuple (first, stop) of entry indices
+        """
+        index = self.index(sensor)
+        if toa is None:
+            return 0, len(index)
+        t0, t1 = toa
+        first = np.searchsorted(index['toa_max'], t0, side='left')
+        stop = np.searchsorted(index['toa_min'], t1, side='left')
+        return int(first), int(max(stop, first))
+
+    def query(self, sensor=None, toa=None, columns=None):
+        """
+        Read the PDWs of one or more sensors inside a TOA interval.
+
+        :param sensor: Sensor name, list of names, or None for all sensors
+        :param toa: Optional (t0, t1) interval in seconds, t1 exclusive
+        :param columns: Optional list of output columns to return
+        :return: Dictionary of column arrays, sensors one after the other, each in TOA order
+        """
+        sensors = [sensor] if isinstance(sensor, str) else list(sensor or self.sensors)
+        columns = list(columns or self.columns)
+        batches = [self.query_sensor(name, toa, columns) for name in sensors]
+        batch = concat_batches(batches)
+        if batch is None:
+            return {name: np.empty(0, dtype='U' if self.columns[name] == 'category' else self.columns[name])
+                    for name in columns}
+        return batch
+
+    def query_sensor(self, sensor, toa, columns):
+        if sensor not in self.metadata['sensors']:
+            raise ValueError(f"Unknown sensor: {sensor}. The dataset contains {self.sensors}.")
+        first, stop = self.blocks(sensor, toa)
+        if first == stop:
+            return None
+        index = self.index(sensor)
+        read_columns = columns if self.toa_column in columns else columns + [self.toa_column]
+        if self.format == 'columnar':
+            batch = self.read_columnar(sensor, index['row_start'][first], index['row_stop'][stop - 1], read_columns)
+        else:
+            batch = self.read_csv(sensor, index['byte_start'][first], index['byte_stop'][stop - 1], read_columns)
+        if toa is not None:
+            lo, hi = np.searchsorted(batch[self.toa_column], [toa[0] * self.toa_scale, toa[1] * self.toa_scale],
+                                     side='left')
+            batch = take_batch(batch, slice(lo, hi))
+        return {name: batch[name] for name in columns}
+
+    def read_columnar(self, sensor, row_start, row_stop, columns):
+        if sensor not in self.tables:
+            self.tables[sensor] = load_columns(self.path(sensor, 'path'))
+        table, schema = self.tables[sensor]
+        batch = {}
+        for name in columns:
+            values = np.asarray(table[name][row_start:row_stop])
+            batch[name] = decode_categories(schema, name, values) if name in schema['categories'] else values
+        return batch
+
+    def read_csv(self, sensor, byte_start, byte_stop, columns):
+        path = self.path(sensor, 'path')
+        with open(path, 'rb') as f:
+            f.seek(byte_start)
+            data = f.read(byte_stop - byte_start)
+        # In .csv.gz files every block is a gzip member of its own
+        text = (gzip.decompress(data) if path.endswith('.gz') else data).decode()
+        rows = np.array(list(csv.reader(text.splitlines())), dtype=str).reshape(-1, len(self.columns))
+        positions = {name: i for i, name in enumerate(self.columns)}
+        return {name: rows[:, positions[name]] if self.columns[name] == 'category'
+                else rows[:, positions[name]].astype(self.columns[name])
+                for name in columns}
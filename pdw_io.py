@@ -0,0 +1,453 @@
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+import numpy as np
+from pdw_batch import batch_length
+
+# zlib compression level of gzip-compressed CSV output (1 fastest, 9 smallest)
+GZIP_LEVEL = 6
+
+# Default number of preallocated column buffers of a BackgroundWriter; the
+# producer blocks once all of them hold batches that are not written yet
+DEFAULT_WRITE_BUFFERS = 8
+
+# Initial rows per column buffer (buffers grow to the largest batch seen)
+DEFAULT_BUFFER_ROWS = 4096
+
+
+def format_column(column):
+    """
+    Convert a column array to a list of strings for text output.
+
+    Floats use the shortest representation that round-trips in their own dtype,
+    for float64 the same as the f-string formatting in run_simulation.
+
+    :param column: Column array
+    :return: List of strings
+    """
+    if column.dtype == np.float32:
+        return column.astype(str).tolist()
+    return [str(value) for value in column.tolist()]
+
+
+class CsvSink:
+    """
+    Streaming CSV writer for column batches.
+
+    A compressed file is a sequence of gzip members (a valid .gz file).
+    end_member closes the current one, so the data from a member boundary on can be
+    decompressed without reading what comes before it.
+    """
+
+    def __init__(self, filename, columns, resume=None, compress=False):
+        """
+        :param filename: Output CSV file
+        :param columns: Columns to write, in order
+        :param resume: Optional position returned by tell(); the file is truncated there
+                       and writing continues from it
+        :param compress: Write a gzip-compressed file (cannot be resumed)
+        """
+        if compress and resume is not None:
+            raise ValueError("Compressed CSV output cannot be resumed")
+        self.filename = filename
+        self.columns = list(columns)
+        self.rows = 0
+        self.raw = None
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if compress:
+            # bytes is the offset of the last member boundary in the compressed file
+            self.raw = open(filename, 'wb')
+            self.file = self.open_member()
+            self.file.write((','.join(self.columns) + '\n').encode())
+            self.end_member()
+        elif resume is None:
+            header = ','.join(self.columns) + '\n'
+            self.file = open(filename, 'w')
+            self.file.write(header)
+            self.bytes = len(header)
+        else:
+            self.file = open(filename, 'r+')
+            truncate_to(self.file, resume['bytes'])
+            self.rows = resume['rows']
+            self.bytes = resume['bytes']
+
+    def write(self, batch):
+        """
+        Append the rows of a batch.
+
+        :param batch: Dictionary of column arrays containing at least self.columns
+        """
+        if batch is None or batch_length(batch) == 0:
+            return
+        rows = zip(*(format_column(batch[name]) for name in self.columns))
+        text = ''.join(','.join(row) + '\n' for row in rows)
+        if self.raw is not None:
+            if self.file is None:
+                self.file = self.open_member()
+            self.file.write(text.encode())
+        else:
+            self.file.write(text)
+            # The output is ASCII, so characters are bytes
+            self.bytes += len(text)
+        self.rows += batch_length(batch)
+
+    def open_member(self):
+        return gzip.GzipFile(filename='', mode='wb', compresslevel=GZIP_LEVEL, fileobj=self.raw)
+
+    def end_member(self):
+        """
+        End the current gzip member of a compressed file; the next write starts a new one.
+
+        :return: Byte offset of the member boundary (the current offset for uncompressed files)
+        """
+        if self.raw is not None and self.file is not None:
+            self.file.close()
+            self.bytes = self.raw.tell()
+            # The next member starts with the next write, so the file does not end with an empty one
+            self.file = None
+        return self.bytes
+
+    def tell(self):
+        """
+        Flush and return the current position, for resuming with CsvSink(resume=...).
+
+        :return: Dictionary with byte offset and row count
+        """
+        self.file.flush()
+        return {'bytes': self.file.tell(), 'rows': self.rows}
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        if self.raw is not None:
+            self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ColumnarSink:
+    """
+    Streaming writer of column batches to raw binary files, one file per column.
+
+    Every column is appended to <directory>/<name>.bin in a fixed dtype, so a
+    finished table can be memory-mapped with load_columns. String columns use
+    dtype 'category' and are stored as int32 codes into a list of categories.
+    The schema (dtypes, categories, row count and free-form metadata) is written
+    to <directory>/schema.json on close.
+    """
+
+    def __init__(self, directory, columns, metadata=None, resume=None):
+        """
+        :param directory: Output directory
+        :param columns: Dictionary of column name -> dtype string ('category' for strings)
+        :param metadata: Optional JSON-serializable dictionary stored in the schema
+        :param resume: Optional position returned by tell(); the column files are
+                       truncated there and writing continues from it
+        """
+        self.directory = directory
+        self.columns = dict(columns)
+        self.metadata = metadata or {}
+        self.categories = {name: [] for name, dtype in self.columns.items() if dtype == 'category'}
+        self.rows = 0
+        os.makedirs(directory, exist_ok=True)
+        if resume is None:
+            self.files = {name: open(os.path.join(directory, f"{name}.bin"), 'wb') for name in self.columns}
+        else:
+            self.rows = resume['rows']
+            self.categories = {name: list(values) for name, values in resume['categories'].items()}
+            self.files = {name: open(os.path.join(directory, f"{name}.bin"), 'r+b') for name in self.columns}
+            for name, f in self.files.items():
+                truncate_to(f, self.rows * self.itemsize(name))
+
+    def itemsize(self, name):
+        dtype = self.columns[name]
+        return np.dtype('int32' if dtype == 'category' else dtype).itemsize
+
+    def encode(self, name, column):
+        """
+        Convert string values to category codes, extending the category list.
+
+        :param name: Column name
+        :param column: Array of strings
+        :return: Array of int32 codes
+        """
+        categories = self.categories[name]
+        values, inverse = np.unique(column, return_inverse=True)
+        lookup = {category: code for code, category in enumerate(categories)}
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values.tolist()):
+            if value not in lookup:
+                lookup[value] = len(categories)
+                categories.append(value)
+            codes[i] = lookup[value]
+        return codes[inverse]
+
+    def write(self, batch):
+        """
+        Append the rows of a batch.
+
+        :param batch: Dictionary of column arrays containing at least self.columns
+        """
+        if batch is None or batch_length(batch) == 0:
+            return
+        for name, dtype in self.columns.items():
+            column = batch[name]
+            if dtype == 'category':
+                column = self.encode(name, column)
+            else:
+                column = np.asarray(column, dtype=dtype)
+            self.files[name].write(column.tobytes())
+        self.rows += batch_length(batch)
+
+    def tell(self):
+        """
+        Flush and return the current position, for resuming with ColumnarSink(resume=...).
+
+        :return: Dictionary with row count and categories
+        """
+        for f in self.files.values():
+            f.flush()
+        return {'rows': self.rows, 'categories': {name: list(values) for name, values in self.categories.items()}}
+
+    def schema(self):
+        return {
+            'rows': self.rows,
+            'columns': {name: 'int32' if dtype == 'category' else np.dtype(dtype).str
+                        for name, dtype in self.columns.items()},
+            'categories': self.categories,
+            'metadata': self.metadata,
+        }
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        with open(os.path.join(self.directory, 'schema.json'), 'w') as f:
+            json.dump(self.schema(), f, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BackgroundWriter:
+    """
+    Writes column batches to sinks in a dedicated thread.
+
+    The producer appends every batch to a preallocated column buffer of its
+    sink; full buffers go to the writer thread, which serializes (and
+    compresses) them while the simulation goes on, and then returns them for
+    reuse, so writing allocates no new batch arrays. The small batches of the
+    sorted merge are coalesced into buffer_rows rows per write. When all
+    buffers are in use the producer waits: producer_wait growing means the
+    run is I/O-bound, writer_wait growing means it is compute-bound.
+    """
+
+    def __init__(self, buffers=DEFAULT_WRITE_BUFFERS, buffer_rows=DEFAULT_BUFFER_ROWS):
+        """
+        :param buffers: Number of column buffers
+        :param buffer_rows: Rows per column buffer (buffers grow for larger batches)
+        """
+        self.buffer_rows = buffer_rows
+        self.free = queue.Queue()
+        for _ in range(max(buffers, 1)):
+            self.free.put({})
+        self.pending = queue.Queue()
+        # Buffer being filled per sink: sink -> [buffer, rows]
+        self.filling = {}
+        self.error = None
+        self.batches = 0
+        self.writes = 0
+        self.rows = 0
+        self.producer_wait = 0.0
+        self.writer_wait = 0.0
+        self.write_time = 0.0
+        self.thread = threading.Thread(target=self.run, name='pdw-writer', daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def fits(array, column):
+        # Shorter strings fit into a wider string buffer; other columns keep their exact dtype
+        if array.dtype.kind == 'U' and column.dtype.kind == 'U':
+            return array.dtype.itemsize >= column.dtype.itemsize
+        return array.dtype == column.dtype
+
+    def room(self, entry, batch, n):
+        buffer, rows = entry
+        return (buffer.keys() == batch.keys() and all(rows + n <= len(array) for array in buffer.values())
+                and all(self.fits(buffer[name], column) for name, column in batch.items()))
+
+    def acquire(self):
+        if self.free.empty() and self.filling:
+            # Every buffer is being filled: hand over the fullest so the writer can return one
+            self.submit(max(self.filling, key=lambda sink: self.filling[sink][1]))
+        start = time.perf_counter()
+        buffer = self.free.get()
+        self.producer_wait += time.perf_counter() - start
+        return buffer
+
+    def submit(self, sink):
+        buffer, rows = self.filling.pop(sink)
+        self.pending.put((sink, buffer, rows))
+        self.writes += 1
+
+    def write(self, sink, batch):
+        """
+        Queue a batch for writing to a sink.
+
+        :param sink: Object with a write(batch) method, only used by the writer thread from now on
+        :param batch: Dictionary of column arrays (copied, so it may be reused by the caller)
+        """
+        self.check()
+        n = batch_length(batch)
+        if n == 0:
+            return
+        batch = {name: np.asarray(column) for name, column in batch.items()}
+        entry = self.filling.get(sink)
+        if entry is not None and not self.room(entry, batch, n):
+            self.submit(sink)
+            entry = None
+        if entry is None:
+            buffer = self.acquire()
+            for name in list(buffer):
+                if name not in batch:
+                    del buffer[name]
+            capacity = max(n, self.buffer_rows)
+            for name, column in batch.items():
+                array = buffer.get(name)
+                if array is None or len(array) < capacity or not self.fits(array, column):
+                    buffer[name] = np.empty(capacity, dtype=column.dtype)
+            entry = self.filling[sink] = [buffer, 0]
+        buffer, rows = entry
+        for name, column in batch.items():
+            buffer[name][rows:rows + n] = column
+        entry[1] = rows + n
+        self.batches += 1
+        self.rows += n
+        if entry[1] >= self.buffer_rows:
+            self.submit(sink)
+
+    def run(self):
+        while True:
+            start = time.perf_counter()
+            item = self.pending.get()
+            self.writer_wait += time.perf_counter() - start
+            if item is None:
+                self.pending.task_done()
+                return
+            sink, buffer, rows = item
+            start = time.perf_counter()
+            try:
+                if self.error is None:
+                    sink.write({name: array[:rows] for name, array in buffer.items()})
+            except BaseException as error:
+                self.error = error
+            self.write_time += time.perf_counter() - start
+            self.free.put(buffer)
+            self.pending.task_done()
+
+    def check(self):
+        if self.error is not None:
+            raise RuntimeError("Background writer failed") from self.error
+
+    def flush(self):
+        """
+        Wait until every queued batch is written.
+        """
+        for sink in list(self.filling):
+            self.submit(sink)
+        self.pending.join()
+        self.check()
+
+    def close(self):
+        """
+        Write the remaining batches and stop the writer thread.
+        """
+        if self.thread.is_alive():
+            self.flush()
+            self.pending.put(None)
+            self.thread.join()
+        self.check()
+
+    def stats(self):
+        """
+        :return: Dictionary of counters
+        """
+        return {'batches': self.batches, 'writes': self.writes, 'rows': self.rows,
+                'producer_wait': self.producer_wait, 'writer_wait': self.writer_wait, 'write_time': self.write_time}
+
+    def describe(self):
+        # The side that waited longer is the faster one: a simulation waiting for
+        # buffers is held back by the writer, a writer waiting for batches by the simulation
+        bound = 'I/O-bound' if self.producer_wait > self.writer_wait else 'compute-bound'
+        return (f"{self.batches} batches, {self.rows} rows in {self.writes} writes; writing {self.write_time:.2f} s, "
+                f"producer waited {self.producer_wait:.2f} s for buffers, "
+                f"writer waited {self.writer_wait:.2f} s for batches ({bound})")
+
+
+def truncate_to(file, size):
+    """
+    Truncate an open file to a resume position and move to its end.
+
+    :param file: File opened for update
+    :param size: Size in bytes
+    """
+    file.seek(0, os.SEEK_END)
+    if file.tell() < size:
+        raise ValueError(f"{file.name} is shorter than the resume position ({file.tell()} < {size} bytes)")
+    file.truncate(size)
+    file.seek(size)
+
+def read_schema(directory):
+    """
+    Read the schema of a table written by ColumnarSink.
+
+    :param directory: Table directory
+    :return: Schema dictionary
+    """
+    with open(os.path.join(directory, 'schema.json')) as f:
+        return json.load(f)
+
+def load_columns(directory, mmap_mode='r'):
+    """
+    Memory-map the columns of a table written by ColumnarSink.
+
+    Category columns are returned as int32 codes, see decode_categories.
+
+    :param directory: Table directory
+    :param mmap_mode: Mode passed to np.memmap, None to read into memory
+    :return: Tuple (dictionary of column arrays, schema)
+    """
+    schema = read_schema(directory)
+    rows = schema['rows']
+    columns = {}
+    for name, dtype in schema['columns'].items():
+        filename = os.path.join(directory, f"{name}.bin")
+        if rows == 0:
+            columns[name] = np.empty(0, dtype=dtype)
+        elif mmap_mode is None:
+            columns[name] = np.fromfile(filename, dtype=dtype, count=rows)
+        else:
+            columns[name] = np.memmap(filename, dtype=dtype, mode=mmap_mode, shape=(rows,))
+    return columns, schema
+
+def decode_categories(schema, name, codes):
+    """
+    Convert category codes back to strings.
+
+    :param schema: Table schema
+    :param name: Column name
+    :param codes: Array of codes
+    :return: Array of strings
+    """
+    return np.array(schema['categories'][name])[codes]
@@ -0,0 +1,153 @@
+import asyncio
+import copy
+import threading
+import numpy as np
+from models import Scenario
+from pdw_stream import DEFAULT_BATCH_SIZE, DEFAULT_TOA_LOOKAHEAD, iter_pdw_batches
+
+# Default number of batches the asyncio producer may run ahead of the consumer
+DEFAULT_MAX_PENDING = 4
+
+
+async def aiter_pdw_batches(scenario, batch_size=DEFAULT_BATCH_SIZE, max_pending=DEFAULT_MAX_PENDING,
+                            lookahead=DEFAULT_TOA_LOOKAHEAD, rng=None, columns=None):
+    """
+    Asyncio variant of pdw_stream.iter_pdw_batches.
+
+    The simulation runs in a worker thread and hands batches over through a
+    bounded queue: the producer pauses once max_pending batches are waiting, so
+    a slow consumer bounds the memory use. Leaving the loop early stops the
+    producer.
+
+    :param scenario: Scenario object containing radars and sensors
+    :param batch_size: PDWs per batch
+    :param max_pending: Maximum number of batches produced ahead of the consumer
+    :param lookahead: Bound on the TOA measurement error (seconds)
+    :param rng: Random generator used for detection and measurement errors
+    :param columns: Optional list of columns to keep
+    :return: Async generator of dictionaries of NumPy arrays
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=max_pending)
+    stop = threading.Event()
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce():
+        try:
+            for batch in iter_pdw_batches(scenario, batch_size, lookahead, rng, columns):
+                if stop.is_set():
+                    return
+                put(batch)
+        finally:
+            if not stop.is_set():
+                put(None)
+
+    producer = loop.run_in_executor(None, produce)
+    try:
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                break
+            yield batch
+        await producer
+    finally:
+        stop.set()
+        while not producer.done():
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.wait([producer], timeout=0.01)
+
+
+def get_worker_info():
+    """
+    Worker information of a PyTorch DataLoader worker process (optional dependency).
+
+    :return: torch.utils.data.get_worker_info(), or None outside a worker or without PyTorch
+    """
+    try:
+        from torch.utils.data import get_worker_info
+    except ImportError:
+        return None
+    return get_worker_info()
+
+
+try:
+    from torch.utils.data import IterableDataset as _IterableDataset
+except ImportError:
+    _IterableDataset = object
+
+
+class PdwIterableDataset(_IterableDataset):
+    """
+    Iterable over simulated PDW batches for PyTorch-style data loaders.
+
+    A torch.utils.data.IterableDataset when PyTorch is installed (a plain
+    iterable otherwise). Every iteration builds the scenario from the
+    configuration. The DataLoader workers share the emission schedules and
+    split the simulation windows into contiguous time shards (as in
+    sharding.py), so together they yield every PDW of the scenario once; each
+    worker measures its shard with its own seed. With a fixed seed the worker
+    seeds are derived from (seed, worker id), otherwise from the DataLoader's
+    base seed. Overlap groups that straddle a shard boundary are resolved by
+    each worker separately. Use it with DataLoader(dataset, batch_size=None,
+    num_workers=...) since it yields ready-made batches.
+    """
+
+    def __init__(self, config, batch_size=DEFAULT_BATCH_SIZE, seed=None, lookahead=DEFAULT_TOA_LOOKAHEAD,
+                 columns=None):
+        """
+        :param config: Configuration dictionary (as loaded from the YAML file)
+        :param batch_size: PDWs per batch
+        :param seed: Optional base seed
+        :param lookahead: Bound on the TOA measurement error (seconds)
+        :param columns: Optional list of columns to keep, e.g. only the numeric ones for tensors
+        """
+        self.config = config
+        self.batch_size = batch_size
+        self.seed = seed
+        self.lookahead = lookahead
+        self.columns = columns
+
+    def worker_seeds(self):
+        """
+        :return: Tuple (schedule seed shared by all workers, measurement SeedSequence of the current worker)
+        """
+        worker = get_worker_info()
+        worker_id = worker.id if worker is not None else 0
+        if self.seed is not None:
+            base = self.seed
+        elif worker is not None:
+            # DataLoader worker seeds are base_seed + worker id
+            base = worker.seed - worker.id
+        else:
+            base = int(np.random.SeedSequence().generate_state(1)[0])
+        return np.random.SeedSequence(base).generate_state(1)[0], np.random.SeedSequence([base, worker_id])
+
+    def worker_windows(self, n_windows):
+        """
+        :param n_windows: Number of simulation windows of the scenario
+        :return: Tuple (first_window, stop_window) of the current worker's time shard
+        """
+        worker = get_worker_info()
+        if worker is None:
+            return 0, n_windows
+        bounds = np.linspace(0, n_windows, worker.num_workers + 1).round().astype(int)
+        return int(bounds[worker.id]), int(bounds[worker.id + 1])
+
+    def __iter__(self):
+        from main import create_scenario
+
+        schedule_seed, measurement_seed = self.worker_seeds()
+        windows = list(Scenario(self.config['scenario']).time_windows())
+        first_window, stop_window = self.worker_windows(len(windows))
+        if first_window == stop_window:
+            return iter(())
+        shard = (windows[first_window][0] - self.lookahead, windows[stop_window - 1][1] + self.lookahead)
+        # Jittered emission schedules are drawn from the global NumPy generator
+        np.random.seed(schedule_seed)
+        scenario = create_scenario(copy.deepcopy(self.config), shard)
+        rng = np.random.default_rng(measurement_seed)
+        return iter_pdw_batches(scenario, self.batch_size, self.lookahead, rng, self.columns, first_window,
+                                stop_window)
@@ -0,0 +1,394 @@
+import json
+import math
+import os
+import queue
+import socket
+import stat
+import struct
+import threading
+import time
+import numpy as np
+from pdw_batch import batch_length, concat_batches, sort_batch, take_batch
+from pdw_stream import DEFAULT_TOA_LOOKAHEAD, MeasurementStage, iter_true_pulses
+
+# Wire format (little endian):
+#   metadata message:  b'PDWM', uint32 length, JSON with sensor/radar names and the record layout
+#   PDW frame:         b'PDWF', uint32 sequence, uint32 count, float64 frame time (scenario seconds),
+#                      followed by count records of RECORD_DTYPE (RECORD_DTYPE.itemsize bytes each)
+# The stream ends when the server closes the connection.
+METADATA_MAGIC = b'PDWM'
+FRAME_MAGIC = b'PDWF'
+METADATA_HEADER = struct.Struct('<4sI')
+FRAME_HEADER = struct.Struct('<4sIId')
+
+RECORD_DTYPE = np.dtype([
+    ('SensorID', '<u2'), ('RadarID', '<u2'), ('PulseIndex', '<i8'), ('TOA', '<f8'),
+    ('Amplitude', '<f4'), ('Frequency', '<f8'), ('PulseWidth', '<f4'), ('AOA', '<f4'),
+])
+
+# Scenario time covered by one frame (seconds)
+DEFAULT_FRAME_INTERVAL = 1e-3
+
+# Frames sent later than this after their scheduled time count as late (seconds)
+DEFAULT_LATE_THRESHOLD = 1e-3
+
+# Frames the simulation thread may run ahead of the publisher
+DEFAULT_PREFETCH = 256
+
+
+def parse_address(address):
+    """
+    Parse a socket address.
+
+    :param address: 'tcp://host:port' or 'unix:///path/to/socket'
+    :return: Tuple (address family, socket address)
+    """
+    if address.startswith('unix://'):
+        return socket.AF_UNIX, address[len('unix://'):]
+    if address.startswith('tcp://'):
+        host, port = address[len('tcp://'):].rsplit(':', 1)
+        return socket.AF_INET, (host, int(port))
+    raise ValueError(f"Invalid address: {address}. Use tcp://host:port or unix:///path")
+
+
+def iter_frames(scenario, frame_interval=DEFAULT_FRAME_INTERVAL, lookahead=DEFAULT_TOA_LOOKAHEAD, rng=np.random):
+    """
+    Simulate the scenario and cut the TOA-ordered PDWs of all sensors into frames.
+
+    Frame i holds the PDWs with TOA in [start + i * frame_interval, start + (i + 1) * frame_interval).
+    A frame is only emitted once no later window can add PDWs to it, neither through
+    the TOA lookahead nor through an overlap group the sensors still hold back
+    (a merged PDW gets the TOA of the group's first pulse); empty frames are skipped.
+
+    :param scenario: Scenario object containing radars and sensors
+    :param frame_interval: Scenario time covered by one frame (seconds)
+    :param lookahead: Bound on the TOA measurement error (seconds)
+    :param rng: Random generator used for detection and measurement errors
+    :return: Generator of (frame end time, batch) pairs
+    """
+    start = scenario.start_time.magnitude
+    stage = MeasurementStage(scenario.sensors, [radar.name for radar in scenario.radars],
+                             scenario.end_time.magnitude, lookahead, rng)
+    pending = None
+    for window_start, window_end, batches in iter_true_pulses(scenario):
+        released = [batch for _, batch in stage.process_window(window_start, window_end, batches)]
+        batch = concat_batches([pending] + released)
+        if batch is None:
+            continue
+        batch = sort_batch(batch)
+        if window_end >= scenario.end_time.magnitude:
+            complete = batch_length(batch)
+        else:
+            horizon = min(window_end - lookahead, stage.held_toa())
+            complete_until = start + math.floor((horizon - start) / frame_interval) * frame_interval
+            complete = np.searchsorted(batch['TOA'], complete_until, side='left')
+        pending = take_batch(batch, slice(complete, None)) if complete < batch_length(batch) else None
+        if complete == 0:
+            continue
+        ready = take_batch(batch, slice(0, complete))
+        frame = np.floor((ready['TOA'] - start) / frame_interval).astype(np.int64)
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(frame)) + 1, [complete]))
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            yield start + (frame[lo] + 1) * frame_interval, take_batch(ready, slice(lo, hi))
+
+
+class FrameEncoder:
+    """
+    Packs PDW batches into the binary wire format.
+    """
+
+    def __init__(self, sensor_names, radar_names):
+        """
+        :param sensor_names: Sensor names; SensorID is sent as an index into this list
+        :param radar_names: Radar names; RadarID is sent as an index into this list
+        """
+        self.sensor_names = list(sensor_names)
+        self.radar_names = list(radar_names)
+        self.lookups = {name: (np.array(sorted(names)), np.argsort(names).astype(np.uint16))
+                        for name, names in (('SensorID', self.sensor_names), ('RadarID', self.radar_names))}
+
+    def metadata(self):
+        payload = json.dumps({
+            'sensors': self.sensor_names,
+            'radars': self.radar_names,
+            'record': [[name, RECORD_DTYPE[name].str] for name in RECORD_DTYPE.names],
+        }).encode()
+        return METADATA_HEADER.pack(METADATA_MAGIC, len(payload)) + payload
+
+    def records(self, batch):
+        """
+        :param batch: PDW batch
+        :return: Structured array of RECORD_DTYPE
+        """
+        records = np.empty(batch_length(batch), dtype=RECORD_DTYPE)
+        for name in RECORD_DTYPE.names:
+            if name in self.lookups:
+                names, codes = self.lookups[name]
+                records[name] = codes[np.searchsorted(names, batch[name])]
+            else:
+                records[name] = batch[name]
+        return records
+
+    def header(self, sequence, frame_time, count):
+        return FRAME_HEADER.pack(FRAME_MAGIC, sequence, count, frame_time)
+
+
+class PacingStats:
+    """
+    Latency between the scheduled and the actual send time of every frame.
+    """
+
+    def __init__(self, late_threshold=DEFAULT_LATE_THRESHOLD):
+        """
+        :param late_threshold: Latency above which a frame counts as late (seconds)
+        """
+        self.late_threshold = late_threshold
+        self.frames = 0
+        self.pdws = 0
+        self.late = 0
+        self.dropped = 0
+        self.disconnected = False
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.max_latency = 0.0
+
+    def add(self, latency, count):
+        """
+        Record one sent frame (Welford's running mean and variance).
+
+        :param latency: Actual minus scheduled send time (seconds)
+        :param count: PDWs in the frame
+        """
+        self.frames += 1
+        self.pdws += count
+        delta = latency - self.mean
+        self.mean += delta / self.frames
+        self.m2 += delta * (latency - self.mean)
+        self.max_latency = max(self.max_latency, latency)
+        if latency > self.late_threshold:
+            self.late += 1
+
+    def drop(self):
+        self.dropped += 1
+
+    def report(self):
+        """
+        :return: Dictionary with frame and PDW counts, late and dropped frames, whether the
+                 client disconnected early, and the mean, jitter (standard deviation) and
+                 maximum of the latency in seconds
+        """
+        return {
+            'frames': self.frames,
+            'pdws': self.pdws,
+            'late': self.late,
+            'dropped': self.dropped,
+            'disconnected': self.disconnected,
+            'latency_mean': self.mean,
+            'latency_jitter': math.sqrt(self.m2 / self.frames) if self.frames else 0.0,
+            'latency_max': self.max_latency,
+        }
+
+
+def publish_frames(connection, frames, encoder, start_time, speed=1.0, max_delay=None,
+                   late_threshold=DEFAULT_LATE_THRESHOLD):
+    """
+    Send frames paced to the wall clock.
+
+    Frame time t is due at wall time t0 + (t - start_time) / speed, where t0 is
+    the time the first frame is available. Frames more than max_delay behind
+    schedule are dropped instead of sent. Sending stops when the client disconnects.
+
+    :param connection: Connected socket
+    :param frames: Iterable of (frame time, batch) pairs in time order
+    :param encoder: FrameEncoder
+    :param start_time: Scenario time mapped to t0 (seconds)
+    :param speed: Scenario seconds per wall clock second, 0 to send as fast as possible
+    :param max_delay: Optional latency above which frames are dropped (seconds)
+    :param late_threshold: Latency above which a frame counts as late (seconds)
+    :return: PacingStats
+    """
+    stats = PacingStats(late_threshold)
+    t0 = None
+    try:
+        connection.sendall(encoder.metadata())
+        for sequence, (frame_time, batch) in enumerate(frames):
+            if t0 is None:
+                t0 = time.perf_counter()
+            due = t0 + (frame_time - start_time) / speed if speed else time.perf_counter()
+            wait = due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            latency = time.perf_counter() - due
+            if max_delay is not None and latency > max_delay:
+                stats.drop()
+                continue
+            records = encoder.records(batch)
+            connection.sendall(encoder.header(sequence, frame_time, len(records)))
+            connection.sendall(records)
+            stats.add(latency, len(records))
+    except (BrokenPipeError, ConnectionResetError):
+        stats.disconnected = True
+    return stats
+
+
+def prefetch(frames, size=DEFAULT_PREFETCH):
+    """
+    Produce frames in a background thread, at most size frames ahead of the consumer.
+
+    Frames are handed out as soon as they are produced; the buffer fills in the
+    background whenever the producer is faster than the consumer.
+
+    :param frames: Iterable of frames
+    :param size: Maximum number of buffered frames
+    :return: Generator with the same items as frames
+    """
+    buffer = queue.Queue(maxsize=size)
+    stop = threading.Event()
+    end = object()
+    errors = []
+
+    def produce():
+        try:
+            for frame in frames:
+                while not stop.is_set():
+                    try:
+                        buffer.put(frame, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if stop.is_set():
+                    return
+        except Exception as error:
+            errors.append(error)
+        finally:
+            buffer.put(end)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            frame = buffer.get()
+            if frame is end:
+                break
+            yield frame
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+        while thread.is_alive():
+            try:
+                buffer.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def run_server(scenario, address, speed=1.0, frame_interval=DEFAULT_FRAME_INTERVAL,
+               lookahead=DEFAULT_TOA_LOOKAHEAD, rng=np.random, max_delay=None,
+               late_threshold=DEFAULT_LATE_THRESHOLD):
+    """
+    Serve the simulated PDWs of a scenario to one client, paced to the wall clock.
+
+    :param scenario: Scenario object containing radars and sensors
+    :param address: 'tcp://host:port' or 'unix:///path/to/socket'
+    :param speed: Scenario seconds per wall clock second, 0 to send as fast as possible
+    :param frame_interval: Scenario time covered by one frame (seconds)
+    :param lookahead: Bound on the TOA measurement error (seconds)
+    :param rng: Random generator used for detection and measurement errors
+    :param max_delay: Optional latency above which frames are dropped (seconds)
+    :param late_threshold: Latency above which a frame counts as late (seconds)
+    :return: Dictionary from PacingStats.report
+    """
+    family, socket_address = parse_address(address)
+    if family == socket.AF_UNIX and os.path.exists(socket_address):
+        # Only replace a stale socket of an earlier run, never another file
+        if not stat.S_ISSOCK(os.stat(socket_address).st_mode):
+            raise ValueError(f"{socket_address} exists and is not a socket")
+        os.remove(socket_address)
+    encoder = FrameEncoder([sensor.name for sensor in scenario.sensors], [radar.name for radar in scenario.radars])
+    with socket.socket(family, socket.SOCK_STREAM) as server:
+        if family == socket.AF_INET:
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(socket_address)
+        server.listen(1)
+        print(f"Waiting for a client on {address}")
+        connection, peer = server.accept()
+        with connection:
+            print(f"Client connected{f' from {peer}' if peer else ''}, streaming at speed {speed}")
+            frames = prefetch(iter_frames(scenario, frame_interval, lookahead, rng))
+            try:
+                stats = publish_frames(connection, frames, encoder, scenario.start_time.magnitude, speed,
+                                       max_delay, late_threshold)
+            finally:
+                frames.close()
+    if family == socket.AF_UNIX:
+        os.remove(socket_address)
+    report = stats.report()
+    if report['disconnected']:
+        print("Client disconnected, stopped streaming")
+    print(f"Sent {report['pdws']} PDWs in {report['frames']} frames: {report['late']} late, "
+          f"{report['dropped']} dropped, latency mean {report['latency_mean'] * 1e3:.3f} ms, "
+          f"jitter {report['latency_jitter'] * 1e3:.3f} ms, max {report['latency_max'] * 1e3:.3f} ms")
+    return report
+
+
+class PdwClient:
+    """
+    Reader for the stream of run_server.
+    """
+
+    def __init__(self, address, timeout=None):
+        """
+        :param address: 'tcp://host:port' or 'unix:///path/to/socket'
+        :param timeout: Optional socket timeout (seconds)
+        """
+        family, socket_address = parse_address(address)
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(socket_address)
+        magic, length = METADATA_HEADER.unpack(self.receive(METADATA_HEADER.size))
+        if magic != METADATA_MAGIC:
+            raise ValueError(f"Unexpected message {magic!r}, expected PDW stream metadata")
+        self.metadata = json.loads(self.receive(length))
+        self.dtype = np.dtype([(name, dtype) for name, dtype in self.metadata['record']])
+        self.sensor_names = np.array(self.metadata['sensors'])
+        self.radar_names = np.array(self.metadata['radars'])
+
+    def receive(self, size):
+        """
+        :param size: Number of bytes
+        :return: Exactly size bytes, or None at the end of the stream
+        """
+        data = bytearray(size)
+        view = memoryview(data)
+        received = 0
+        while received < size:
+            n = self.socket.recv_into(view[received:])
+            if n == 0:
+                if received == 0:
+                    return None
+                raise ConnectionError("PDW stream ended inside a message")
+            received += n
+        return data
+
+    def __iter__(self):
+        """
+        :return: Generator of (sequence, frame time, records) with records a structured
+                 array whose SensorID/RadarID fields index sensor_names/radar_names
+        """
+        while True:
+            header = self.receive(FRAME_HEADER.size)
+            if header is None:
+                return
+            magic, sequence, count, frame_time = FRAME_HEADER.unpack(header)
+            if magic != FRAME_MAGIC:
+                raise ValueError(f"Unexpected message {magic!r}, expected a PDW frame")
+            yield sequence, frame_time, np.frombuffer(self.receive(count * self.dtype.itemsize), dtype=self.dtype)
+
+    def close(self):
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
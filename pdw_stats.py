@@ -0,0 +1,420 @@
+import json
+import numpy as np
+from pdw_stream import iter_true_pulses
+from pdw_batch import measure_pulse_batch
+
+# Fixed histogram ranges (lo, hi, number of bins)
+AMPLITUDE_BINS = (-160.0, 0.0, 160)   # dB, 1 dB bins
+AOA_ERROR_BINS = (-10.0, 10.0, 200)   # degrees, 0.1 degree bins
+
+# Number of values per level of a quantile sketch; the rank error is of the
+# order of log2(n / capacity) / capacity
+DEFAULT_SKETCH_CAPACITY = 1024
+
+# Quantiles reported in the summary
+SUMMARY_QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+# Maximum number of bins of the PDW rate over time (the bin width is at least the time step)
+MAX_RATE_BINS = 1000
+
+
+class RunningMoments:
+    """
+    Count, mean, variance, minimum and maximum of a stream of values.
+
+    Batches are combined with the parallel form of Welford's algorithm, which
+    also merges the moments of independent workers.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def combine(self, count, mean, m2, minimum, maximum):
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+        self.min = min(self.min, minimum)
+        self.max = max(self.max, maximum)
+
+    def update(self, values):
+        """
+        :param values: Array of values (non-finite values are ignored)
+        """
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if values.size == 0:
+            return
+        mean = values.mean()
+        self.combine(values.size, mean, float(np.sum((values - mean) ** 2)), values.min(), values.max())
+
+    def merge(self, other):
+        self.combine(other.count, other.mean, other.m2, other.min, other.max)
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.mean if self.count else None,
+            'std': float(np.sqrt(self.m2 / self.count)) if self.count else None,
+            'min': float(self.min) if self.count else None,
+            'max': float(self.max) if self.count else None,
+        }
+
+    def get_state(self):
+        return [self.count, self.mean, self.m2, float(self.min), float(self.max)]
+
+    def set_state(self, state):
+        self.count, self.mean, self.m2, self.min, self.max = state
+
+
+class FixedHistogram:
+    """
+    Histogram over fixed, equally wide bins, with underflow and overflow counts.
+    """
+
+    def __init__(self, lo, hi, bins):
+        """
+        :param lo: Lower edge of the first bin
+        :param hi: Upper edge of the last bin
+        :param bins: Number of bins
+        """
+        self.lo = lo
+        self.hi = hi
+        self.bins = bins
+        self.counts = np.zeros(bins + 2, dtype=np.int64)  # underflow, bins..., overflow
+
+    def update(self, values):
+        """
+        :param values: Array of values (non-finite values are ignored)
+        """
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        index = np.floor((values - self.lo) * (self.bins / (self.hi - self.lo)))
+        index = np.clip(index, -1, self.bins).astype(np.int64) + 1
+        self.counts += np.bincount(index, minlength=self.bins + 2)
+
+    def merge(self, other):
+        if (other.lo, other.hi, other.bins) != (self.lo, self.hi, self.bins):
+            raise ValueError("Cannot merge histograms with different bins")
+        self.counts += other.counts
+
+    def summary(self):
+        return {
+            'lo': self.lo,
+            'hi': self.hi,
+            'bins': self.bins,
+            'counts': self.counts[1:-1].tolist(),
+            'underflow': int(self.counts[0]),
+            'overflow': int(self.counts[-1]),
+        }
+
+    def get_state(self):
+        return self.counts.tolist()
+
+    def set_state(self, state):
+        self.counts = np.array(state, dtype=np.int64)
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch (compactor levels as in the KLL sketch).
+
+    Level i holds values of weight 2**i. A level that grows beyond the capacity
+    is sorted and every other value is promoted to the next level, so the
+    memory stays at about capacity values per level while the total weight is
+    preserved exactly.
+    """
+
+    def __init__(self, capacity=DEFAULT_SKETCH_CAPACITY):
+        """
+        :param capacity: Number of values a level holds before it is compacted
+        """
+        self.capacity = capacity
+        self.count = 0
+        self.compactions = 0
+        self.levels = [np.empty(0)]
+
+    def update(self, values):
+        """
+        :param values: Array of values (non-finite values are ignored)
+        """
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        self.count += values.size
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self.compress()
+
+    def compress(self):
+        level = 0
+        while level < len(self.levels):
+            values = self.levels[level]
+            if values.size > self.capacity:
+                values = np.sort(values)
+                # An odd value out stays on this level; alternate the offset between compactions
+                keep, values = values[values.size - values.size % 2:], values[:values.size - values.size % 2]
+                promoted = values[self.compactions % 2::2]
+                self.compactions += 1
+                self.levels[level] = keep
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[level + 1] = np.concatenate((self.levels[level + 1], promoted))
+            level += 1
+
+    def merge(self, other):
+        for level, values in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate((self.levels[level], values))
+        self.count += other.count
+        self.compress()
+
+    def quantiles(self, qs):
+        """
+        :param qs: Quantiles (0-1)
+        :return: List of estimated values, None for an empty sketch
+        """
+        values = np.concatenate(self.levels)
+        if values.size == 0:
+            return [None for _ in qs]
+        weights = np.concatenate([np.full(v.size, 2.0 ** level) for level, v in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        index = np.searchsorted(cumulative, np.asarray(qs) * cumulative[-1], side='left')
+        return values[order][np.minimum(index, values.size - 1)].tolist()
+
+    def get_state(self):
+        return {'count': self.count, 'compactions': self.compactions,
+                'levels': [values.tolist() for values in self.levels]}
+
+    def set_state(self, state):
+        self.count = state['count']
+        self.compactions = state['compactions']
+        self.levels = [np.array(values, dtype=np.float64) for values in state['levels']]
+
+
+class Distribution:
+    """
+    Moments, fixed-bin histogram and quantile sketch of one quantity.
+    """
+
+    def __init__(self, bins=None):
+        """
+        :param bins: Optional (lo, hi, bins) of the histogram
+        """
+        self.moments = RunningMoments()
+        self.histogram = FixedHistogram(*bins) if bins else None
+        self.sketch = QuantileSketch()
+
+    def update(self, values):
+        self.moments.update(values)
+        if self.histogram is not None:
+            self.histogram.update(values)
+        self.sketch.update(values)
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        if self.histogram is not None:
+            self.histogram.merge(other.histogram)
+        self.sketch.merge(other.sketch)
+
+    def summary(self):
+        summary = self.moments.summary()
+        summary['quantiles'] = dict(zip((str(q) for q in SUMMARY_QUANTILES), self.sketch.quantiles(SUMMARY_QUANTILES)))
+        if self.histogram is not None:
+            summary['histogram'] = self.histogram.summary()
+        return summary
+
+    def get_state(self):
+        return {'moments': self.moments.get_state(), 'sketch': self.sketch.get_state(),
+                'histogram': self.histogram.get_state() if self.histogram is not None else None}
+
+    def set_state(self, state):
+        self.moments.set_state(state['moments'])
+        self.sketch.set_state(state['sketch'])
+        if self.histogram is not None:
+            self.histogram.set_state(state['histogram'])
+
+
+class LinkStatistics:
+    """
+    Statistics of the pulses of one radar at one sensor.
+    """
+
+    def __init__(self, start_time, end_time, rate_bin):
+        """
+        :param start_time: Scenario start time (seconds)
+        :param end_time: Scenario end time (seconds)
+        :param rate_bin: Width of the PDW rate bins (seconds)
+        """
+        self.emitted = 0
+        self.detected = 0
+        self.amplitude = Distribution(AMPLITUDE_BINS)
+        self.amplitude_error = Distribution()
+        self.aoa_error = Distribution(AOA_ERROR_BINS)
+        self.toa_error = Distribution()
+        self.frequency_error = Distribution()
+        n_bins = max(int(np.ceil((end_time - start_time) / rate_bin - 1e-9)), 1)
+        self.rate = FixedHistogram(start_time, start_time + n_bins * rate_bin, n_bins)
+
+    def distributions(self):
+        return {'amplitude': self.amplitude, 'amplitude_error': self.amplitude_error, 'aoa_error': self.aoa_error,
+                'toa_error': self.toa_error, 'frequency_error': self.frequency_error}
+
+    def update(self, pdw_batch, truth):
+        """
+        :param pdw_batch: PDW batch from measure_pulse_batch
+        :param truth: Truth batch from measure_pulse_batch (its detected rows match the PDW rows)
+        """
+        self.emitted += len(truth['Detected'])
+        self.detected += len(pdw_batch['TOA'])
+        true = {name: truth[name][truth['Detected']].astype(np.float64) for name in
+                ('Amplitude', 'AOA', 'TOA', 'Frequency')}
+        amplitude = pdw_batch['Amplitude'].astype(np.float64)
+        self.amplitude.update(amplitude)
+        self.amplitude_error.update(amplitude - true['Amplitude'])
+        self.aoa_error.update((pdw_batch['AOA'].astype(np.float64) - true['AOA'] + 180) % 360 - 180)
+        self.toa_error.update(pdw_batch['TOA'] - true['TOA'])
+        self.frequency_error.update(pdw_batch['Frequency'].astype(np.float64) - true['Frequency'])
+        self.rate.update(pdw_batch['TOA'])
+
+    def merge(self, other):
+        self.emitted += other.emitted
+        self.detected += other.detected
+        for name, distribution in self.distributions().items():
+            distribution.merge(other.distributions()[name])
+        self.rate.merge(other.rate)
+
+    def summary(self):
+        summary = {
+            'emitted': self.emitted,
+            'detected': self.detected,
+            'detection_rate': self.detected / self.emitted if self.emitted else None,
+        }
+        summary.update({name: distribution.summary() for name, distribution in self.distributions().items()})
+        bin_width = (self.rate.hi - self.rate.lo) / self.rate.bins
+        counts = self.rate.counts[1:-1]
+        summary['rate'] = {'start': self.rate.lo, 'bin_width': bin_width, 'counts': counts.tolist(),
+                           'pdws_per_second': (counts / bin_width).tolist()}
+        return summary
+
+    def get_state(self):
+        state = {name: distribution.get_state() for name, distribution in self.distributions().items()}
+        state.update({'emitted': self.emitted, 'detected': self.detected, 'rate': self.rate.get_state()})
+        return state
+
+    def set_state(self, state):
+        for name, distribution in self.distributions().items():
+            distribution.set_state(state[name])
+        self.emitted = state['emitted']
+        self.detected = state['detected']
+        self.rate.set_state(state['rate'])
+
+
+class StatisticsAggregator:
+    """
+    Streaming statistics per (sensor, radar), updated from the vectorized
+    measurement batches instead of storing PDW rows.
+
+    The state is JSON-serializable (get_state/set_state) and aggregators of
+    parallel workers are combined with merge.
+    """
+
+    def __init__(self, start_time, end_time, rate_bin):
+        """
+        :param start_time: Scenario start time (seconds)
+        :param end_time: Scenario end time (seconds)
+        :param rate_bin: Width of the PDW rate bins (seconds)
+        """
+        self.start_time = start_time
+        self.end_time = end_time
+        self.rate_bin = rate_bin
+        self.links = {}
+
+    def link(self, sensor_name, radar_name):
+        key = (sensor_name, radar_name)
+        if key not in self.links:
+            self.links[key] = LinkStatistics(self.start_time, self.end_time, self.rate_bin)
+        return self.links[key]
+
+    def update(self, sensor_name, radar_name, pdw_batch, truth):
+        self.link(sensor_name, radar_name).update(pdw_batch, truth)
+
+    def merge(self, other):
+        for (sensor_name, radar_name), link in other.links.items():
+            self.link(sensor_name, radar_name).merge(link)
+
+    def summary(self):
+        return {
+            'scenario': {'start_time': self.start_time, 'end_time': self.end_time},
+            'links': [dict(sensor=sensor_name, radar=radar_name, **link.summary())
+                      for (sensor_name, radar_name), link in sorted(self.links.items())],
+        }
+
+    def get_state(self):
+        return {
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'rate_bin': self.rate_bin,
+            'links': [[sensor_name, radar_name, link.get_state()]
+                      for (sensor_name, radar_name), link in self.links.items()],
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        aggregator = cls(state['start_time'], state['end_time'], state['rate_bin'])
+        for sensor_name, radar_name, link_state in state['links']:
+            aggregator.link(sensor_name, radar_name).set_state(link_state)
+        return aggregator
+
+    def write_summary(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+def default_rate_bin(scenario):
+    """
+    :param scenario: Scenario object
+    :return: Width of the PDW rate bins: the time step, widened to at most MAX_RATE_BINS bins
+    """
+    duration = (scenario.end_time - scenario.start_time).magnitude
+    return max(scenario.time_step.magnitude, duration / MAX_RATE_BINS)
+
+def aggregate_windows(scenario, aggregator, rng=np.random, first_window=0, stop_window=None):
+    """
+    Detect and measure the pulses of a range of windows, updating the statistics only.
+
+    :param scenario: Scenario object containing radars and sensors
+    :param aggregator: StatisticsAggregator to update
+    :param rng: Random generator used for detection and measurement errors
+    :param first_window: Index of the first window to simulate
+    :param stop_window: Optional index of the first window not to simulate
+    """
+    for _, _, batches in iter_true_pulses(scenario, first_window, stop_window):
+        for sensor, sensor_batches in zip(scenario.sensors, batches):
+            for radar, true_batch in zip(scenario.radars, sensor_batches):
+                if true_batch is None:
+                    continue
+                pdw_batch, truth = measure_pulse_batch(sensor, radar.name, true_batch, rng)
+                aggregator.update(sensor.name, radar.name, pdw_batch, truth)
+
+def run_aggregate_simulation(scenario, filename, rng=np.random):
+    """
+    Run the simulation in aggregate-only mode and write a JSON summary, no PDW rows.
+
+    :param scenario: Scenario object containing radars and sensors
+    :param filename: Summary file
+    :param rng: Random generator used for detection and measurement errors
+    """
+    aggregator = StatisticsAggregator(scenario.start_time.magnitude, scenario.end_time.magnitude,
+                                      default_rate_bin(scenario))
+    aggregate_windows(scenario, aggregator, rng)
+    aggregator.write_summary(filename)
+    for (sensor_name, radar_name), link in sorted(aggregator.links.items()):
+        print(f"{sensor_name} / {radar_name}: {link.detected} of {link.emitted} pulses detected")
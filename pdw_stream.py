@@ -0,0 +1,500 @@
+import heapq
+import os
+import numpy as np
+from pdw_batch import (PDW_COLUMNS, TRUTH_COLUMNS, batch_length, concat_batches, measure_pulse_batch,
+                       sort_batch, take_batch, true_pulse_batch)
+from pdw_io import DEFAULT_WRITE_BUFFERS, BackgroundWriter, ColumnarSink, CsvSink
+from pdw_dataset import DEFAULT_INDEX_BLOCK, OUTPUT_FORMATS, IndexedSink, output_columns, write_dataset_metadata
+from pulse_overlap import OverlapFilter, TruthJoiner
+from true_pulse_cache import TruePulseCache, TruePulseCacheWriter
+from checkpoint import DEFAULT_CHECKPOINT_INTERVAL, Checkpointer, load_checkpoint
+from precision import TICKS_PER_SECOND, PrecisionPolicy
+
+# Upper bound on |measured TOA - true TOA| used to decide when a pulse can no
+# longer be overtaken by a pulse of a later window (seconds)
+DEFAULT_TOA_LOOKAHEAD = 1e-6
+
+# Default number of PDWs per batch of iter_pdw_batches
+DEFAULT_BATCH_SIZE = 4096
+
+
+def kway_merge(batches, key='TOA'):
+    """
+    Merge batches that are each sorted on key into one sorted stream.
+
+    A heap holds the head of every batch. Instead of popping single rows, the
+    batch with the smallest head releases all of its rows up to the head of
+    the next batch in one slice, so the merge costs O(N log R) comparisons in
+    the worst case and far fewer Python steps when streams rarely interleave.
+
+    :param batches: List of batches sorted on key
+    :param key: Column to merge on
+    :return: Generator of sorted batch slices
+    """
+    heap = [(b[key][0], i, 0) for i, b in enumerate(batches) if b is not None and batch_length(b)]
+    heapq.heapify(heap)
+    while heap:
+        _, i, start = heapq.heappop(heap)
+        batch = batches[i]
+        n = len(batch[key])
+        if heap:
+            stop = start + np.searchsorted(batch[key][start:], heap[0][0], side='right')
+            stop = max(stop, start + 1)
+        else:
+            stop = n
+        yield take_batch(batch, slice(start, stop))
+        if stop < n:
+            heapq.heappush(heap, (batch[key][stop], i, stop))
+
+
+class ToaMerger:
+    """
+    Streaming TOA-ordered merge of the per-radar PDW batches of one sensor.
+
+    Every radar delivers one batch per simulation window. Because of the TOA
+    measurement error, the last pulses of a window can have a later measured
+    TOA than the first pulses of the next window, so rows are held back until
+    no later window can precede them: a row is released once its TOA is below
+    window_end - lookahead. Only the pulses inside that lookahead are kept in
+    memory between windows.
+    """
+
+    def __init__(self, n_streams, lookahead=DEFAULT_TOA_LOOKAHEAD):
+        """
+        :param n_streams: Number of input streams (radars)
+        :param lookahead: Bound on the TOA measurement error (seconds)
+        """
+        self.lookahead = lookahead
+        self.pending = [None] * n_streams
+
+    def push(self, stream, batch):
+        """
+        Add the next batch of a stream.
+
+        :param stream: Index of the stream
+        :param batch: PDW batch (unsorted), or None
+        """
+        if batch is None or batch_length(batch) == 0:
+            return
+        merged = concat_batches([self.pending[stream], batch])
+        self.pending[stream] = sort_batch(merged)
+
+    def release(self, horizon):
+        """
+        Release all pending rows with TOA below the horizon, merged across streams.
+
+        :param horizon: TOA horizon (seconds), np.inf to flush everything
+        :return: Generator of TOA-sorted batch slices
+        """
+        ready = []
+        for k, pending in enumerate(self.pending):
+            if pending is None:
+                continue
+            split = np.searchsorted(pending['TOA'], horizon, side='left')
+            ready.append(take_batch(pending, slice(0, split)))
+            self.pending[k] = take_batch(pending, slice(split, None)) if split < batch_length(pending) else None
+        return kway_merge(ready)
+
+    def window_horizon(self, window_end, last_window):
+        """
+        Release horizon after a window has been pushed.
+
+        :param window_end: End of the window (seconds)
+        :param last_window: True for the final window of the scenario
+        :return: TOA horizon (seconds)
+        """
+        return np.inf if last_window else window_end - self.lookahead
+
+
+def iter_true_pulses(scenario, first_window=0, stop_window=None):
+    """
+    Emission/propagation stage: true pulses at every sensor, window by window.
+
+    :param scenario: Scenario object containing radars and sensors
+    :param first_window: Index of the first window to simulate (to resume a run)
+    :param stop_window: Optional index of the first window not to simulate (for time shards)
+    :return: Generator of (window_start, window_end, batches) where batches[i][k] is the
+             true pulse batch of radar k at sensor i, or None
+    """
+    for window, (window_start, window_end) in enumerate(scenario.time_windows()):
+        if window < first_window:
+            continue
+        if stop_window is not None and window >= stop_window:
+            break
+        scenario.set_time(window_start)
+        yield window_start, window_end, [
+            [true_pulse_batch(sensor, radar, window_start, window_end) for radar in scenario.radars]
+            for sensor in scenario.sensors]
+
+
+class MeasurementStage:
+    """
+    Measurement stage: detection, error models, TOA merge and overlap handling
+    for every sensor, fed one window of true pulses at a time.
+    """
+
+    def __init__(self, sensors, radar_names, end_time, lookahead=DEFAULT_TOA_LOOKAHEAD, rng=np.random,
+                 truth_handler=None, overlap=True):
+        """
+        :param sensors: Sensor objects, in the order of the true pulse batches
+        :param radar_names: Radar names, in the order of the true pulse batches
+        :param end_time: Scenario end time (seconds)
+        :param lookahead: Bound on the TOA measurement error (seconds)
+        :param rng: Random generator used for detection and measurement errors
+        :param truth_handler: Optional callable(sensor, truth_batch) receiving the truth of
+                              every emitted pulse, in emission window order; for sensors with
+                              an overlap rule, once the rule has decided which pulses are delivered
+        :param overlap: Apply the sensors' overlap rules (disabled when a later merge applies them)
+        """
+        self.sensors = sensors
+        self.radar_names = radar_names
+        self.end_time = end_time
+        self.rng = rng
+        self.truth_handler = truth_handler
+        self.mergers = [ToaMerger(len(radar_names), lookahead) for _ in sensors]
+        outcomes = truth_handler is not None
+        self.overlap_filters = [OverlapFilter(sensor.overlap_rule, sensor.dead_time, outcomes)
+                                if overlap and sensor.overlap_rule else None for sensor in sensors]
+        self.truth_joiners = [TruthJoiner() if outcomes and f is not None else None for f in self.overlap_filters]
+
+    def process_window(self, window_start, window_end, batches):
+        """
+        Measure one window of true pulses.
+
+        :param window_start: Start of the window (seconds)
+        :param window_end: End of the window (seconds)
+        :param batches: batches[i][k] true pulse batch of radar k at sensor i, or None
+        :return: Generator of (sensor, batch) pairs; batches of one sensor are in TOA order
+        """
+        last_window = window_end >= self.end_time
+        for sensor, merger, overlap_filter, truth_joiner, sensor_batches in zip(
+                self.sensors, self.mergers, self.overlap_filters, self.truth_joiners, batches):
+            for k, (radar_name, true_batch) in enumerate(zip(self.radar_names, sensor_batches)):
+                if true_batch is None:
+                    continue
+                pdw_batch, truth = measure_pulse_batch(sensor, radar_name, true_batch, self.rng)
+                merger.push(k, pdw_batch)
+                if truth_joiner is not None:
+                    truth_joiner.add_truth(truth)
+                elif self.truth_handler is not None:
+                    self.truth_handler(sensor, truth)
+            released = merger.release(merger.window_horizon(window_end, last_window))
+            if overlap_filter is not None:
+                released = [overlap_filter.process(concat_batches(list(released)))]
+                if last_window:
+                    released.append(overlap_filter.flush())
+            if truth_joiner is not None:
+                truth_joiner.add_outcomes(overlap_filter.take_outcomes())
+                truth = truth_joiner.flush() if last_window else truth_joiner.release()
+                if truth is not None:
+                    self.truth_handler(sensor, truth)
+            for batch in released:
+                if batch is not None:
+                    yield sensor, batch
+
+    def held_toa(self):
+        """
+        Earliest TOA of the PDWs held back by the overlap filters of all sensors.
+
+        :return: TOA (seconds), np.inf when no overlap group is held
+        """
+        return min((f.held_toa() for f in self.overlap_filters if f is not None), default=np.inf)
+
+    def get_state(self):
+        """
+        Pulses held back between windows, for checkpoints.
+
+        :return: Dictionary of pending merge and overlap batches and held truth rows
+        """
+        return {
+            'pending': [merger.pending for merger in self.mergers],
+            'overlap': [f.get_state() if f is not None else None for f in self.overlap_filters],
+            'truth': [j.get_state() if j is not None else None for j in self.truth_joiners],
+        }
+
+    def set_state(self, state):
+        """
+        Restore the pulses held back between windows from get_state.
+
+        :param state: Dictionary returned by get_state
+        """
+        for merger, pending in zip(self.mergers, state['pending']):
+            merger.pending = pending
+        for overlap_filter, overlap_state in zip(self.overlap_filters, state['overlap']):
+            if overlap_filter is not None:
+                overlap_filter.set_state(overlap_state)
+        for truth_joiner, truth_state in zip(self.truth_joiners, state['truth']):
+            if truth_joiner is not None:
+                truth_joiner.set_state(truth_state)
+
+
+def iter_measured_pdws(sensors, radar_names, true_pulses, end_time, lookahead=DEFAULT_TOA_LOOKAHEAD,
+                       rng=np.random, truth_handler=None):
+    """
+    Measurement stage as a generator: detect and measure true pulses and yield
+    each sensor's PDWs in TOA order.
+
+    :param sensors: Sensor objects, in the order of the true pulse batches
+    :param radar_names: Radar names, in the order of the true pulse batches
+    :param true_pulses: Generator as returned by iter_true_pulses
+    :param end_time: Scenario end time (seconds)
+    :param lookahead: Bound on the TOA measurement error (seconds)
+    :param rng: Random generator used for detection and measurement errors
+    :param truth_handler: Optional callable(sensor, truth_batch) receiving the truth of
+                          every emitted pulse, in emission window order
+    :return: Generator of (sensor, batch) pairs; batches of one sensor are in TOA order
+    """
+    stage = MeasurementStage(sensors, radar_names, end_time, lookahead, rng, truth_handler)
+    for window_start, window_end, batches in true_pulses:
+        yield from stage.process_window(window_start, window_end, batches)
+
+
+def iter_sorted_pdws(scenario, lookahead=DEFAULT_TOA_LOOKAHEAD, rng=np.random, truth_handler=None, first_window=0,
+                     stop_window=None):
+    """
+    Simulate the scenario window by window and yield each sensor's PDWs in TOA order.
+
+    :param scenario: Scenario object containing radars and sensors
+    :param lookahead: Bound on the TOA measurement error (seconds)
+    :param rng: Random generator used for detection and measurement errors
+    :param truth_handler: Optional callable(sensor, truth_batch) receiving the truth of
+                          every emitted pulse, in emission window order
+    :param first_window: Index of the first window to simulate
+    :param stop_window: Optional index of the first window not to simulate; the pulses
+                        emitted before it are flushed at the end of the previous window
+    :return: Generator of (sensor, batch) pairs; batches of one sensor are in TOA order
+    """
+    end_time = scenario.end_time.magnitude
+    if stop_window is not None:
+        end_time = list(scenario.time_windows())[stop_window - 1][1]
+    return iter_measured_pdws(scenario.sensors, [radar.name for radar in scenario.radars],
+                              iter_true_pulses(scenario, first_window, stop_window), end_time,
+                              lookahead, rng, truth_handler)
+
+
+def iter_pdw_batches(scenario, batch_size=DEFAULT_BATCH_SIZE, lookahead=DEFAULT_TOA_LOOKAHEAD, rng=None,
+                     columns=None, first_window=0, stop_window=None):
+    """
+    Simulate the scenario and yield fixed-size columnar PDW batches as the simulation advances.
+
+    Every batch holds the PDWs of one sensor in TOA order (SensorID column);
+    batches of different sensors interleave. The simulation only advances when
+    the next batch is requested, so memory stays bounded by one window of pulses
+    plus one partial batch per sensor.
+
+    :param scenario: Scenario object containing radars and sensors
+    :param batch_size: PDWs per batch (the last batch of each sensor may be shorter)
+    :param lookahead: Bound on the TOA measurement error (seconds)
+    :param rng: Random generator used for detection and measurement errors, default a fresh one
+    :param columns: Optional list of columns to keep, default PDW_COLUMNS
+    :param first_window: Index of the first window to simulate
+    :param stop_window: Optional index of the first window not to simulate
+    :return: Generator of dictionaries of NumPy arrays
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    columns = list(columns or PDW_COLUMNS)
+    pending = {sensor.name: [] for sensor in scenario.sensors}
+    counts = {sensor.name: 0 for sensor in scenario.sensors}
+    for sensor, batch in iter_sorted_pdws(scenario, lookahead, rng, first_window=first_window,
+                                          stop_window=stop_window):
+        pending[sensor.name].append({name: batch[name] for name in columns})
+        counts[sensor.name] += batch_length(batch)
+        if counts[sensor.name] < batch_size:
+            continue
+        merged = concat_batches(pending[sensor.name])
+        n_full = counts[sensor.name] // batch_size * batch_size
+        for start in range(0, n_full, batch_size):
+            yield take_batch(merged, slice(start, start + batch_size))
+        rest = take_batch(merged, slice(n_full, None))
+        pending[sensor.name] = [rest]
+        counts[sensor.name] -= n_full
+    for name, batches in pending.items():
+        if counts[name]:
+            yield concat_batches(batches)
+
+
+class SortedOutput:
+    """
+    The PDW (and truth) tables of a sorted run, one per sensor.
+
+    PDW tables get a sidecar index of time blocks and the directory a
+    dataset.json, so that pdw_dataset.PdwDataset can answer time-range queries.
+    Batches are serialized by a BackgroundWriter thread unless write_buffers is 0.
+    """
+
+    def __init__(self, sensor_names, output_dir, truth=False, resume=None, precision=None, output_format='csv',
+                 index_block=DEFAULT_INDEX_BLOCK, compress=False, write_buffers=DEFAULT_WRITE_BUFFERS):
+        """
+        :param sensor_names: Names of all sensors
+        :param output_dir: Output directory
+        :param truth: Also write truth tables with every emitted pulse
+        :param resume: Optional positions returned by tell(), to continue an interrupted run
+        :param precision: PrecisionPolicy defining the output schema
+        :param output_format: 'csv' (pdw_<sensor>.csv) or 'columnar' (memory-mappable pdw_<sensor>/ tables)
+        :param index_block: Scenario time covered by one index block (seconds)
+        :param compress: Write gzip-compressed CSV files (pdw_<sensor>.csv.gz)
+        :param write_buffers: Column buffers of the background writer, 0 to write in the calling thread
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Invalid output format: {output_format}. Must be one of {OUTPUT_FORMATS}.")
+        if compress and output_format != 'csv':
+            raise ValueError("Compression is only supported for CSV output")
+        resume = resume or {}
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.compress = compress
+        self.writer = BackgroundWriter(write_buffers) if write_buffers else None
+        self.index_block = index_block
+        self.precision = precision or PrecisionPolicy()
+        self.pdw_columns = output_columns(PDW_COLUMNS, self.precision)
+        toa_column = self.precision.output_name('TOA')
+        toa_scale = TICKS_PER_SECOND if toa_column != 'TOA' else 1
+        self.sinks = {}
+        for name in sensor_names:
+            position = resume.get(f"pdw_{name}")
+            sink = self.open_sink(f"pdw_{name}", self.pdw_columns, position['sink'] if position else None)
+            self.sinks[name] = IndexedSink(sink, os.path.join(output_dir, f"pdw_{name}.index.npy"), toa_column,
+                                           toa_scale, index_block, resume=position['index'] if position else None)
+        self.truth_sinks = {}
+        if truth:
+            truth_columns = output_columns(TRUTH_COLUMNS, self.precision)
+            self.truth_sinks = {name: self.open_sink(f"truth_{name}", truth_columns, resume.get(f"truth_{name}"))
+                                for name in sensor_names}
+
+    def open_sink(self, name, columns, resume):
+        if self.output_format == 'columnar':
+            return ColumnarSink(os.path.join(self.output_dir, name), columns, resume=resume)
+        extension = '.csv.gz' if self.compress else '.csv'
+        return CsvSink(os.path.join(self.output_dir, name + extension), list(columns), resume=resume,
+                       compress=self.compress)
+
+    @property
+    def truth_handler(self):
+        if not self.truth_sinks:
+            return None
+        return lambda sensor, batch: self.write_to(self.truth_sinks[sensor.name], batch)
+
+    def write(self, sensor, batch):
+        self.write_to(self.sinks[sensor.name], batch)
+
+    def write_to(self, sink, batch):
+        batch = self.precision.to_output(batch)
+        if self.writer is not None:
+            self.writer.write(sink, batch)
+        else:
+            sink.write(batch)
+
+    def tell(self):
+        if self.writer is not None:
+            self.writer.flush()
+        positions = {f"pdw_{name}": sink.tell() for name, sink in self.sinks.items()}
+        positions.update({f"truth_{name}": sink.tell() for name, sink in self.truth_sinks.items()})
+        return positions
+
+    def close(self):
+        try:
+            if self.writer is not None:
+                self.writer.close()
+        finally:
+            for sink in list(self.sinks.values()) + list(self.truth_sinks.values()):
+                sink.close()
+        tables = {name: (os.path.relpath(sink.filename, self.output_dir), os.path.basename(sink.index_filename),
+                         sink.rows)
+                  for name, sink in self.sinks.items()}
+        write_dataset_metadata(self.output_dir, self.output_format, self.pdw_columns, tables, self.index_block,
+                               self.precision)
+        for name, sink in self.sinks.items():
+            print(f"Wrote {sink.rows} TOA-sorted PDWs for {name} to {sink.filename}")
+        for name, sink in self.truth_sinks.items():
+            print(f"Wrote {sink.rows} truth rows for {name} to {getattr(sink, 'filename', None) or sink.directory}")
+        if self.writer is not None:
+            print(f"Background writer: {self.writer.describe()}")
+
+
+def run_sorted_simulation(scenario, output_dir, lookahead=DEFAULT_TOA_LOOKAHEAD, rng=np.random, truth=False,
+                          cache_dir=None, checkpoint=None, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+                          resume=False, output_format='csv', compress=False, write_buffers=DEFAULT_WRITE_BUFFERS):
+    """
+    Run the PDW simulation and write one TOA-sorted PDW file per sensor.
+
+    :param scenario: Scenario object containing radars and sensors
+    :param output_dir: Directory receiving pdw_<sensor>.csv files
+    :param lookahead: Bound on the TOA measurement error (seconds)
+    :param rng: Random generator used for detection and measurement errors
+    :param truth: Also write truth_<sensor>.csv files with every emitted pulse
+    :param cache_dir: Optional directory receiving the true pulse table for --remeasure
+    :param checkpoint: Optional checkpoint file, written periodically and removed on success
+    :param checkpoint_interval: Wall clock time between checkpoints (seconds)
+    :param resume: Continue from the checkpoint file instead of starting over
+    :param output_format: 'csv' or 'columnar'
+    :param compress: Write gzip-compressed CSV files
+    :param write_buffers: Column buffers of the background writer, 0 to write in the simulation thread
+    """
+    checkpointer = None
+    state = None
+    if checkpoint is not None:
+        options = {'output_dir': output_dir, 'lookahead': lookahead, 'truth': truth, 'cache_dir': cache_dir,
+                   'output_format': output_format}
+        checkpointer = Checkpointer(checkpoint, scenario, options, checkpoint_interval)
+        if resume and os.path.exists(checkpoint):
+            state = load_checkpoint(checkpoint)
+            checkpointer.verify(state)
+            if state['rng'] is not None:
+                rng.bit_generator.state = state['rng']
+            print(f"Resuming from window {state['window']} (t = {state['time']} s)")
+    first_window = state['window'] if state else 0
+
+    output = SortedOutput([sensor.name for sensor in scenario.sensors], output_dir, truth,
+                          resume=state['outputs'] if state else None, precision=scenario.precision,
+                          output_format=output_format, compress=compress, write_buffers=write_buffers)
+    stage = MeasurementStage(scenario.sensors, [radar.name for radar in scenario.radars],
+                             scenario.end_time.magnitude, lookahead, rng, output.truth_handler)
+    if state:
+        stage.set_state(state['stage'])
+    cache_writer = None
+    true_pulses = iter_true_pulses(scenario, first_window)
+    if cache_dir is not None:
+        cache_writer = TruePulseCacheWriter(cache_dir, scenario, resume=state['cache'] if state else None)
+        true_pulses = cache_writer.write_through(true_pulses, first_window)
+
+    try:
+        for window, (window_start, window_end, batches) in enumerate(true_pulses, first_window):
+            for sensor, batch in stage.process_window(window_start, window_end, batches):
+                output.write(sensor, batch)
+            if checkpointer is not None and checkpointer.due():
+                checkpointer.save(window + 1, window_end, stage, output, cache_writer)
+    finally:
+        output.close()
+        if cache_writer is not None:
+            cache_writer.close()
+    if checkpointer is not None:
+        checkpointer.remove()
+
+
+def run_remeasure(cache_dir, sensors, output_dir, lookahead=DEFAULT_TOA_LOOKAHEAD, rng=np.random, truth=False,
+                  precision=None, output_format='csv', compress=False, write_buffers=DEFAULT_WRITE_BUFFERS):
+    """
+    Rerun only the measurement stage on a cached true pulse table.
+
+    :param cache_dir: Directory written by run_sorted_simulation(cache_dir=...)
+    :param sensors: Sensor objects with the (possibly changed) detection and error models
+    :param output_dir: Directory receiving pdw_<sensor>.csv files
+    :param lookahead: Bound on the TOA measurement error (seconds)
+    :param rng: Random generator used for detection and measurement errors
+    :param truth: Also write truth_<sensor>.csv files with every emitted pulse
+    :param precision: PrecisionPolicy defining the output schema
+    :param output_format: 'csv' or 'columnar'
+    :param compress: Write gzip-compressed CSV files
+    :param write_buffers: Column buffers of the background writer, 0 to write in the measurement thread
+    """
+    cache = TruePulseCache(cache_dir)
+    sensors = cache.match_sensors(sensors)
+    output = SortedOutput([sensor.name for sensor in sensors], output_dir, truth, precision=precision,
+                          output_format=output_format, compress=compress, write_buffers=write_buffers)
+    try:
+        for sensor, batch in iter_measured_pdws(sensors, cache.radar_names, cache.iter_true_pulses(),
+                                                cache.end_time, lookahead, rng, output.truth_handler):
+            output.write(sensor, batch)
+    finally:
+        output.close()
@@ -0,0 +1,369 @@
+import numpy as np
+from kernels import overlap_group_starts
+from pdw_batch import batch_length, concat_batches, take_batch
+
+# Overlap rules:
+#   'drop'      - pulses that overlap another pulse are lost, isolated pulses survive
+#   'merge'     - overlapping pulses become one PDW spanning the whole group, with the
+#                 amplitude, frequency and AOA of the strongest pulse
+#   'strongest' - only the strongest pulse of an overlapping group survives
+OVERLAP_RULES = ('drop', 'merge', 'strongest')
+
+# Columns of the outcome batches of an OverlapFilter: whether each pulse that
+# entered it was delivered, and the overlap group it belonged to
+OUTCOME_COLUMNS = ['RadarID', 'PulseIndex', 'Delivered', 'OverlapGroup']
+
+
+def overlap_groups(toa, pulse_width, dead_time):
+    """
+    Group TOA-sorted pulses whose receiver busy intervals overlap (sweep line).
+
+    A pulse keeps the receiver busy over [TOA, TOA + PW + dead_time). A new group
+    starts at every pulse that arrives after the running maximum of the busy
+    interval ends of all earlier pulses, so the sweep is one cumulative maximum.
+
+    :param toa: TOA-sorted array of pulse arrival times (seconds)
+    :param pulse_width: Array of pulse widths (seconds)
+    :param dead_time: Receiver dead time after each pulse (seconds)
+    :return: Tuple (first, sizes) of group start indices and group sizes
+    """
+    n = len(toa)
+    starts = overlap_group_starts(toa, toa + pulse_width + dead_time)
+    first = np.flatnonzero(starts)
+    sizes = np.diff(np.append(first, n))
+    return first, sizes
+
+def strongest_in_groups(amplitude, first, sizes):
+    """
+    Index of the strongest pulse of every group (first one on ties).
+
+    :param amplitude: Array of pulse amplitudes (dB)
+    :param first: Group start indices
+    :param sizes: Group sizes
+    :return: Array with one pulse index per group
+    """
+    group_max = np.maximum.reduceat(amplitude, first)
+    candidates = np.flatnonzero(amplitude == np.repeat(group_max, sizes))
+    group = np.repeat(np.arange(len(first)), sizes)[candidates]
+    is_first = np.ones(len(candidates), dtype=bool)
+    is_first[1:] = group[1:] != group[:-1]
+    return candidates[is_first]
+
+def resolve_overlaps(batch, dead_time, rule):
+    """
+    Apply the receiver overlap rule to a TOA-sorted PDW batch.
+
+    :param batch: TOA-sorted batch with TOA, PulseWidth and Amplitude columns
+    :param dead_time: Receiver dead time after each pulse (seconds)
+    :param rule: One of OVERLAP_RULES
+    :return: Batch of the PDWs the receiver delivers
+    """
+    if batch is None or batch_length(batch) == 0:
+        return batch
+    toa = batch['TOA']
+    first, sizes = overlap_groups(toa, batch['PulseWidth'], dead_time)
+    if rule == 'drop':
+        return take_batch(batch, np.repeat(sizes == 1, sizes))
+    elif rule == 'strongest':
+        return take_batch(batch, strongest_in_groups(batch['Amplitude'], first, sizes))
+    elif rule == 'merge':
+        merged = take_batch(batch, strongest_in_groups(batch['Amplitude'], first, sizes))
+        merged['TOA'] = toa[first]
+        merged['PulseWidth'] = np.maximum.reduceat(toa + batch['PulseWidth'], first) - toa[first]
+        return merged
+    else:
+        raise ValueError(f"Invalid overlap rule: {rule}. Must be one of {OVERLAP_RULES}.")
+
+
+class OverlapFilter:
+    """
+    Streaming version of resolve_overlaps for consecutive TOA-sorted batches.
+
+    The last group of a batch may continue into the next batch, so it is held
+    back until a later pulse starts a new group (or until flush). With 'drop'
+    and 'strongest' the held group is reduced as batches arrive to one row (its
+    first pulse, or its strongest pulse so far), its busy interval end and its
+    size, so a long chain of overlapping pulses takes constant memory. 'merge'
+    holds the pulses of the group.
+
+    Groups are numbered in TOA order. With outcomes=True the filter also
+    records the fate of every pulse (OUTCOME_COLUMNS) once it is decided, for
+    take_outcomes.
+    """
+
+    def __init__(self, rule, dead_time=0.0, outcomes=False):
+        """
+        :param rule: One of OVERLAP_RULES
+        :param dead_time: Receiver dead time after each pulse (seconds)
+        :param outcomes: Record the outcome of every pulse
+        """
+        if rule not in OVERLAP_RULES:
+            raise ValueError(f"Invalid overlap rule: {rule}. Must be one of {OVERLAP_RULES}.")
+        self.rule = rule
+        self.dead_time = dead_time
+        self.held = None
+        self.held_end = None   # end of the held group's busy interval (drop/strongest)
+        self.held_size = 0     # pulses in the held group (drop/strongest)
+        self.next_group = 0    # number of the held group, or of the next group when nothing is held
+        self.outcomes = [] if outcomes else None
+
+    def process(self, batch):
+        """
+        Resolve overlaps for all groups that are complete after this batch.
+
+        :param batch: Next TOA-sorted batch, or None
+        :return: Batch of delivered PDWs, or None
+        """
+        if self.rule == 'merge':
+            return self.process_merge(batch)
+        batch = concat_batches([self.held, batch])
+        if batch is None:
+            return None
+        toa = batch['TOA']
+        busy_end = toa + batch['PulseWidth'] + self.dead_time
+        sizes = np.ones(len(toa), dtype=np.int64)
+        if self.held is not None:
+            busy_end[0] = self.held_end
+            sizes[0] = self.held_size
+        first = np.flatnonzero(overlap_group_starts(toa, busy_end))
+        last_group = first[-1]
+
+        if self.rule == 'drop':
+            keep = last_group
+        else:
+            keep = last_group + np.argmax(batch['Amplitude'][last_group:])
+        # The other pulses of the open group can no longer be delivered
+        discarded = np.delete(np.arange(last_group, len(toa)), keep - last_group)
+        self.record(batch, discarded, np.zeros(len(discarded), dtype=bool),
+                    np.full(len(discarded), self.next_group + len(first) - 1))
+        self.held = take_batch(batch, slice(keep, keep + 1))
+        self.held_end = busy_end[last_group:].max()
+        self.held_size = int(sizes[last_group:].sum())
+        if last_group == 0:
+            return None
+
+        first = first[:-1]
+        group_sizes = np.diff(np.append(first, last_group))
+        if self.rule == 'drop':
+            isolated = np.add.reduceat(sizes[:last_group], first) == 1
+            delivered = first[isolated]
+        else:
+            delivered = strongest_in_groups(batch['Amplitude'][:last_group], first, group_sizes)
+        self.record_groups(batch, first, group_sizes, delivered)
+        return take_batch(batch, delivered)
+
+    def process_merge(self, batch):
+        """
+        process() for the 'merge' rule, which needs every pulse of the held group.
+
+        :param batch: Next TOA-sorted batch, or None
+        :return: Batch of delivered PDWs, or None
+        """
+        batch = concat_batches([self.held, batch])
+        if batch is None:
+            return None
+        first, _ = overlap_groups(batch['TOA'], batch['PulseWidth'], self.dead_time)
+        last_group = first[-1]
+        self.held = take_batch(batch, slice(last_group, None))
+        if last_group == 0:
+            return None
+        return self.resolve(take_batch(batch, slice(0, last_group)))
+
+    def resolve(self, batch):
+        """
+        resolve_overlaps for a batch of complete groups, recording the outcomes.
+
+        :param batch: TOA-sorted batch of complete groups
+        :return: Batch of delivered PDWs
+        """
+        if self.outcomes is not None:
+            first, sizes = overlap_groups(batch['TOA'], batch['PulseWidth'], self.dead_time)
+            self.record_groups(batch, first, sizes, strongest_in_groups(batch['Amplitude'], first, sizes))
+        return resolve_overlaps(batch, self.dead_time, self.rule)
+
+    def record(self, batch, rows, delivered, groups):
+        """
+        Record the outcome of some pulses of a batch.
+
+        :param batch: Batch the pulses are taken from
+        :param rows: Row indices of the pulses
+        :param delivered: Boolean array, True for delivered pulses
+        :param groups: Overlap group numbers of the pulses
+        """
+        if self.outcomes is not None and len(rows):
+            self.outcomes.append({'RadarID': batch['RadarID'][rows], 'PulseIndex': batch['PulseIndex'][rows],
+                                  'Delivered': delivered, 'OverlapGroup': groups})
+
+    def record_groups(self, batch, first, sizes, delivered_rows):
+        """
+        Record the outcome of the complete groups at the start of a batch and number them.
+
+        :param batch: Batch starting with the groups
+        :param first: Group start indices
+        :param sizes: Group sizes (rows of the batch)
+        :param delivered_rows: Indices of the delivered rows
+        """
+        n = int(np.sum(sizes))
+        delivered = np.zeros(n, dtype=bool)
+        delivered[delivered_rows] = True
+        self.record(batch, np.arange(n), delivered, self.next_group + np.repeat(np.arange(len(first)), sizes))
+        self.next_group += len(first)
+
+    def take_outcomes(self):
+        """
+        Outcomes recorded since the last call.
+
+        :return: Batch with OUTCOME_COLUMNS, or None
+        """
+        batch = concat_batches(self.outcomes or [])
+        if self.outcomes is not None:
+            self.outcomes = []
+        return batch
+
+    def held_toa(self):
+        """
+        Earliest TOA a PDW of the held-back group can be delivered with.
+
+        :return: TOA (seconds), np.inf when nothing is held
+        """
+        if self.held is None or batch_length(self.held) == 0:
+            return np.inf
+        return self.held['TOA'][0]
+
+    def flush(self):
+        """
+        Resolve the held-back pulses at the end of the stream.
+
+        :return: Batch of delivered PDWs, or None
+        """
+        batch, self.held = self.held, None
+        if batch is None:
+            return None
+        if self.rule == 'merge':
+            return self.resolve(batch)
+        delivered = not (self.rule == 'drop' and self.held_size > 1)
+        self.record(batch, np.arange(1), np.array([delivered]), np.array([self.next_group]))
+        self.next_group += 1
+        return batch if delivered else take_batch(batch, slice(0, 0))
+
+    def get_state(self):
+        """
+        Held-back group, for checkpoints.
+
+        :return: Dictionary with the held batch, its busy interval end and size, the
+                 group number and the outcomes not taken yet
+        """
+        return {'held': self.held, 'held_end': self.held_end, 'held_size': self.held_size,
+                'next_group': self.next_group, 'outcomes': self.outcomes}
+
+    def set_state(self, state):
+        """
+        Restore the held-back group from get_state.
+
+        :param state: Dictionary returned by get_state
+        """
+        self.held = state['held']
+        self.held_end = state['held_end']
+        self.held_size = state['held_size']
+        self.next_group = state['next_group']
+        self.outcomes = state['outcomes']
+
+
+class TruthJoiner:
+    """
+    Completes the Delivered and OverlapGroup columns of a sensor's truth rows
+    with the outcomes of its OverlapFilter.
+
+    Truth rows come in emission order, the outcomes of the detected pulses
+    later and in TOA order. Truth rows are held back until every detected
+    pulse among them has its outcome, and are then released in their original
+    order. Outcomes that arrive before their truth row wait for it.
+    """
+
+    def __init__(self):
+        self.truth = None      # truth rows not released yet
+        self.decided = None    # per row of truth: outcome known (or not detected)
+        self.outcomes = None   # outcomes without their truth row yet
+
+    def add_truth(self, batch):
+        """
+        :param batch: Truth batch of emitted pulses, in emission order
+        """
+        if batch is None or batch_length(batch) == 0:
+            return
+        batch = dict(batch)
+        batch['Delivered'] = np.zeros(batch_length(batch), dtype=bool)
+        batch['OverlapGroup'] = np.full(batch_length(batch), -1, dtype=np.int64)
+        self.truth = concat_batches([self.truth, batch])
+        self.decided = np.concatenate([self.decided if self.decided is not None else np.empty(0, dtype=bool),
+                                       ~batch['Detected']])
+        self.match()
+
+    def add_outcomes(self, batch):
+        """
+        :param batch: Outcome batch from OverlapFilter.take_outcomes, or None
+        """
+        self.outcomes = concat_batches([self.outcomes, batch])
+        self.match()
+
+    def match(self):
+        if self.truth is None or self.outcomes is None:
+            return
+        waiting = np.flatnonzero(~self.decided)
+        matched = np.zeros(batch_length(self.outcomes), dtype=bool)
+        # A pulse is identified by its radar and pulse index
+        for radar in np.unique(self.outcomes['RadarID']):
+            rows = waiting[self.truth['RadarID'][waiting] == radar]
+            outcomes = np.flatnonzero(self.outcomes['RadarID'] == radar)
+            order = np.argsort(self.truth['PulseIndex'][rows], kind='stable')
+            rows = rows[order]
+            position = np.searchsorted(self.truth['PulseIndex'][rows], self.outcomes['PulseIndex'][outcomes])
+            found = position < len(rows)
+            found[found] = self.truth['PulseIndex'][rows[position[found]]] == self.outcomes['PulseIndex'][
+                outcomes[found]]
+            rows, outcomes = rows[position[found]], outcomes[found]
+            self.truth['Delivered'][rows] = self.outcomes['Delivered'][outcomes]
+            self.truth['OverlapGroup'][rows] = self.outcomes['OverlapGroup'][outcomes]
+            self.decided[rows] = True
+            matched[outcomes] = True
+        self.outcomes = take_batch(self.outcomes, ~matched) if not matched.all() else None
+
+    def release(self):
+        """
+        :return: The leading truth rows whose outcomes are all known, or None
+        """
+        if self.truth is None:
+            return None
+        waiting = np.flatnonzero(~self.decided)
+        return self.split(waiting[0] if len(waiting) else len(self.decided))
+
+    def flush(self):
+        """
+        :return: All remaining truth rows, or None
+        """
+        return self.split(len(self.decided)) if self.truth is not None else None
+
+    def split(self, n):
+        if n == 0:
+            return None
+        released = take_batch(self.truth, slice(0, n))
+        if n < len(self.decided):
+            self.truth = take_batch(self.truth, slice(n, None))
+            self.decided = self.decided[n:]
+        else:
+            self.truth = self.decided = None
+        return released
+
+    def get_state(self):
+        """
+        :return: Dictionary with the held truth rows and outcomes, for checkpoints
+        """
+        return {'truth': self.truth, 'decided': self.decided, 'outcomes': self.outcomes}
+
+    def set_state(self, state):
+        """
+        :param state: Dictionary returned by get_state
+        """
+        self.truth = state['truth']
+        self.decided = state['decided']
+        self.outcomes = state['outcomes']
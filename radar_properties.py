@@ -2,6 +2,7 @@ import numpy as np
 import numpy.ma as ma
 from scipy import stats
 from scenario_geometry_functions import get_unit_registry
+from kernels import pri_schedule, pri_schedule_window
 
 ureg = get_unit_registry()
 
@@ -60,18 +61,31 @@ def calculate_rotation_angles(start_time, end_time, time_step, rotation_type, pa
     :return: List of [time, angle, period] triples
     """
     times = np.arange(start_time, end_time + time_step, time_step)
+    angles = rotation_angle(times, rotation_type, params)
     if rotation_type == 'constant':
-        angles = constant_rotation_period(times, params['t0'], params['alpha0'], params['T_rot'])
         periods = np.full_like(times, params['T_rot'])
-    elif rotation_type == 'varying':
-        angles = varying_rotation_period(times, params['t0'], params['alpha0'], params['T_rot'], 
-                                         params['A'], params['s'], params['phi0'])
-        periods = calculate_varying_period(times, params['T_rot'], params['A'], params['s'], params['phi0'])
     else:
-        raise ValueError("Invalid rotation type. Must be 'constant' or 'varying'.")
+        periods = calculate_varying_period(times, params['T_rot'], params['A'], params['s'], params['phi0'])
     
     return list(zip(times, angles, periods))
 
+def rotation_angle(t, rotation_type, params):
+    """
+    Calculate the antenna pointing angle at arbitrary times.
+    
+    :param t: Time or array of times (seconds)
+    :param rotation_type: 'constant' or 'varying'
+    :param params: Dictionary of parameters for the rotation calculation
+    :return: Antenna angle(s) in radians
+    """
+    if rotation_type == 'constant':
+        return constant_rotation_period(t, params['t0'], params['alpha0'], params['T_rot'])
+    elif rotation_type == 'varying':
+        return varying_rotation_period(t, params['t0'], params['alpha0'], params['T_rot'],
+                                       params['A'], params['s'], params['phi0'])
+    else:
+        raise ValueError("Invalid rotation type. Must be 'constant' or 'varying'.")
+
 
 
 ########## Pulse Repetition Interval ############ 
@@ -101,16 +115,7 @@ def stagger_pri(start_time, end_time, pri_pattern):
     :param pri_pattern: List of PRI values for the stagger pattern (seconds)
     :return: Array of pulse times
     """
-    pulse_times = []
-    current_time = start_time
-    pri_index = 0
-    
-    while current_time < end_time:
-        pulse_times.append(current_time)
-        current_time += pri_pattern[pri_index]
-        pri_index = (pri_index + 1) % len(pri_pattern)
-    
-    return np.array(pulse_times)
+    return pri_schedule(start_time, end_time, pri_pattern)
 
 def switched_pri(start_time, end_time, pri_pattern, repetitions):
     """
@@ -122,18 +127,7 @@ def switched_pri(start_time, end_time, pri_pattern, repetitions):
     :param repetitions: List of repetition counts for each PRI value
     :return: Array of pulse times
     """
-    pulse_times = []
-    current_time = start_time
-    
-    while current_time < end_time:
-        for pri, rep in zip(pri_pattern, repetitions):
-            for _ in range(rep):
-                if current_time >= end_time:
-                    break
-                pulse_times.append(current_time)
-                current_time += pri
-    
-    return np.array(pulse_times)
+    return pri_schedule(start_time, end_time, np.repeat(pri_pattern, repetitions))
 
 def jitter_pri(start_time, end_time, mean_pri, jitter_percentage):
     """
@@ -162,6 +156,113 @@ def jitter_pri(start_time, end_time, mean_pri, jitter_percentage):
     
     return np.array(pulse_times)
 
+def generate_pulse_times(pri_type, pri_params, start_time, end_time):
+    """
+    Generate the pulse times of a PRI configuration.
+
+    :param pri_type: 'fixed', 'stagger', 'switched' or 'jitter'
+    :param pri_params: PRI parameters of the radar configuration
+    :param start_time: Time of the first pulse (seconds)
+    :param end_time: End time of the simulation (seconds)
+    :return: Array of pulse times
+    """
+    if pri_type == 'fixed':
+        return fixed_pri(start_time, end_time, pri_params['pri'])
+    elif pri_type == 'stagger':
+        return stagger_pri(start_time, end_time, pri_params['pri_pattern'])
+    elif pri_type == 'switched':
+        return switched_pri(start_time, end_time, pri_params['pri_pattern'], pri_params['repetitions'])
+    elif pri_type == 'jitter':
+        return jitter_pri(start_time, end_time, pri_params['mean_pri'], pri_params['jitter_percentage'])
+    else:
+        raise ValueError(f"Invalid PRI type: {pri_type}")
+
+def pulse_time_window(pri_type, pri_params, start_time, end_time, window_start, window_end):
+    """
+    The pulses of the full PRI schedule (fixed_pri, stagger_pri, switched_pri or
+    jitter_pri from start_time to end_time) emitted in [window_start, window_end),
+    with the same values.
+
+    Fixed, stagger and switched schedules only store the pulses of the window.
+    Jittered schedules are random draws: the whole schedule is drawn (so the
+    random stream advances as for the full schedule) and then cut.
+
+    :param pri_type: 'fixed', 'stagger', 'switched' or 'jitter'
+    :param pri_params: PRI parameters of the radar configuration
+    :param start_time: Time of the first pulse (seconds)
+    :param end_time: End time of the simulation (seconds)
+    :param window_start: Start of the window (seconds, inclusive)
+    :param window_end: End of the window (seconds, exclusive)
+    :return: Tuple (index of the first pulse of the window in the full schedule, array of pulse times)
+    """
+    if pri_type == 'fixed':
+        # np.arange(start, end, pri) holds start + i * ((start + pri) - start)
+        pri = pri_params['pri']
+        n = max(0, int(np.ceil((end_time - start_time) / pri)))
+        lo = min(max(int(np.floor((window_start - start_time) / pri)) - 1, 0), n)
+        hi = min(max(int(np.ceil((window_end - start_time) / pri)) + 1, lo), n)
+        times = start_time + np.arange(lo, hi) * ((start_time + pri) - start_time)
+        first, last = np.searchsorted(times, [window_start, window_end], side='left')
+        return lo + int(first), times[first:last]
+    elif pri_type == 'stagger':
+        return pri_schedule_window(start_time, end_time, pri_params['pri_pattern'], window_start, window_end)
+    elif pri_type == 'switched':
+        return pri_schedule_window(start_time, end_time, np.repeat(pri_params['pri_pattern'], pri_params['repetitions']),
+                                   window_start, window_end)
+    elif pri_type == 'jitter':
+        times = jitter_pri(start_time, end_time, pri_params['mean_pri'], pri_params['jitter_percentage'])
+        first, last = np.searchsorted(times, [window_start, window_end], side='left')
+        return int(first), times[first:last].copy()
+    else:
+        raise ValueError(f"Invalid PRI type: {pri_type}")
+
+def table_length(start_time, end_time):
+    """
+    Length of a frequency or pulse width table: one value per millisecond of
+    emission, and at least one so that radars emitting for less than 1 ms
+    (or starting after the end of the simulation) still have a value.
+
+    :param start_time: Start time of the radar (seconds)
+    :param end_time: End time of the simulation (seconds)
+    :return: Number of values
+    """
+    return max(1, int((end_time - start_time) / 0.001))
+
+def table_window(table_type, params, name, start_time, end_time, first_index, count):
+    """
+    Values of a frequency or pulse width table for the pulses first_index to
+    first_index + count, as the full table indexed with wrap-around gives them.
+
+    Fixed, stagger and switched tables are evaluated for these pulses only.
+    Jittered tables are drawn whole (so the random stream advances as for the
+    full table) and then cut.
+
+    :param table_type: 'fixed', 'stagger', 'switched' or 'jitter'
+    :param params: Parameters of the table from the radar configuration
+    :param name: 'frequency' or 'pulse_width' (prefix of the parameter names)
+    :param start_time: Start time of the radar (seconds)
+    :param end_time: End time of the simulation (seconds)
+    :param first_index: Index of the first pulse
+    :param count: Number of pulses
+    :return: Array with one value per pulse
+    """
+    if table_type == 'jitter':
+        jitter_table = jitter_frequency if name == 'frequency' else jitter_pulse_width
+        table = jitter_table(start_time, end_time, params[f"mean_{name}"], params['jitter_percentage'])
+    elif table_type == 'fixed':
+        table = [params[name]]
+    elif table_type == 'stagger':
+        table = params[f"{name}_pattern"]
+    elif table_type == 'switched':
+        table = np.repeat(params[f"{name}_pattern"], params['repetitions'])
+    else:
+        raise ValueError(f"Invalid {name.replace('_', ' ')} type: {table_type}")
+    if count == 0:
+        return np.empty(0)
+    # The full tables repeat their pattern over one value per millisecond
+    indices = (first_index + np.arange(count)) % table_length(start_time, end_time)
+    return np.asarray(table)[indices % len(table)]
+
 ######### Frequency Functions 
 
 # Frequency functions
@@ -174,7 +275,7 @@ def fixed_frequency(start_time, end_time, frequency):
     :param frequency: Fixed frequency value (Hz)
     :return: Array of frequency values
     """
-    return np.full(int((end_time - start_time) / 0.001), frequency)  # Assuming 1ms intervals
+    return np.full(table_length(start_time, end_time), frequency)
 
 def stagger_frequency(start_time, end_time, frequency_pattern):
     """
@@ -185,7 +286,7 @@ def stagger_frequency(start_time, end_time, frequency_pattern):
     :param frequency_pattern: List of frequency values for the stagger pattern (Hz)
     :return: Array of frequency values
     """
-    num_values = int((end_time - start_time) / 0.001)  # Assuming 1ms intervals
+    num_values = table_length(start_time, end_time)
     return np.tile(frequency_pattern, num_values // len(frequency_pattern) + 1)[:num_values]
 
 def switched_frequency(start_time, end_time, frequency_pattern, repetitions):
@@ -201,7 +302,7 @@ def switched_frequency(start_time, end_time, frequency_pattern, repetitions):
     frequencies = []
     for freq, rep in zip(frequency_pattern, repetitions):
         frequencies.extend([freq] * rep)
-    num_values = int((end_time - start_time) / 0.001)  # Assuming 1ms intervals
+    num_values = table_length(start_time, end_time)
     return np.tile(frequencies, num_values // len(frequencies) + 1)[:num_values]
 
 def jitter_frequency(start_time, end_time, mean_frequency, jitter_percentage):
@@ -214,7 +315,7 @@ def jitter_frequency(start_time, end_time, mean_frequency, jitter_percentage):
     :param jitter_percentage: Jitter as a percentage of mean frequency
     :return: Array of frequency values
     """
-    num_values = int((end_time - start_time) / 0.001)  # Assuming 1ms intervals
+    num_values = table_length(start_time, end_time)
     # print(mean_frequency)
     # print(jitter_percentage)
     # print(type(mean_frequency))
@@ -228,6 +329,29 @@ def jitter_frequency(start_time, end_time, mean_frequency, jitter_percentage):
         scale=std_dev
     ).rvs(size=num_values)
 
+def generate_frequencies(frequency_type, frequency_params, start_time, end_time):
+    """
+    Generate the frequency table of a frequency configuration.
+
+    :param frequency_type: 'fixed', 'stagger', 'switched' or 'jitter'
+    :param frequency_params: Frequency parameters of the radar configuration
+    :param start_time: Start time of the radar (seconds)
+    :param end_time: End time of the simulation (seconds)
+    :return: Array of frequency values
+    """
+    if frequency_type == 'fixed':
+        return fixed_frequency(start_time, end_time, frequency_params['frequency'])
+    elif frequency_type == 'stagger':
+        return stagger_frequency(start_time, end_time, frequency_params['frequency_pattern'])
+    elif frequency_type == 'switched':
+        return switched_frequency(start_time, end_time, frequency_params['frequency_pattern'],
+                                  frequency_params['repetitions'])
+    elif frequency_type == 'jitter':
+        return jitter_frequency(start_time, end_time, frequency_params['mean_frequency'],
+                                frequency_params['jitter_percentage'])
+    else:
+        raise ValueError(f"Invalid frequency type: {frequency_type}")
+
 
 ########### - Pulse Width Functions - ############
 # Pulse width functions
@@ -240,7 +364,7 @@ def fixed_pulse_width(start_time, end_time, pulse_width):
     :param pulse_width: Fixed pulse width value (seconds)
     :return: Array of pulse width values
     """
-    return np.full(int((end_time - start_time) / 0.001), pulse_width)  # Assuming 1ms intervals
+    return np.full(table_length(start_time, end_time), pulse_width)
 
 def stagger_pulse_width(start_time, end_time, pulse_width_pattern):
     """
@@ -251,7 +375,7 @@ def stagger_pulse_width(start_time, end_time, pulse_width_pattern):
     :param pulse_width_pattern: List of pulse width values for the stagger pattern (seconds)
     :return: Array of pulse width values
     """
-    num_values = int((end_time - start_time) / 0.001)  # Assuming 1ms intervals
+    num_values = table_length(start_time, end_time)
     return np.tile(pulse_width_pattern, num_values // len(pulse_width_pattern) + 1)[:num_values]
 
 def switched_pulse_width(start_time, end_time, pulse_width_pattern, repetitions):
@@ -267,7 +391,7 @@ def switched_pulse_width(start_time, end_time, pulse_width_pattern, repetitions)
     pulse_widths = []
     for pw, rep in zip(pulse_width_pattern, repetitions):
         pulse_widths.extend([pw] * rep)
-    num_values = int((end_time - start_time) / 0.001)  # Assuming 1ms intervals
+    num_values = table_length(start_time, end_time)
     return np.tile(pulse_widths, num_values // len(pulse_widths) + 1)[:num_values]
 
 def jitter_pulse_width(start_time, end_time, mean_pulse_width, jitter_percentage):
@@ -280,7 +404,7 @@ def jitter_pulse_width(start_time, end_time, mean_pulse_width, jitter_percentage
     :param jitter_percentage: Jitter as a percentage of mean pulse width
     :return: Array of pulse width values
     """
-    num_values = int((end_time - start_time) / 0.001)  # Assuming 1ms intervals
+    num_values = table_length(start_time, end_time)
     std_dev = mean_pulse_width * (jitter_percentage / 100)
     return stats.truncnorm(
         (0 - mean_pulse_width) / std_dev,
@@ -289,6 +413,29 @@ def jitter_pulse_width(start_time, end_time, mean_pulse_width, jitter_percentage
         scale=std_dev
     ).rvs(size=num_values)
 
+def generate_pulse_widths(pulse_width_type, pulse_width_params, start_time, end_time):
+    """
+    Generate the pulse width table of a pulse width configuration.
+
+    :param pulse_width_type: 'fixed', 'stagger', 'switched' or 'jitter'
+    :param pulse_width_params: Pulse width parameters of the radar configuration
+    :param start_time: Start time of the radar (seconds)
+    :param end_time: End time of the simulation (seconds)
+    :return: Array of pulse width values
+    """
+    if pulse_width_type == 'fixed':
+        return fixed_pulse_width(start_time, end_time, pulse_width_params['pulse_width'])
+    elif pulse_width_type == 'stagger':
+        return stagger_pulse_width(start_time, end_time, pulse_width_params['pulse_width_pattern'])
+    elif pulse_width_type == 'switched':
+        return switched_pulse_width(start_time, end_time, pulse_width_params['pulse_width_pattern'],
+                                    pulse_width_params['repetitions'])
+    elif pulse_width_type == 'jitter':
+        return jitter_pulse_width(start_time, end_time, pulse_width_params['mean_pulse_width'],
+                                  pulse_width_params['jitter_percentage'])
+    else:
+        raise ValueError(f"Invalid pulse width type: {pulse_width_type}")
+
 
 
 ######### - Radar Antenna Lobe Pattern - ###########
@@ -333,3 +480,22 @@ def sinc_lobe_pattern(theta, theta_ml, P_ml, P_bl):
 
     return P_theta * ureg.dB
 
+def sinc_lobe_gain(theta, theta_ml, P_ml, P_bl):
+    """
+    Vectorized sinc lobe pattern on plain arrays (no units, no printing).
+    
+    Same model as sinc_lobe_pattern, intended for whole pulse batches.
+    
+    :param theta: Array of angles from the antenna boresight in [-pi, pi] (radians)
+    :param theta_ml: Main lobe opening angle (radians)
+    :param P_ml: Radar power at main lobe (dB)
+    :param P_bl: Radar power at back lobe (dB)
+    :return: Array of gains (dB)
+    """
+    theta = np.asarray(theta, dtype=float)
+    x = 0.443 * np.sin(theta) / np.sin(theta_ml / 2)
+    with np.errstate(divide='ignore'):
+        P_theta = 20 * np.log10(np.abs(np.sinc(x))) + P_ml
+    # Linear back lobe attenuation outside [-pi/2, pi/2]
+    back = np.abs(theta) - np.pi / 2
+    return P_theta + np.where(back > 0, 2 / np.pi * P_bl * back, 0)
@@ -47,6 +47,123 @@ def calculate_trajectory(start_position, end_time, time_step, velocity=None, sta
     
     return trajectory
 
+class Trajectory:
+    """
+    Piecewise linear motion in the plane, evaluated in closed form at arbitrary times.
+
+    The motion is stored as a segment table: segment k starts at times[k] at
+    positions[k] and moves with velocities[k] until the next segment starts.
+    Before the first segment the object holds its first position. Evaluating
+    an array of times takes one searchsorted plus one multiply-add.
+    """
+
+    def __init__(self, times, positions, velocities):
+        """
+        :param times: Start time of every segment, increasing (seconds)
+        :param positions: Position [x, y] at the start of every segment (meters)
+        :param velocities: Velocity [vx, vy] during every segment (meters per second)
+        """
+        self.times = np.asarray(times, dtype=float)
+        self.positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        self.velocities = np.asarray(velocities, dtype=float).reshape(-1, 2)
+
+    @classmethod
+    def straight_line(cls, start_position, velocity=None, start_time=0):
+        """
+        Stationary object, or motion along a straight line as in move_straight_line.
+
+        :param start_position: Initial position [x, y] in meters
+        :param velocity: Optional - Velocity [vx, vy] in meters per second
+        :param start_time: Start time of the motion in seconds
+        :return: Trajectory
+        """
+        velocity = np.zeros(2) if velocity is None else velocity
+        return cls([start_time], [start_position], [velocity])
+
+    @classmethod
+    def from_waypoints(cls, waypoints, times=None, speed=None, start_time=0):
+        """
+        Multi-leg path through a list of waypoints; the object stops at the last one.
+
+        :param waypoints: List of positions [x, y] in meters
+        :param times: Optional - Time at each waypoint in seconds
+        :param speed: Optional - Speed in meters per second, one value or one per leg;
+                      the first waypoint is then reached at start_time
+        :param start_time: Time at the first waypoint when the timing is given by speed
+        :return: Trajectory
+        """
+        waypoints = np.asarray(waypoints, dtype=float).reshape(-1, 2)
+        legs = np.diff(waypoints, axis=0)
+        if (times is None) == (speed is None):
+            raise ValueError("A waypoint trajectory needs either 'times' or 'speed'")
+        if times is not None:
+            times = np.asarray(times, dtype=float)
+            if len(times) != len(waypoints):
+                raise ValueError(f"Got {len(times)} waypoint times for {len(waypoints)} waypoints")
+        else:
+            speed = np.broadcast_to(np.asarray(speed, dtype=float), len(legs))
+            if np.any(speed <= 0):
+                raise ValueError("Waypoint speeds must be positive")
+            times = start_time + np.concatenate(([0.0], np.cumsum(np.hypot(legs[:, 0], legs[:, 1]) / speed)))
+        durations = np.diff(times)
+        if np.any(durations <= 0):
+            raise ValueError("Waypoint times must be increasing")
+        velocities = np.concatenate((legs / durations[:, None], np.zeros((1, 2))))
+        return cls(times, waypoints, velocities)
+
+    def positions_at(self, times):
+        """
+        Positions at arbitrary times.
+
+        :param times: Time or array of times (seconds)
+        :return: Array of shape times.shape + (2,) in meters
+        """
+        times = np.asarray(times, dtype=float)
+        flat = times.reshape(-1)
+        segment = np.searchsorted(self.times, flat, side='right') - 1
+        np.maximum(segment, 0, out=segment)
+        elapsed = flat - np.take(self.times, segment)
+        np.maximum(elapsed, 0.0, out=elapsed)
+        # Gathering per coordinate avoids slower 2-D fancy indexing
+        positions = np.empty((len(flat), 2))
+        for axis in range(2):
+            positions[:, axis] = np.take(self.positions[:, axis], segment)
+            positions[:, axis] += np.take(self.velocities[:, axis], segment) * elapsed
+        return positions.reshape(times.shape + (2,))
+
+    def sample(self, end_time, time_step, start_time=None):
+        """
+        Positions on a regular time grid, in the format of calculate_trajectory.
+
+        :param end_time: End time of the grid in seconds (inclusive)
+        :param time_step: Time step in seconds
+        :param start_time: Optional - First time of the grid (default: start of the first segment)
+        :return: Array of [time, x, y] rows
+        """
+        start_time = self.times[0] if start_time is None else start_time
+        times = start_time + time_step * np.arange(int(np.floor((end_time - start_time) / time_step + 1e-9)) + 1)
+        return np.column_stack((times, self.positions_at(times)))
+
+
+def create_trajectory(config, start_time=0):
+    """
+    Trajectory of a radar or sensor configuration.
+
+    A 'trajectory' entry with 'waypoints' and either 'times' or 'speed' gives a
+    waypoint path; otherwise the object is stationary at 'start_position' or
+    moves with a constant 'velocity' from 'start_time'.
+
+    :param config: Radar or sensor configuration
+    :param start_time: Start time of the object in seconds
+    :return: Trajectory
+    """
+    path = config.get('trajectory')
+    if path is None:
+        return Trajectory.straight_line(config['start_position'], config.get('velocity'), start_time)
+    if 'velocity' in config:
+        raise ValueError(f"{config['name']}: 'velocity' cannot be combined with a waypoint 'trajectory'")
+    return Trajectory.from_waypoints(path['waypoints'], path.get('times'), path.get('speed'), start_time)
+
 # Export the unit registry so it can be imported in other files
 def get_unit_registry():
     return ureg
\ No newline at end of file
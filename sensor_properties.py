@@ -1,5 +1,6 @@
 import numpy as np
 from scenario_geometry_functions import get_unit_registry
+from kernels import threshold_walk
 
 ureg = get_unit_registry()
 
@@ -26,16 +27,16 @@ def create_error_model(error_config):
         error_value, error_unit = parse_value_and_unit(error_config['error'])
         # return lambda size: np.random.normal(0, error_value, size) * ureg(error_unit)
         if error_unit == 'percent':
-            return lambda size: np.random.normal(0, error_value, size) * ureg.dimensionless
+            return lambda size, rng=np.random: rng.normal(0, error_value, size) * ureg.dimensionless
         else:
-            return lambda size: np.random.normal(0, error_value, size) * ureg(error_unit)
+            return lambda size, rng=np.random: rng.normal(0, error_value, size) * ureg(error_unit)
     elif error_config['type'] == 'uniform':
         error_value, error_unit = parse_value_and_unit(error_config['error'])
         # return lambda size: np.random.uniform(-error_value, error_value, size) * ureg(error_unit)
         if error_unit == 'percent':
-            return lambda size: np.random.uniform(-error_value, error_value, size) * ureg.dimensionless
+            return lambda size, rng=np.random: rng.uniform(-error_value, error_value, size) * ureg.dimensionless
         else:
-            return lambda size: np.random.uniform(-error_value, error_value, size) * ureg(error_unit)
+            return lambda size, rng=np.random: rng.uniform(-error_value, error_value, size) * ureg(error_unit)
     else:
         raise ValueError(f"Unknown error type: {error_config['type']}")
 
@@ -61,29 +62,61 @@ def parse_value_and_unit(string_value):
         return float(value), unit
 
 
-def detect_pulse(amplitude, detection_levels, detection_probabilities, saturation_level):
+DETECTION_INTERPOLATIONS = ('step', 'linear')
+
+def compile_detection_curve(detection_levels, detection_probabilities):
     """
-    Determine if a pulse is detected based on its amplitude.
-    
-    :param amplitude: Amplitude of the pulse
-    :param detection_levels: List of detection levels
-    :param detection_probabilities: List of detection probabilities corresponding to levels
-    :param saturation_level: Saturation level of the sensor
-    :return: Boolean indicating whether the pulse is detected
+    Compile the detection levels into a step function over sorted thresholds.
+
+    A pulse is detected with the probability of the first level (in configuration
+    order) its amplitude exceeds, so every interval between two sorted thresholds
+    has one probability.
+
+    :param detection_levels: List of detection levels (dB)
+    :param detection_probabilities: List of detection probabilities corresponding to levels (0-1)
+    :return: Tuple (thresholds, steps) of the sorted thresholds and the probability for
+             amplitudes above exactly i thresholds in steps[i]
     """
-    if amplitude.to('dB').magnitude > saturation_level.to('dB').magnitude:
-        return True
-    
-    for level, prob in zip(detection_levels,detection_probabilities):
-        if amplitude.to('dB').magnitude > level.to('dB').magnitude:
-            return np.random.random() < prob
-    return False
-        # if amplitude > saturation_level:
-        #     return True
-        # for level, prob in zip(detection_levels, detection_probabilities):
-        #     if amplitude > level:
-        #         return np.random.random() < prob
-        # return False
+    levels = np.asarray(detection_levels, dtype=float)
+    probabilities = np.asarray(detection_probabilities, dtype=float)
+    thresholds = np.unique(levels)
+    steps = np.zeros(len(thresholds) + 1)
+    for i, threshold in enumerate(thresholds):
+        steps[i + 1] = probabilities[np.flatnonzero(levels <= threshold)[0]]
+    return thresholds, steps
+
+def detection_probability(amplitude, thresholds, steps, interpolation='step'):
+    """
+    Evaluate a compiled detection curve.
+
+    :param amplitude: Array of amplitudes (dB)
+    :param thresholds: Sorted thresholds from compile_detection_curve
+    :param steps: Step probabilities from compile_detection_curve
+    :param interpolation: 'step', or 'linear' to interpolate linearly in dB between the levels
+    :return: Array of detection probabilities
+    """
+    if interpolation == 'linear':
+        return np.interp(amplitude, thresholds, steps[1:], left=0.0)
+    return steps[np.searchsorted(thresholds, amplitude, side='left')]
+
+def detect_pulses(amplitude, thresholds, steps, saturation_level, uniform, interpolation='step'):
+    """
+    Determine which pulses of a batch are detected based on their amplitude.
+
+    Pulses above the saturation level are always detected.
+
+    :param amplitude: Array of amplitudes (dB)
+    :param thresholds: Sorted thresholds from compile_detection_curve
+    :param steps: Step probabilities from compile_detection_curve
+    :param saturation_level: Saturation level of the sensor (dB)
+    :param uniform: One uniform [0, 1) draw per pulse
+    :param interpolation: 'step' or 'linear'
+    :return: Boolean array, True for detected pulses
+    """
+    saturated = amplitude > saturation_level
+    if interpolation == 'step':
+        return threshold_walk(amplitude, thresholds, steps, saturated, uniform)
+    return saturated | (uniform < detection_probability(amplitude, thresholds, steps, interpolation))
 
 def measure_amplitude(true_amplitude, r, P_theta, t, P0, amplitude_error_syst, amplitude_error_arb):
     """
@@ -245,4 +278,84 @@ def aoa_sinusoidal_error(AOA, A, f, AOA_ref):
     :param AOA_ref: Reference angle where error is zero
     :return: AOA error
     """
-    return A * np.sin(f * (AOA - AOA_ref))
\ No newline at end of file
+    return A * np.sin(f * (AOA - AOA_ref))
+
+
+########## Batch measurement ############
+# Vectorized counterparts of the measure_* functions above. They work on plain
+# arrays (dB, seconds, Hz, radians) for a whole batch of pulses and draw one
+# arbitrary error per pulse instead of one per call.
+
+def sample_errors(error_syst, error_arb, t, unit, rng=np.random):
+    """
+    Draw systematic plus arbitrary errors for a batch of pulses.
+    
+    :param error_syst: Function to generate systematic error
+    :param error_arb: Function to generate arbitrary error
+    :param t: Array of measurement times (seconds)
+    :param unit: Unit the errors are returned in
+    :param rng: Random generator used for the arbitrary error
+    :return: Array of errors, one per entry of t
+    """
+    t = np.asarray(t, dtype=float)
+    syst = ureg.Quantity(error_syst(t * ureg.second)).to(unit).magnitude
+    arb = ureg.Quantity(error_arb(t.size, rng)).to(unit).magnitude
+    return np.broadcast_to(syst, t.shape) + arb
+
+def measure_amplitudes(true_amplitude, t, amplitude_error_syst, amplitude_error_arb, rng=np.random):
+    """
+    Measure the amplitudes of a batch of detected pulses.
+    
+    :param true_amplitude: Array of received amplitudes (dB)
+    :param t: Array of measurement times (seconds)
+    :return: Array of measured amplitudes (dB)
+    """
+    return true_amplitude + sample_errors(amplitude_error_syst, amplitude_error_arb, t, 'dB', rng)
+
+def measure_toas(true_toa, toa_error_syst, toa_error_arb, rng=np.random):
+    """
+    Measure the TOA of a batch of detected pulses.
+    
+    :param true_toa: Array of true TOAs including propagation delay (seconds)
+    :return: Array of measured TOAs (seconds)
+    """
+    return true_toa + sample_errors(toa_error_syst, toa_error_arb, true_toa, 'second', rng)
+
+def measure_frequencies(true_frequency, t, frequency_error_syst, frequency_error_arb, rng=np.random):
+    """
+    Measure the frequencies of a batch of detected pulses.
+    
+    :param true_frequency: Array of true frequencies (Hz)
+    :param t: Array of measurement times (seconds)
+    :return: Array of measured frequencies (Hz)
+    """
+    return true_frequency + sample_errors(frequency_error_syst, frequency_error_arb, t, 'Hz', rng)
+
+def measure_pulse_widths(true_pw, t, pw_error_syst, pw_error_arb, rng=np.random):
+    """
+    Measure the pulse widths of a batch of detected pulses.
+    
+    Percentage errors are relative to the true pulse width, as in measure_pulse_width.
+    
+    :param true_pw: Array of true pulse widths (seconds)
+    :param t: Array of measurement times (seconds)
+    :return: Array of measured pulse widths (seconds)
+    """
+    t = np.asarray(t, dtype=float)
+    PW_syst = ureg.Quantity(pw_error_syst(t * ureg.second)).to(ureg.second).magnitude
+    PW_arb = ureg.Quantity(pw_error_arb(t.size, rng))
+    if PW_arb.dimensionless:
+        PW_arb = true_pw * PW_arb.magnitude
+    else:
+        PW_arb = PW_arb.to(ureg.second).magnitude
+    return true_pw + PW_syst + PW_arb
+
+def measure_aoas(true_aoa, t, aoa_error_syst, aoa_error_arb, rng=np.random):
+    """
+    Measure the AOA of a batch of detected pulses.
+    
+    :param true_aoa: Array of true AOAs (radians)
+    :param t: Array of measurement times (seconds)
+    :return: Array of measured AOAs (degrees)
+    """
+    return np.degrees(true_aoa) + sample_errors(aoa_error_syst, aoa_error_arb, t, 'degree', rng)
@@ -0,0 +1,400 @@
+import contextlib
+import json
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from models import Scenario, Sensor
+from pdw_batch import PDW_COLUMNS, TRUTH_COLUMNS, batch_length, take_batch
+from pdw_io import DEFAULT_WRITE_BUFFERS, ColumnarSink, load_columns
+from pdw_stream import DEFAULT_TOA_LOOKAHEAD, MeasurementStage, SortedOutput, iter_true_pulses, kway_merge
+from pulse_overlap import OverlapFilter, TruthJoiner
+from precision import PrecisionPolicy
+from kernels import get_backend, set_backend
+from pdw_stats import StatisticsAggregator, aggregate_windows, default_rate_bin
+
+# Time sharding: the scenario windows are split into contiguous shards that are
+# simulated independently. Every shard rebuilds the scenario with the same seed,
+# but only the radar pulses emitted in its time range (plus the lookahead on both
+# sides), with the pulse indices and values of the full schedules; so the PRI
+# pattern phase and antenna angle at a shard boundary agree between the two
+# shards (checked by run_shard_tasks). Jittered schedules are still drawn from
+# the scenario start to keep the random stream, then cut. Every shard measures
+# its pulses with its own random stream default_rng([seed, shard]). Shards write
+# TOA-sorted tables that are merged per sensor in TOA order; overlap rules are
+# applied during the merge so that groups crossing a shard boundary are handled.
+
+# Rows per batch when merging the shard tables
+MERGE_CHUNK_SIZE = 65536
+
+SHARD_RESULT_FILE = 'shard.json'
+SHARD_STATISTICS_FILE = 'statistics.json'
+
+
+def shard_columns(columns, precision):
+    """
+    Column dtypes of a shard table.
+
+    :param columns: Column names (PDW_COLUMNS or TRUTH_COLUMNS)
+    :param precision: PrecisionPolicy of the scenario
+    :return: Dictionary of column name -> dtype string
+    """
+    dtypes = {'SensorID': 'category', 'RadarID': 'category', 'PulseIndex': 'int64', 'Detected': 'bool',
+              'Delivered': 'bool', 'OverlapGroup': 'int64'}
+    return {name: dtypes.get(name) or precision.dtype(name).name for name in columns}
+
+def make_shard_tasks(config, n_shards, output_dir, seed, lookahead=DEFAULT_TOA_LOOKAHEAD, truth=False,
+                     aggregate=False):
+    """
+    Split the scenario windows into contiguous time shards.
+
+    Tasks are JSON-serializable, so they can be written to files and run on
+    other machines with `python sharding.py <task.json>`.
+
+    :param config: Configuration dictionary (as loaded from the YAML file)
+    :param n_shards: Number of shards
+    :param output_dir: Output directory; shard tables go to <output_dir>/shards
+    :param seed: Random seed shared by all shards
+    :param lookahead: Bound on the TOA measurement error (seconds)
+    :param truth: Also write truth tables
+    :param aggregate: Only collect statistics (pdw_stats) instead of writing PDW tables
+    :return: List of task dictionaries
+    """
+    n_windows = len(list(Scenario(config['scenario']).time_windows()))
+    bounds = np.linspace(0, n_windows, n_shards + 1).round().astype(int)
+    tasks = []
+    for shard, (first_window, stop_window) in enumerate(zip(bounds[:-1], bounds[1:])):
+        if first_window == stop_window:
+            continue
+        tasks.append({
+            'shard': shard,
+            'first_window': int(first_window),
+            'stop_window': int(stop_window),
+            'config': config,
+            'seed': seed,
+            'lookahead': lookahead,
+            'truth': truth,
+            'aggregate': aggregate,
+            'backend': get_backend(),
+            'directory': os.path.abspath(os.path.join(output_dir, 'shards', f"shard_{shard:04d}")),
+            'log': os.path.abspath(os.path.join(output_dir, 'logs', f"shard_{shard:04d}.log")),
+        })
+    return tasks
+
+def run_shard(task):
+    """
+    Simulate the windows of one time shard and write its TOA-sorted tables.
+
+    Writes pdw_<sensor>/ (and truth_<sensor>/) tables, or statistics.json in
+    aggregate mode, and shard.json to task['directory']. The shard's console
+    output goes to task['log'].
+
+    :param task: Task dictionary from make_shard_tasks
+    :return: Shard result dictionary (also written to shard.json)
+    """
+    os.makedirs(os.path.dirname(task['log']), exist_ok=True)
+    with open(task['log'], 'wt') as log, contextlib.redirect_stdout(log):
+        return simulate_shard(task)
+
+def simulate_shard(task):
+    from main import create_scenario
+
+    if task['backend']:
+        set_backend(task['backend'])
+    windows = list(Scenario(task['config']['scenario']).time_windows())
+    shard_start = windows[task['first_window']][0]
+    shard_end = windows[task['stop_window'] - 1][1]
+    np.random.seed(task['seed'])
+    scenario = create_scenario(task['config'], (shard_start - task['lookahead'], shard_end + task['lookahead']))
+    directory = task['directory']
+    rng = np.random.default_rng([task['seed'], task['shard']])
+
+    if task.get('aggregate'):
+        aggregator = StatisticsAggregator(scenario.start_time.magnitude, scenario.end_time.magnitude,
+                                          default_rate_bin(scenario))
+        aggregate_windows(scenario, aggregator, rng, task['first_window'], task['stop_window'])
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, SHARD_STATISTICS_FILE), 'w') as f:
+            json.dump(aggregator.get_state(), f)
+        rows = {sensor.name: sum(link.detected for (name, _), link in aggregator.links.items() if name == sensor.name)
+                for sensor in scenario.sensors}
+        return write_shard_result(task, scenario, shard_start, shard_end, rows)
+
+    pdw_sinks = {sensor.name: ColumnarSink(os.path.join(directory, f"pdw_{sensor.name}"),
+                                           shard_columns(PDW_COLUMNS, scenario.precision))
+                 for sensor in scenario.sensors}
+    truth_sinks = {}
+    if task['truth']:
+        truth_sinks = {sensor.name: ColumnarSink(os.path.join(directory, f"truth_{sensor.name}"),
+                                                 shard_columns(TRUTH_COLUMNS, scenario.precision))
+                       for sensor in scenario.sensors}
+    truth_handler = (lambda sensor, batch: truth_sinks[sensor.name].write(batch)) if truth_sinks else None
+
+    stage = MeasurementStage(scenario.sensors, [radar.name for radar in scenario.radars], shard_end,
+                             task['lookahead'], rng, truth_handler, overlap=False)
+    try:
+        for window_start, window_end, batches in iter_true_pulses(scenario, task['first_window'],
+                                                                  task['stop_window']):
+            for sensor, batch in stage.process_window(window_start, window_end, batches):
+                pdw_sinks[sensor.name].write(batch)
+    finally:
+        for sink in list(pdw_sinks.values()) + list(truth_sinks.values()):
+            sink.close()
+    return write_shard_result(task, scenario, shard_start, shard_end,
+                              {name: sink.rows for name, sink in pdw_sinks.items()})
+
+def write_shard_result(task, scenario, shard_start, shard_end, rows):
+    """
+    Write shard.json with the shard's time range, emission state at both ends and PDW counts.
+
+    :param task: Task dictionary
+    :param scenario: Scenario object of the shard
+    :param shard_start: Start of the shard (seconds)
+    :param shard_end: End of the shard (seconds)
+    :param rows: Dictionary of sensor name -> number of PDWs
+    :return: Shard result dictionary
+    """
+    result = {
+        'shard': task['shard'],
+        'start_time': shard_start,
+        'end_time': shard_end,
+        'radars': {radar.name: radar.emission_state(shard_start) for radar in scenario.radars},
+        'end_radars': {radar.name: radar.emission_state(shard_end) for radar in scenario.radars},
+        'rows': rows,
+    }
+    with open(os.path.join(task['directory'], SHARD_RESULT_FILE), 'w') as f:
+        json.dump(result, f, indent=2)
+    return result
+
+def read_shard_result(task):
+    with open(os.path.join(task['directory'], SHARD_RESULT_FILE)) as f:
+        return json.load(f)
+
+
+class Launcher:
+    """
+    Runs shard tasks. A launcher only has to execute run_shard(task) for every
+    task (or `python sharding.py <task.json>` on a machine that sees
+    task['directory']) and return once all shards have finished; the results
+    are read back from the shard directories.
+    """
+
+    def run(self, tasks):
+        raise NotImplementedError
+
+
+class InlineLauncher(Launcher):
+    """
+    Runs the shards one after another in the current process.
+    """
+
+    def run(self, tasks):
+        for task in tasks:
+            run_shard(task)
+
+
+class LocalProcessLauncher(Launcher):
+    """
+    Runs the shards in a pool of local processes (reference launcher).
+    """
+
+    def __init__(self, workers=None):
+        """
+        :param workers: Number of processes, default the number of CPUs
+        """
+        self.workers = workers
+
+    def run(self, tasks):
+        sys.stdout.flush()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(run_shard, tasks))
+
+
+def load_shard_table(directory, categories):
+    """
+    Memory-map a shard table with its category codes translated to common category lists.
+
+    :param directory: Table directory
+    :param categories: Dictionary of column name -> list of all categories
+    :return: Dictionary of column arrays
+    """
+    table, schema = load_columns(directory)
+    for name, values in schema['categories'].items():
+        lookup = np.array([categories[name].index(value) for value in values], dtype=np.int32)
+        table[name] = lookup[table[name]]
+    return table
+
+def iter_chunks(batches, chunk_size=MERGE_CHUNK_SIZE):
+    """
+    Split batches into in-memory batches of at most chunk_size rows.
+
+    :param batches: Iterable of batches (e.g. memory-mapped slices)
+    :param chunk_size: Maximum rows per batch
+    :return: Generator of batches
+    """
+    for batch in batches:
+        n = batch_length(batch)
+        for start in range(0, n, chunk_size):
+            yield {name: np.array(column) for name, column in take_batch(batch, slice(start, start + chunk_size)).items()}
+
+def decode_batch(batch, categories):
+    return {name: np.array(categories[name])[column] if name in categories else column
+            for name, column in batch.items()}
+
+def merge_shards(tasks, sensors, radar_names, output_dir, truth=False, precision=None, output_format='csv',
+                 chunk_size=MERGE_CHUNK_SIZE, compress=False, write_buffers=DEFAULT_WRITE_BUFFERS):
+    """
+    Merge the shard tables into one TOA-sorted PDW file per sensor.
+
+    PDWs are merged in TOA order (the measured TOAs of neighbouring shards can
+    interleave) and the sensors' overlap rules are applied to the merged stream.
+    Truth tables are concatenated in shard order; for sensors with an overlap
+    rule they are read along with the PDWs to fill in Delivered and OverlapGroup.
+
+    :param tasks: Shard tasks, in time order
+    :param sensors: Sensor objects
+    :param radar_names: Radar names of the scenario
+    :param output_dir: Directory receiving pdw_<sensor>.csv files
+    :param truth: Also write truth_<sensor>.csv files
+    :param precision: PrecisionPolicy defining the output schema
+    :param output_format: 'csv' or 'columnar'
+    :param chunk_size: Rows per batch while merging
+    :param compress: Write gzip-compressed CSV files
+    :param write_buffers: Column buffers of the background writer, 0 to write in the merging thread
+    """
+    output = SortedOutput([sensor.name for sensor in sensors], output_dir, truth, precision=precision,
+                          output_format=output_format, compress=compress, write_buffers=write_buffers)
+    try:
+        for sensor in sensors:
+            categories = {'SensorID': [sensor.name], 'RadarID': list(radar_names)}
+            tables = [load_shard_table(os.path.join(task['directory'], f"pdw_{sensor.name}"), categories)
+                      for task in tasks]
+            overlap_filter = (OverlapFilter(sensor.overlap_rule, sensor.dead_time, outcomes=truth)
+                              if sensor.overlap_rule else None)
+            truth_chunks = None
+            if truth:
+                truth_tables = [load_shard_table(os.path.join(task['directory'], f"truth_{sensor.name}"), categories)
+                                for task in tasks]
+                truth_chunks = (decode_batch(batch, categories) for batch in iter_chunks(truth_tables, chunk_size))
+            truth_joiner = TruthJoiner() if truth and overlap_filter is not None else None
+            for batch in iter_chunks(kway_merge(tables), chunk_size):
+                batch = decode_batch(batch, categories)
+                if truth_joiner is not None:
+                    # Read the truth rows about level with the PDWs, so few of them wait for their outcomes
+                    for chunk in truth_chunks:
+                        truth_joiner.add_truth(chunk)
+                        if chunk['TOA'][-1] >= batch['TOA'][-1]:
+                            break
+                if overlap_filter is not None:
+                    batch = overlap_filter.process(batch)
+                if batch is not None:
+                    output.write(sensor, batch)
+                if truth_joiner is not None:
+                    truth_joiner.add_outcomes(overlap_filter.take_outcomes())
+                    released = truth_joiner.release()
+                    if released is not None:
+                        output.truth_handler(sensor, released)
+            if overlap_filter is not None:
+                batch = overlap_filter.flush()
+                if batch is not None:
+                    output.write(sensor, batch)
+            if truth_joiner is not None:
+                for chunk in truth_chunks:
+                    truth_joiner.add_truth(chunk)
+                truth_joiner.add_outcomes(overlap_filter.take_outcomes())
+                truth_chunks = [truth_joiner.flush()]
+            for batch in truth_chunks or []:
+                if batch is not None:
+                    output.truth_handler(sensor, batch)
+    finally:
+        output.close()
+
+def run_sharded_simulation(config, n_shards, output_dir, seed, lookahead=DEFAULT_TOA_LOOKAHEAD, truth=False,
+                           launcher=None, keep_shards=False, output_format='csv', compress=False,
+                           write_buffers=DEFAULT_WRITE_BUFFERS):
+    """
+    Run the sorted PDW simulation split into time shards and merge the results.
+
+    The output is deterministic for a given seed and number of shards.
+
+    :param config: Configuration dictionary (as loaded from the YAML file)
+    :param n_shards: Number of time shards
+    :param output_dir: Directory receiving pdw_<sensor>.csv files
+    :param seed: Random seed shared by all shards
+    :param lookahead: Bound on the TOA measurement error (seconds)
+    :param truth: Also write truth_<sensor>.csv files with every emitted pulse
+    :param launcher: Launcher running the shards, default LocalProcessLauncher()
+    :param keep_shards: Keep the shard tables in <output_dir>/shards after merging
+    :param output_format: 'csv' or 'columnar'
+    :param compress: Write gzip-compressed CSV files
+    :param write_buffers: Column buffers of the background writer used while merging
+    """
+    tasks = make_shard_tasks(config, n_shards, output_dir, seed, lookahead, truth)
+    run_shard_tasks(tasks, launcher)
+
+    precision = PrecisionPolicy(config['scenario'].get('precision'))
+    sensors = [Sensor(sensor_config, precision) for sensor_config in config['sensors']]
+    radar_names = [radar_config['name'] for radar_config in config['radars']]
+    merge_shards(tasks, sensors, radar_names, output_dir, truth, precision, output_format, compress=compress,
+                 write_buffers=write_buffers)
+    if not keep_shards:
+        shutil.rmtree(os.path.join(output_dir, 'shards'))
+
+def run_sharded_aggregate(config, n_shards, filename, seed, launcher=None, keep_shards=False):
+    """
+    Run the aggregate-only simulation split into time shards and merge the statistics.
+
+    :param config: Configuration dictionary (as loaded from the YAML file)
+    :param n_shards: Number of time shards
+    :param filename: Summary file; the shard states go to <its directory>/shards
+    :param seed: Random seed shared by all shards
+    :param launcher: Launcher running the shards, default LocalProcessLauncher()
+    :param keep_shards: Keep the shard states after merging
+    """
+    output_dir = os.path.dirname(os.path.abspath(filename))
+    tasks = make_shard_tasks(config, n_shards, output_dir, seed, aggregate=True)
+    run_shard_tasks(tasks, launcher)
+
+    aggregator = None
+    for task in tasks:
+        with open(os.path.join(task['directory'], SHARD_STATISTICS_FILE)) as f:
+            shard_aggregator = StatisticsAggregator.from_state(json.load(f))
+        if aggregator is None:
+            aggregator = shard_aggregator
+        else:
+            aggregator.merge(shard_aggregator)
+    aggregator.write_summary(filename)
+    if not keep_shards:
+        shutil.rmtree(os.path.join(output_dir, 'shards'))
+
+def run_shard_tasks(tasks, launcher=None):
+    """
+    Run shard tasks and check that consecutive shards agree on the emission schedules at their boundary.
+
+    :param tasks: Shard tasks
+    :param launcher: Launcher running the shards, default LocalProcessLauncher()
+    :return: List of shard results
+    """
+    launcher = launcher or LocalProcessLauncher()
+    print(f"Running {len(tasks)} time shards with {type(launcher).__name__}")
+    launcher.run(tasks)
+
+    results = [read_shard_result(task) for task in tasks]
+    for previous, result in zip(results, results[1:]):
+        for name, state in previous['end_radars'].items():
+            start_state = result['radars'][name]
+            if (state['pulse_index'], state['pattern_phase']) != (start_state['pulse_index'],
+                                                                  start_state['pattern_phase']):
+                raise ValueError(f"Shards {previous['shard']} and {result['shard']} built different emission "
+                                 f"schedules for {name}; the scenario must be reproducible from the seed")
+    for result in results:
+        print(f"Shard {result['shard']}: {result['start_time']} - {result['end_time']} s, "
+              f"{sum(result['rows'].values())} PDWs, radar state at start {result['radars']}")
+    return results
+
+
+if __name__ == "__main__":
+    # Entry point for launchers that dispatch shards to other machines
+    with open(sys.argv[1]) as f:
+        run_shard(json.load(f))
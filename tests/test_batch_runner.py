@@ -0,0 +1,52 @@
+import json
+import os
+import pytest
+import yaml
+from batch_runner import BATCH_MANIFEST_FILE, load_batch, run_batch
+from pdw_dataset import DATASET_FILE
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.yaml')
+
+
+@pytest.fixture
+def batch(tmp_path):
+    with open(CONFIG_FILE) as f:
+        config = yaml.safe_load(f)
+    # The first scenario in file order is the cheaper one
+    for name, end_time in [('a_short', 2.5), ('b_long', 4)]:
+        config['scenario']['end_time'] = end_time
+        with open(tmp_path / f"{name}.yaml", 'w') as f:
+            yaml.safe_dump(config, f)
+    manifest = tmp_path / 'batch.json'
+    with open(manifest, 'w') as f:
+        json.dump([{'config': 'a_short.yaml', 'seed': 9}, 'b_long.yaml'], f)
+    return manifest
+
+
+def test_load_batch(batch):
+    entries = load_batch(str(batch))
+    assert [(entry['name'], entry['seed']) for entry in entries] == [('a_short', 9), ('b_long', None)]
+    assert entries[0]['config'] == os.path.join(os.path.dirname(str(batch)), 'a_short.yaml')
+    assert [entry['name'] for entry in load_batch(os.path.dirname(str(batch)))] == ['a_short', 'b_long']
+
+
+def test_largest_cost_first_and_manifest(batch, tmp_path):
+    output_dir = str(tmp_path / 'out')
+    records = run_batch(str(batch), output_dir, workers=1, seed=5)
+    assert [record['name'] for record in records] == ['b_long', 'a_short']
+    assert records[0]['estimated_cost'] > records[1]['estimated_cost']
+
+    with open(os.path.join(output_dir, BATCH_MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    scenarios = manifest['scenarios']
+    assert [scenario['name'] for scenario in scenarios] == ['b_long', 'a_short']
+    assert [scenario['seed'] for scenario in scenarios] == [5, 9]
+    assert manifest['elapsed'] > 0
+    for scenario in scenarios:
+        assert scenario['status'] == 'done'
+        with open(os.path.join(scenario['directory'], DATASET_FILE)) as f:
+            rows = {name: table['rows'] for name, table in json.load(f)['sensors'].items()}
+        assert scenario['pdws'] == rows
+        assert scenario['pulses'] > 0 and scenario['estimated_pdws'] > 0
+        assert scenario['simulate_time'] <= scenario['total_time']
+    assert scenarios[0]['pulses'] > scenarios[1]['pulses']
@@ -0,0 +1,69 @@
+import copy
+import filecmp
+import os
+import numpy as np
+import pytest
+import yaml
+from checkpoint import Checkpointer
+from pdw_stream import run_sorted_simulation
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.yaml')
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture(scope='module')
+def config():
+    with open(CONFIG_FILE) as f:
+        config = yaml.safe_load(f)
+    config['scenario']['end_time'] = 3
+    for sensor in config['sensors']:
+        sensor['overlap'] = {'rule': 'merge', 'dead_time': '4e-4 s'}
+    return config
+
+
+def run(config, output_dir, cache_dir, seed=6, **kwargs):
+    from main import create_scenario
+
+    np.random.seed(seed)
+    scenario = create_scenario(copy.deepcopy(config))
+    run_sorted_simulation(scenario, str(output_dir), rng=np.random.default_rng(seed), truth=True,
+                          cache_dir=str(cache_dir), checkpoint_interval=0, **kwargs)
+
+
+def compare_dirs(expected, result):
+    names = sorted(os.listdir(expected))
+    assert sorted(os.listdir(result)) == names
+    for name in names:
+        if os.path.isdir(os.path.join(expected, name)):
+            compare_dirs(os.path.join(expected, name), os.path.join(result, name))
+        else:
+            assert filecmp.cmp(os.path.join(expected, name), os.path.join(result, name), shallow=False), name
+
+
+def test_resume_matches_uninterrupted_run(config, tmp_path, monkeypatch):
+    run(config, tmp_path / 'expected', tmp_path / 'expected_cache')
+
+    save = Checkpointer.save
+    interrupted = []
+
+    def save_and_interrupt(self, next_window, window_start, stage, output, cache_writer=None):
+        save(self, next_window, window_start, stage, output, cache_writer)
+        # Stop at a window boundary where an overlap group is still held back
+        if next_window >= 5 and stage.held_toa() < np.inf:
+            interrupted.append(next_window)
+            raise Interrupted()
+
+    checkpoint = str(tmp_path / 'run.ckpt')
+    monkeypatch.setattr(Checkpointer, 'save', save_and_interrupt)
+    with pytest.raises(Interrupted):
+        run(config, tmp_path / 'result', tmp_path / 'cache', checkpoint=checkpoint)
+    monkeypatch.setattr(Checkpointer, 'save', save)
+    assert interrupted and os.path.exists(checkpoint)
+
+    run(config, tmp_path / 'result', tmp_path / 'cache', checkpoint=checkpoint, resume=True)
+    assert not os.path.exists(checkpoint)
+    compare_dirs(tmp_path / 'expected', tmp_path / 'result')
+    compare_dirs(tmp_path / 'expected_cache', tmp_path / 'cache')
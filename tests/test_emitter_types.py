@@ -0,0 +1,82 @@
+import copy
+import filecmp
+import os
+import numpy as np
+import pytest
+import yaml
+from emitter_types import EMITTER_TYPE_FIELDS, INSTANCE_OVERRIDES, EmitterType
+from pdw_stream import run_sorted_simulation
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.yaml')
+
+
+@pytest.fixture(scope='module')
+def expanded_config():
+    with open(CONFIG_FILE) as f:
+        config = yaml.safe_load(f)
+    config['scenario']['end_time'] = 3
+    radars = []
+    for radar in config['radars']:
+        # A second instance of every radar, starting earlier (so emitting longer) than the first
+        other = copy.deepcopy(radar)
+        other['name'] = radar['name'] + 'b'
+        other['start_position'] = [x + 300 for x in radar['start_position']]
+        other['rotation_params']['alpha0'] = 1.0
+        radar['start_time'] = 0.5
+        radars += [radar, other]
+    config['radars'] = radars
+    return config
+
+
+@pytest.fixture(scope='module')
+def typed_config(expanded_config):
+    config = copy.deepcopy(expanded_config)
+    config['emitter_types'] = {}
+    for radar in config['radars']:
+        name = radar['name'].rstrip('b') + 'Type'
+        config['emitter_types'][name] = {field: radar[field] for field in EMITTER_TYPE_FIELDS}
+        for field in EMITTER_TYPE_FIELDS:
+            if field not in INSTANCE_OVERRIDES:
+                del radar[field]
+        radar['type'] = name
+    return config
+
+
+def run(config, output_dir, seed=11):
+    from main import create_scenario
+
+    np.random.seed(seed)
+    scenario = create_scenario(copy.deepcopy(config))
+    run_sorted_simulation(scenario, str(output_dir), rng=np.random.default_rng(seed))
+    return scenario
+
+
+def test_typed_laydown_matches_expanded_config(expanded_config, typed_config, tmp_path):
+    run(expanded_config, tmp_path / 'expanded')
+    scenario = run(typed_config, tmp_path / 'typed')
+    names = sorted(os.listdir(tmp_path / 'expanded'))
+    assert names == sorted(os.listdir(tmp_path / 'typed'))
+    for name in names:
+        assert filecmp.cmp(tmp_path / 'expanded' / name, tmp_path / 'typed' / name, shallow=False), name
+
+    radars = {radar.name: radar for radar in scenario.radars}
+    for name in ('Radar1', 'Radar2'):
+        first, second = radars[name], radars[name + 'b']
+        assert first.emitter_type is second.emitter_type
+        # Deterministic schedules are shared; Radar1's jittered pulse widths are drawn per instance
+        assert np.shares_memory(first.pulse_times, second.pulse_times)
+        assert np.shares_memory(first.frequencies, second.frequencies)
+        assert np.shares_memory(first.pulse_widths, second.pulse_widths) == (name == 'Radar2')
+        assert not first.pulse_times.flags.writeable
+
+
+def test_longer_instance_after_tables_are_built():
+    emitter_type = EmitterType('Type', {'pri_type': 'fixed', 'pri_params': {'pri': 0.001}})
+    emitter_type.add_instance(1.0, 2.0)
+    emitter_type.add_instance(0.0, 2.0)
+    table = emitter_type.table('pri')
+    assert table[-1] < 2.0 <= table[-1] + 0.001 + 1e-12
+    emitter_type.add_instance(0.5, 2.0)
+    assert emitter_type.table('pri') is table
+    with pytest.raises(ValueError):
+        emitter_type.add_instance(-1.0, 2.0)
@@ -0,0 +1,80 @@
+import copy
+import os
+import numpy as np
+import pytest
+import yaml
+import kernels
+
+pytest.importorskip('numba')
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.yaml')
+
+
+@pytest.fixture
+def restore_backend():
+    backend = kernels.get_backend()
+    yield
+    kernels.set_backend(backend)
+
+
+@pytest.mark.parametrize('pri_sequence', [[0.001], [0.001, 0.0012, 0.0011, 0.0013], np.linspace(9e-4, 1.3e-3, 7)])
+@pytest.mark.parametrize('start_time', [0.0, 0.3])
+def test_pri_schedule(pri_sequence, start_time):
+    schedules = [kernels.pri_schedule(start_time, 20.0, pri_sequence, backend) for backend in kernels.BACKENDS]
+    assert len(schedules[0]) > 0
+    np.testing.assert_array_equal(*schedules)
+
+
+def test_pri_schedule_empty():
+    for backend in kernels.BACKENDS:
+        assert len(kernels.pri_schedule(1.0, 1.0, [0.001], backend)) == 0
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_threshold_walk(seed):
+    rng = np.random.default_rng(seed)
+    thresholds = np.sort(rng.uniform(-90, -40, 5))
+    steps = np.concatenate(([0.0], np.sort(rng.uniform(0, 1, 5))))
+    amplitude = rng.uniform(-100, -30, 100000)
+    amplitude[:5] = thresholds
+    amplitude[5] = np.nan
+    saturated = amplitude > -35
+    uniform = rng.random(len(amplitude))
+    detected = [kernels.threshold_walk(amplitude, thresholds, steps, saturated, uniform, backend)
+                for backend in kernels.BACKENDS]
+    np.testing.assert_array_equal(*detected)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_overlap_group_starts(seed):
+    rng = np.random.default_rng(seed)
+    toa = np.sort(rng.uniform(0, 1, 100000))
+    busy_end = toa + rng.uniform(1e-7, 1e-4, len(toa))
+    starts = [kernels.overlap_group_starts(toa, busy_end, backend) for backend in kernels.BACKENDS]
+    assert 0 < starts[0].sum() < len(toa)
+    np.testing.assert_array_equal(*starts)
+
+
+def run_sorted(config, output_dir, backend, seed):
+    from main import create_scenario
+    from pdw_stream import run_sorted_simulation
+
+    kernels.set_backend(backend)
+    np.random.seed(seed)
+    scenario = create_scenario(copy.deepcopy(config))
+    run_sorted_simulation(scenario, str(output_dir), rng=np.random.default_rng(seed), truth=True)
+    return {name: (output_dir / name).read_bytes() for name in sorted(os.listdir(output_dir))}
+
+
+def test_sorted_output(tmp_path, restore_backend):
+    with open(CONFIG_FILE) as f:
+        config = yaml.safe_load(f)
+    config['scenario']['end_time'] = 3
+    # Exercise every kernel: a stagger PRI, a step detection curve and an overlap rule
+    config['radars'][0]['pri_type'] = 'stagger'
+    config['radars'][0]['pri_params'] = {'pri_pattern': [0.001, 0.0012, 0.0011, 0.0013]}
+    config['sensors'][0]['overlap'] = {'rule': 'strongest', 'dead_time': '50e-6 s'}
+
+    outputs = [run_sorted(config, tmp_path / backend, backend, seed=5) for backend in kernels.BACKENDS]
+    assert any(name.startswith('pdw_') for name in outputs[0])
+    assert outputs[0] == outputs[1]
@@ -0,0 +1,54 @@
+import copy
+import gzip
+import os
+import numpy as np
+import pytest
+import yaml
+from pdw_dataset import PdwDataset
+from pdw_stream import run_sorted_simulation
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.yaml')
+
+
+@pytest.fixture(scope='module')
+def config():
+    with open(CONFIG_FILE) as f:
+        config = yaml.safe_load(f)
+    config['scenario']['end_time'] = 3
+    return config
+
+
+def run(config, output_dir, compress, seed=5):
+    from main import create_scenario
+
+    np.random.seed(seed)
+    scenario = create_scenario(copy.deepcopy(config))
+    run_sorted_simulation(scenario, str(output_dir), rng=np.random.default_rng(seed), compress=compress)
+    return PdwDataset(str(output_dir))
+
+
+def test_compressed_queries_match(config, tmp_path):
+    plain = run(config, tmp_path / 'plain', False)
+    compressed = run(config, tmp_path / 'compressed', True)
+    for toa in [None, (0.5, 0.75), (1.2, 2.9), (10, 11)]:
+        expected = plain.query(toa=toa)
+        result = compressed.query(toa=toa)
+        for name in plain.columns:
+            np.testing.assert_array_equal(result[name], expected[name])
+
+
+def test_index_entries_are_gzip_members(config, tmp_path):
+    dataset = run(config, tmp_path, True)
+    for sensor in dataset.sensors:
+        index = dataset.index(sensor)
+        assert len(index) > 1
+        with open(dataset.path(sensor, 'path'), 'rb') as f:
+            data = f.read()
+        lines = 0
+        for entry in index:
+            # Every block decompresses without the bytes before it
+            text = gzip.decompress(data[entry['byte_start']:entry['byte_stop']]).decode()
+            assert text.count('\n') == entry['row_stop'] - entry['row_start']
+            lines += text.count('\n')
+        assert index['byte_stop'][-1] == len(data)
+        assert lines == dataset.metadata['sensors'][sensor]['rows']
@@ -0,0 +1,108 @@
+import asyncio
+import copy
+import os
+import time
+from types import SimpleNamespace
+import numpy as np
+import pytest
+import yaml
+import pdw_loader
+from pdw_loader import PdwIterableDataset, aiter_pdw_batches
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.yaml')
+
+
+@pytest.fixture(scope='module')
+def config():
+    with open(CONFIG_FILE) as f:
+        config = yaml.safe_load(f)
+    config['scenario']['end_time'] = 3
+    for sensor in config['sensors']:
+        sensor.pop('overlap', None)
+        # Detect every pulse above the lowest level, so the PDWs do not depend on the worker seeds
+        sensor['detection_probability']['probability'] = [100] * len(sensor['detection_probability']['level'])
+    return config
+
+
+def pdw_keys(batches):
+    keys = []
+    for batch in batches:
+        assert np.all(np.diff(batch['TOA']) >= 0)
+        assert len(set(batch['SensorID'])) == 1
+        keys.extend(zip(batch['SensorID'], batch['RadarID'], batch['PulseIndex'].tolist()))
+    return keys
+
+
+def iterate_workers(monkeypatch, dataset, num_workers, base_seed=1000):
+    keys = []
+    for worker_id in range(num_workers):
+        worker = SimpleNamespace(id=worker_id, num_workers=num_workers, seed=base_seed + worker_id)
+        monkeypatch.setattr(pdw_loader, 'get_worker_info', lambda: worker)
+        keys.append(pdw_keys(dataset))
+    return keys
+
+
+@pytest.mark.parametrize('seed', [9, None])
+def test_workers_cover_the_scenario_once(config, monkeypatch, seed):
+    dataset = PdwIterableDataset(copy.deepcopy(config), batch_size=500, seed=seed)
+    single = iterate_workers(monkeypatch, dataset, 1)[0]
+    workers = iterate_workers(monkeypatch, dataset, 3)
+    assert all(workers)
+    union = [key for keys in workers for key in keys]
+    assert len(set(union)) == len(union)
+    assert sorted(union) == sorted(single)
+
+
+@pytest.mark.parametrize('seed', [9, None])
+def test_workers_share_schedules_and_measure_with_distinct_seeds(monkeypatch, seed):
+    dataset = PdwIterableDataset({}, seed=seed)
+    seeds = []
+    for worker_id in range(3):
+        worker = SimpleNamespace(id=worker_id, num_workers=3, seed=1000 + worker_id)
+        monkeypatch.setattr(pdw_loader, 'get_worker_info', lambda: worker)
+        schedule_seed, measurement_seed = dataset.worker_seeds()
+        seeds.append((schedule_seed, tuple(measurement_seed.generate_state(2))))
+    assert len({schedule_seed for schedule_seed, _ in seeds}) == 1
+    assert len({measurement for _, measurement in seeds}) == 3
+
+
+def fake_batches(produced, n):
+    for i in range(n):
+        produced.append(i)
+        yield {'TOA': np.array([float(i)])}
+
+
+def test_async_producer_waits_for_slow_consumer(monkeypatch):
+    produced = []
+    monkeypatch.setattr(pdw_loader, 'iter_pdw_batches', lambda *args: fake_batches(produced, 30))
+
+    async def consume():
+        ahead = []
+        received = []
+        async for batch in aiter_pdw_batches(None, max_pending=3):
+            received.append(batch['TOA'][0])
+            await asyncio.sleep(0.005)
+            ahead.append(len(produced) - len(received))
+        return received, ahead
+
+    received, ahead = asyncio.run(consume())
+    assert received == list(range(30))
+    # The queue holds max_pending batches and the producer waits with one more
+    assert max(ahead) <= 3 + 1
+    assert max(ahead) >= 3
+
+
+def test_async_early_exit_stops_producer(monkeypatch):
+    produced = []
+    monkeypatch.setattr(pdw_loader, 'iter_pdw_batches', lambda *args: fake_batches(produced, 1000))
+
+    async def consume():
+        async for batch in aiter_pdw_batches(None, max_pending=2):
+            if batch['TOA'][0] == 1:
+                break
+
+    asyncio.run(consume())
+    n = len(produced)
+    time.sleep(0.05)
+    assert len(produced) == n
+    assert n <= 2 + 4
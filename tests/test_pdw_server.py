@@ -0,0 +1,87 @@
+import copy
+import os
+import threading
+import time
+import numpy as np
+import pytest
+import yaml
+from pdw_server import PdwClient, iter_frames, run_server
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.yaml')
+
+
+@pytest.fixture(scope='module')
+def config():
+    with open(CONFIG_FILE) as f:
+        config = yaml.safe_load(f)
+    config['scenario']['end_time'] = 3
+    return config
+
+
+@pytest.mark.parametrize('dead_time', ['1.5e-3 s', '3e-3 s'])
+def test_frames_in_toa_order_under_merge(config, dead_time):
+    from main import create_scenario
+
+    config = copy.deepcopy(config)
+    for sensor in config['sensors']:
+        sensor['overlap'] = {'rule': 'merge', 'dead_time': dead_time}
+    np.random.seed(3)
+    scenario = create_scenario(config)
+    frames = list(iter_frames(scenario, rng=np.random.default_rng(3)))
+    frame_times = np.array([frame_time for frame_time, _ in frames])
+    toa = np.concatenate([batch['TOA'] for _, batch in frames])
+    assert len(toa)
+    assert np.all(np.diff(frame_times) > 0)
+    assert np.all(np.diff(toa) >= 0)
+    for frame_time, batch in frames:
+        assert np.all(batch['TOA'] < frame_time)
+
+
+def serve_in_thread(scenario, address):
+    result = {}
+
+    def serve():
+        try:
+            result['report'] = run_server(scenario, address, speed=0)
+        except Exception as error:
+            result['error'] = error
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    return thread, result
+
+
+def connect(address, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return PdwClient(address, timeout=timeout)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
+
+
+def test_client_disconnect_ends_stream(config, tmp_path):
+    from main import create_scenario
+
+    address = f"unix://{tmp_path / 'pdw.sock'}"
+    scenario = create_scenario(copy.deepcopy(config))
+    thread, result = serve_in_thread(scenario, address)
+    with connect(address) as client:
+        next(iter(client))
+    thread.join(30)
+    assert not thread.is_alive()
+    assert 'error' not in result
+    assert result['report']['disconnected']
+    assert not (tmp_path / 'pdw.sock').exists()
+
+
+def test_refuses_to_replace_other_files(config, tmp_path):
+    from main import create_scenario
+
+    path = tmp_path / 'pdw.sock'
+    path.write_text('data')
+    with pytest.raises(ValueError):
+        run_server(create_scenario(copy.deepcopy(config)), f"unix://{path}")
+    assert path.read_text() == 'data'
@@ -0,0 +1,117 @@
+import copy
+import os
+import numpy as np
+import pytest
+import yaml
+from pdw_batch import measure_pulse_batch
+from pdw_stats import (AMPLITUDE_BINS, DEFAULT_SKETCH_CAPACITY, FixedHistogram, QuantileSketch, RunningMoments,
+                       StatisticsAggregator, aggregate_windows, default_rate_bin)
+from pdw_stream import iter_true_pulses
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.yaml')
+
+
+def split(values, rng, parts):
+    return np.split(values, np.sort(rng.integers(0, len(values), parts - 1)))
+
+
+def test_moments_merge_matches_numpy():
+    rng = np.random.default_rng(1)
+    values = np.concatenate((rng.normal(1e3, 5, 5000), rng.uniform(-3, 3, 3000)))
+    workers = [RunningMoments() for _ in range(3)]
+    for i, chunk in enumerate(split(values, rng, 20)):
+        workers[i % 3].update(chunk)
+    moments = workers[0]
+    for worker in workers[1:]:
+        moments.merge(worker)
+    summary = moments.summary()
+    assert summary['count'] == len(values)
+    assert summary['mean'] == pytest.approx(values.mean(), rel=1e-12)
+    assert summary['std'] == pytest.approx(values.std(), rel=1e-10)
+    assert (summary['min'], summary['max']) == (values.min(), values.max())
+
+
+def test_histogram_matches_numpy():
+    rng = np.random.default_rng(2)
+    lo, hi, bins = AMPLITUDE_BINS
+    values = rng.uniform(lo - 20, hi + 20, 10000)
+    histogram = FixedHistogram(lo, hi, bins)
+    other = FixedHistogram(lo, hi, bins)
+    for i, chunk in enumerate(split(values, rng, 10)):
+        (histogram if i % 2 else other).update(chunk)
+    histogram.merge(other)
+    summary = histogram.summary()
+    expected, _ = np.histogram(values, bins=np.linspace(lo, hi, bins + 1))
+    # np.histogram closes the last bin on the right; FixedHistogram counts hi as overflow
+    expected[-1] -= np.count_nonzero(values == hi)
+    assert summary['counts'] == expected.tolist()
+    assert summary['underflow'] == np.count_nonzero(values < lo)
+    assert summary['overflow'] == np.count_nonzero(values >= hi)
+    with pytest.raises(ValueError):
+        histogram.merge(FixedHistogram(lo, hi, bins * 2))
+
+
+@pytest.mark.parametrize('capacity', [64, 256])
+def test_sketch_rank_error_bound(capacity):
+    rng = np.random.default_rng(3)
+    values = rng.lognormal(0, 2, 100000)
+    workers = [QuantileSketch(capacity) for _ in range(4)]
+    for i, chunk in enumerate(split(values, rng, 300)):
+        workers[i % 4].update(chunk)
+    sketch = workers[0]
+    for worker in workers[1:]:
+        sketch.merge(worker)
+    assert sketch.count == len(values)
+    qs = np.linspace(0.01, 0.99, 99)
+    ranks = np.searchsorted(np.sort(values), sketch.quantiles(qs), side='right') / len(values)
+    # Rank error of the order of log2(n / capacity) / capacity (DEFAULT_SKETCH_CAPACITY comment)
+    assert np.max(np.abs(ranks - qs)) <= np.log2(len(values) / capacity) / capacity
+
+
+def test_aggregated_run_matches_numpy():
+    from main import create_scenario
+
+    with open(CONFIG_FILE) as f:
+        config = yaml.safe_load(f)
+    config['scenario']['end_time'] = 3
+    np.random.seed(4)
+    scenario = create_scenario(copy.deepcopy(config))
+    n_windows = len(list(scenario.time_windows()))
+    start, end = scenario.start_time.magnitude, scenario.end_time.magnitude
+
+    # Two shards of windows aggregated separately and merged, with the same draws as one pass
+    rng = np.random.default_rng(5)
+    aggregator = StatisticsAggregator(start, end, default_rate_bin(scenario))
+    second = StatisticsAggregator(start, end, default_rate_bin(scenario))
+    aggregate_windows(scenario, aggregator, rng, 0, n_windows // 2)
+    aggregate_windows(scenario, second, rng, n_windows // 2)
+    aggregator.merge(StatisticsAggregator.from_state(second.get_state()))
+
+    rng = np.random.default_rng(5)
+    amplitudes = {}
+    emitted = {}
+    for _, _, batches in iter_true_pulses(scenario):
+        for sensor, sensor_batches in zip(scenario.sensors, batches):
+            for radar, true_batch in zip(scenario.radars, sensor_batches):
+                if true_batch is None:
+                    continue
+                pdw_batch, truth = measure_pulse_batch(sensor, radar.name, true_batch, rng)
+                key = (sensor.name, radar.name)
+                amplitudes.setdefault(key, []).append(pdw_batch['Amplitude'].astype(np.float64))
+                emitted[key] = emitted.get(key, 0) + len(truth['Detected'])
+
+    assert set(aggregator.links) == set(amplitudes)
+    lo, hi, bins = AMPLITUDE_BINS
+    for key, link in aggregator.links.items():
+        values = np.concatenate(amplitudes[key])
+        summary = link.summary()
+        assert (summary['emitted'], summary['detected']) == (emitted[key], len(values))
+        amplitude = summary['amplitude']
+        assert amplitude['mean'] == pytest.approx(values.mean(), rel=1e-9)
+        assert amplitude['std'] == pytest.approx(values.std(), rel=1e-9)
+        assert amplitude['histogram']['counts'] == np.histogram(values, np.linspace(lo, hi, bins + 1))[0].tolist()
+        assert sum(summary['rate']['counts']) == len(values)
+        # Few enough values per link that the sketch has not compacted: exact quantiles
+        qs = [float(q) for q in amplitude['quantiles']]
+        ranks = np.searchsorted(np.sort(values), list(amplitude['quantiles'].values()), side='right') / len(values)
+        assert np.max(np.abs(ranks - qs)) <= 2 / DEFAULT_SKETCH_CAPACITY
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+from pdw_batch import concat_batches
+from pulse_overlap import OVERLAP_RULES, OverlapFilter, resolve_overlaps
+
+
+@pytest.mark.parametrize('rule', OVERLAP_RULES)
+@pytest.mark.parametrize('seed', range(5))
+def test_filter_matches_whole_stream(rule, seed):
+    rng = np.random.default_rng(seed)
+    n = 2000
+    batch = {
+        'TOA': np.sort(rng.uniform(0, 0.05, n)),
+        'PulseWidth': rng.uniform(1e-6, 1e-4, n),
+        'Amplitude': rng.integers(-60, -55, n).astype(float),
+        'PulseIndex': np.arange(n),
+    }
+    overlap_filter = OverlapFilter(rule, 5e-6)
+    cuts = np.concatenate(([0], np.sort(rng.integers(0, n, 20)), [n]))
+    delivered = [overlap_filter.process({name: column[start:end] for name, column in batch.items()})
+                 for start, end in zip(cuts[:-1], cuts[1:])]
+    delivered.append(overlap_filter.flush())
+
+    expected = resolve_overlaps(batch, 5e-6, rule)
+    streamed = concat_batches([b for b in delivered if b is not None])
+    for name in batch:
+        np.testing.assert_array_equal(streamed[name], expected[name])
@@ -0,0 +1,65 @@
+import copy
+import csv
+import os
+import numpy as np
+import pytest
+import yaml
+from pdw_stream import run_sorted_simulation
+from radar_properties import generate_frequencies, generate_pulse_widths, table_window
+from sharding import InlineLauncher, run_sharded_simulation
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.yaml')
+
+
+@pytest.mark.parametrize('duration', [0.0004, 0.0025, 1.0])
+@pytest.mark.parametrize('table_type, params', [
+    ('fixed', {'frequency': 9e9}),
+    ('stagger', {'frequency_pattern': [9e9, 9.1e9, 9.2e9]}),
+    ('switched', {'frequency_pattern': [9e9, 9.1e9], 'repetitions': [2, 3]}),
+])
+def test_table_window_matches_full_table(table_type, params, duration):
+    start_time = 2.0
+    table = generate_frequencies(table_type, params, start_time, start_time + duration)
+    assert len(table) >= 1
+    indices = np.arange(7, 40)
+    expected = table[indices % len(table)]
+    np.testing.assert_array_equal(table_window(table_type, params, 'frequency', start_time, start_time + duration,
+                                               7, len(indices)), expected)
+
+
+def test_radar_starting_after_the_end_has_tables():
+    assert len(generate_pulse_widths('fixed', {'pulse_width': 1e-6}, 5.0, 3.0)) == 1
+
+
+def true_pulses(filename):
+    # The emitted pulses, without the detection draws that differ between shards
+    with open(filename) as f:
+        rows = list(csv.DictReader(f))
+    return sorted(tuple(row[name] for name in ('RadarID', 'PulseIndex', 'EmissionTime', 'TOA', 'Amplitude',
+                                               'Frequency', 'PulseWidth', 'AOA')) for row in rows)
+
+
+@pytest.fixture(scope='module')
+def config():
+    with open(CONFIG_FILE) as f:
+        return yaml.safe_load(f)
+
+
+@pytest.mark.parametrize('end_time, radar_start', [
+    (0.3, 0),       # Sensor1 starts at 2 s, after the end
+    (3, 5),         # Radar2 starts after the end
+    (2.0005, 2),    # Radar2 emits for less than 1 ms
+])
+def test_short_and_late_objects(config, tmp_path, end_time, radar_start):
+    from main import create_scenario
+
+    config = copy.deepcopy(config)
+    config['scenario']['end_time'] = end_time
+    config['radars'][1]['start_time'] = radar_start
+    np.random.seed(1)
+    scenario = create_scenario(copy.deepcopy(config))
+    run_sorted_simulation(scenario, str(tmp_path / 'full'), rng=np.random.default_rng(1), truth=True)
+    run_sharded_simulation(config, 2, str(tmp_path / 'sharded'), 1, truth=True, launcher=InlineLauncher())
+    for sensor in scenario.sensors:
+        full, sharded = (true_pulses(tmp_path / run / f"truth_{sensor.name}.csv") for run in ('full', 'sharded'))
+        assert full == sharded
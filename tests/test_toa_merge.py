@@ -0,0 +1,69 @@
+import copy
+import os
+import numpy as np
+import pytest
+import yaml
+from pdw_batch import concat_batches, measure_pulse_batch, sort_batch
+from pdw_stream import MeasurementStage, iter_true_pulses, kway_merge
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.yaml')
+
+
+def row_multiset(batch):
+    columns = sorted(batch)
+    return sorted(zip(*(batch[name].tolist() for name in columns)))
+
+
+def test_kway_merge_sorts_and_keeps_rows():
+    rng = np.random.default_rng(1)
+    batches = []
+    for n in [0, 1, 50, 200, 3]:
+        # Rounded TOAs give ties within and across batches
+        toa = np.sort(rng.uniform(0, 1, n).round(2))
+        batches.append({'TOA': toa, 'Stream': np.full(n, len(batches))})
+    batches.append(None)
+    merged = concat_batches(list(kway_merge(batches)))
+    assert np.all(np.diff(merged['TOA']) >= 0)
+    assert row_multiset(merged) == row_multiset(concat_batches(batches))
+
+
+@pytest.fixture(scope='module')
+def config():
+    with open(CONFIG_FILE) as f:
+        config = yaml.safe_load(f)
+    config['scenario']['end_time'] = 3
+    for sensor in config['sensors']:
+        sensor.pop('overlap', None)
+        # Measurement errors several windows (time_step 0.1 s) long
+        sensor['toa_error']['arbitrary']['error'] = '0.2 s'
+    return config
+
+
+def test_merger_matches_unsorted_rows(config):
+    from main import create_scenario
+
+    np.random.seed(2)
+    scenario = create_scenario(copy.deepcopy(config))
+    windows = list(iter_true_pulses(scenario))
+
+    rng = np.random.default_rng(3)
+    unsorted = {sensor.name: [] for sensor in scenario.sensors}
+    for _, _, batches in windows:
+        for sensor, sensor_batches in zip(scenario.sensors, batches):
+            for radar, true_batch in zip(scenario.radars, sensor_batches):
+                if true_batch is not None:
+                    unsorted[sensor.name].append(measure_pulse_batch(sensor, radar.name, true_batch, rng)[0])
+
+    sorted_rows = {sensor.name: [] for sensor in scenario.sensors}
+    stage = MeasurementStage(scenario.sensors, [radar.name for radar in scenario.radars],
+                             scenario.end_time.magnitude, lookahead=2.0, rng=np.random.default_rng(3))
+    for window_start, window_end, batches in windows:
+        for sensor, batch in stage.process_window(window_start, window_end, batches):
+            sorted_rows[sensor.name].append(batch)
+
+    for sensor in scenario.sensors:
+        merged = concat_batches(sorted_rows[sensor.name])
+        expected = concat_batches(unsorted[sensor.name])
+        assert np.all(np.diff(merged['TOA']) >= 0)
+        assert row_multiset(merged) == row_multiset(expected)
+        np.testing.assert_array_equal(merged['TOA'], sort_batch(expected)['TOA'])
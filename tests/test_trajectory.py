@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from scenario_geometry_functions import Trajectory, calculate_trajectory, create_trajectory, move_straight_line
+
+WAYPOINTS = [[0, 0], [3000, 0], [3000, 4000]]
+
+
+def test_speed_and_times_give_the_same_path():
+    by_speed = Trajectory.from_waypoints(WAYPOINTS, speed=[300, 200], start_time=5)
+    # 3000 m at 300 m/s, then 4000 m at 200 m/s
+    by_times = Trajectory.from_waypoints(WAYPOINTS, times=[5, 15, 35])
+    np.testing.assert_allclose(by_speed.times, [5, 15, 35])
+    times = np.linspace(0, 50, 501)
+    np.testing.assert_allclose(by_speed.positions_at(times), by_times.positions_at(times), atol=1e-9)
+    np.testing.assert_allclose(by_speed.positions_at([10, 25]), [[1500, 0], [3000, 2000]])
+
+
+def test_single_speed_applies_to_every_leg():
+    path = Trajectory.from_waypoints(WAYPOINTS, speed=250)
+    np.testing.assert_allclose(path.times, [0, 12, 28])
+
+
+def test_holds_before_first_and_stops_at_last_waypoint():
+    path = Trajectory.from_waypoints(WAYPOINTS, times=[5, 15, 35])
+    np.testing.assert_allclose(path.positions_at([-10, 0, 5]), [[0, 0]] * 3)
+    np.testing.assert_allclose(path.positions_at([35, 40, 1e6]), [[3000, 4000]] * 3)
+
+
+def test_positions_keep_the_shape_of_the_times():
+    path = Trajectory.from_waypoints(WAYPOINTS, times=[5, 15, 35])
+    assert path.positions_at(10.0).shape == (2,)
+    assert path.positions_at(np.zeros((3, 4))).shape == (3, 4, 2)
+
+
+@pytest.mark.parametrize('kwargs, message', [
+    ({}, "either"),
+    ({'times': [0, 1, 2], 'speed': 10}, "either"),
+    ({'times': [0, 1]}, "waypoint times"),
+    ({'times': [0, 2, 2]}, "increasing"),
+    ({'speed': [10, 0]}, "positive"),
+])
+def test_invalid_waypoint_timing(kwargs, message):
+    with pytest.raises(ValueError, match=message):
+        Trajectory.from_waypoints(WAYPOINTS, **kwargs)
+
+
+@pytest.mark.parametrize('velocity', [None, [10, -5]])
+def test_straight_line_matches_move_straight_line(velocity):
+    start_position, start_time = [500, 500], 2.0
+    path = create_trajectory({'start_position': start_position, 'velocity': velocity}, start_time)
+    times = np.linspace(start_time, 12, 101)
+    expected = [move_straight_line(start_position, t, velocity, start_time).magnitude for t in times]
+    np.testing.assert_allclose(path.positions_at(times), expected, atol=1e-9)
+
+    table = np.array(calculate_trajectory(start_position, 12, 0.1, velocity, start_time))
+    np.testing.assert_allclose(path.sample(12, 0.1, start_time), table, atol=1e-9)
+
+
+def test_waypoints_cannot_have_a_velocity():
+    config = {'name': 'Radar1', 'velocity': [1, 0], 'trajectory': {'waypoints': WAYPOINTS, 'speed': 10}}
+    with pytest.raises(ValueError):
+        create_trajectory(config)
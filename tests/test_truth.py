@@ -0,0 +1,75 @@
+import copy
+import os
+import numpy as np
+import pytest
+import yaml
+from pdw_batch import concat_batches
+from pdw_stream import MeasurementStage, iter_true_pulses
+from pulse_overlap import OVERLAP_RULES
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.yaml')
+
+
+@pytest.fixture(scope='module')
+def config():
+    with open(CONFIG_FILE) as f:
+        config = yaml.safe_load(f)
+    config['scenario']['end_time'] = 3
+    return config
+
+
+def run_stage(config, rule, seed=4):
+    from main import create_scenario
+
+    config = copy.deepcopy(config)
+    for sensor in config['sensors']:
+        if rule is None:
+            sensor.pop('overlap', None)
+        else:
+            sensor['overlap'] = {'rule': rule, 'dead_time': '3e-4 s'}
+    np.random.seed(seed)
+    scenario = create_scenario(config)
+    names = [sensor.name for sensor in scenario.sensors]
+    pdws = {name: [] for name in names}
+    truth = {name: [] for name in names}
+    stage = MeasurementStage(scenario.sensors, [radar.name for radar in scenario.radars],
+                             scenario.end_time.magnitude, rng=np.random.default_rng(seed),
+                             truth_handler=lambda sensor, batch: truth[sensor.name].append(batch))
+    for window_start, window_end, batches in iter_true_pulses(scenario):
+        for sensor, batch in stage.process_window(window_start, window_end, batches):
+            pdws[sensor.name].append(batch)
+    return ({name: concat_batches(batches) for name, batches in pdws.items()},
+            {name: concat_batches(batches) for name, batches in truth.items()})
+
+
+def keys(batch, mask=None):
+    mask = np.ones(len(batch['PulseIndex']), dtype=bool) if mask is None else mask
+    return sorted(zip(batch['RadarID'][mask], batch['PulseIndex'][mask]))
+
+
+@pytest.mark.parametrize('rule', OVERLAP_RULES)
+def test_truth_joins_delivered_pdws(config, rule):
+    reference_pdws, reference_truth = run_stage(config, None)
+    pdws, truth = run_stage(config, rule)
+    for name in truth:
+        pdw, rows = pdws[name], truth[name]
+        # Same pulses, detection draws and order as without an overlap rule
+        for column, values in reference_truth[name].items():
+            if column not in ('Delivered', 'OverlapGroup'):
+                np.testing.assert_array_equal(rows[column], values)
+        np.testing.assert_array_equal(reference_truth[name]['Delivered'], reference_truth[name]['Detected'])
+        assert len(pdw['TOA']) < len(reference_pdws[name]['TOA'])
+
+        delivered, detected, group = rows['Delivered'], rows['Detected'], rows['OverlapGroup']
+        assert keys(rows, delivered) == keys(pdw)
+        assert not np.any(delivered & ~detected)
+        assert np.all(group[~detected] == -1)
+        assert np.all(group[detected] >= 0)
+        groups, sizes = np.unique(group[detected], return_counts=True)
+        np.testing.assert_array_equal(groups, np.arange(len(groups)))
+        delivered_groups = group[delivered]
+        assert len(np.unique(delivered_groups)) == len(delivered_groups)
+        if rule == 'drop':
+            np.testing.assert_array_equal(np.sort(delivered_groups), groups[sizes == 1])
+        else:
+            np.testing.assert_array_equal(np.sort(delivered_groups), groups)
@@ -0,0 +1,140 @@
+import json
+import os
+import numpy as np
+from models import Scenario
+from pdw_io import ColumnarSink, load_columns
+
+# Columns of the cached true pulse table (one table per sensor). Window and
+# RadarIndex restore the per-window, per-radar batches of the emission stage.
+TRUE_PULSE_COLUMNS = ['Window', 'RadarIndex', 'PulseIndex', 'EmissionTime', 'TOA', 'Amplitude',
+                      'Frequency', 'PulseWidth', 'AOA']
+
+METADATA_FILE = 'true_pulses.json'
+
+
+def true_pulse_columns(precision):
+    """
+    Column dtypes of the true pulse table under a precision policy.
+
+    :param precision: PrecisionPolicy
+    :return: Dictionary of column name -> dtype string
+    """
+    columns = {'Window': 'int64', 'RadarIndex': 'int32', 'PulseIndex': 'int64'}
+    columns.update({name: precision.dtype(name).name for name in TRUE_PULSE_COLUMNS if name not in columns})
+    return columns
+
+
+class TruePulseCacheWriter:
+    """
+    Persists the output of the emission stage.
+
+    Writes one memory-mappable table per sensor to <cache_dir>/<sensor>/ and the
+    scenario clock plus sensor and radar names to <cache_dir>/true_pulses.json.
+    """
+
+    def __init__(self, cache_dir, scenario, resume=None):
+        """
+        :param cache_dir: Cache directory
+        :param scenario: Scenario object the true pulses come from
+        :param resume: Optional positions returned by tell(), to continue an interrupted cache
+        """
+        self.cache_dir = cache_dir
+        self.sensor_names = [sensor.name for sensor in scenario.sensors]
+        os.makedirs(cache_dir, exist_ok=True)
+        metadata = {
+            'scenario': {
+                'start_time': scenario.start_time.magnitude,
+                'end_time': scenario.end_time.magnitude,
+                'time_step': scenario.time_step.magnitude,
+            },
+            'sensors': self.sensor_names,
+            'radars': [radar.name for radar in scenario.radars],
+        }
+        with open(os.path.join(cache_dir, METADATA_FILE), 'w') as f:
+            json.dump(metadata, f, indent=2)
+        self.sinks = [ColumnarSink(os.path.join(cache_dir, name), true_pulse_columns(scenario.precision),
+                                   resume=resume[name] if resume else None)
+                      for name in self.sensor_names]
+
+    def write_window(self, window, batches):
+        """
+        Append the true pulses of one window.
+
+        :param window: Window index
+        :param batches: batches[i][k] true pulse batch of radar k at sensor i, or None
+        """
+        for sink, sensor_batches in zip(self.sinks, batches):
+            for k, true_batch in enumerate(sensor_batches):
+                if true_batch is None:
+                    continue
+                n = len(true_batch['TOA'])
+                sink.write(dict(true_batch, Window=np.full(n, window), RadarIndex=np.full(n, k)))
+
+    def write_through(self, true_pulses, first_window=0):
+        """
+        Pass the output of the emission stage through while persisting it.
+
+        :param true_pulses: Generator as returned by pdw_stream.iter_true_pulses
+        :param first_window: Index of the first window of true_pulses
+        :return: Generator yielding the same items as true_pulses
+        """
+        for window, (window_start, window_end, batches) in enumerate(true_pulses, first_window):
+            self.write_window(window, batches)
+            yield window_start, window_end, batches
+
+    def tell(self):
+        return {name: sink.tell() for name, sink in zip(self.sensor_names, self.sinks)}
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class TruePulseCache:
+    """
+    Reader for a true pulse table written by TruePulseCacheWriter.
+    """
+
+    def __init__(self, cache_dir):
+        """
+        :param cache_dir: Cache directory
+        """
+        self.cache_dir = cache_dir
+        with open(os.path.join(cache_dir, METADATA_FILE)) as f:
+            self.metadata = json.load(f)
+        self.sensor_names = self.metadata['sensors']
+        self.radar_names = self.metadata['radars']
+        self.scenario = Scenario(self.metadata['scenario'])
+        self.end_time = self.scenario.end_time.magnitude
+
+    def match_sensors(self, sensors):
+        """
+        Order sensors like the cached tables.
+
+        :param sensors: Sensor objects, e.g. built from an edited configuration
+        :return: List of sensors in cache order
+        """
+        by_name = {sensor.name: sensor for sensor in sensors}
+        missing = [name for name in self.sensor_names if name not in by_name]
+        if missing:
+            raise ValueError(f"Sensors {missing} of the true pulse cache are missing from the configuration")
+        return [by_name[name] for name in self.sensor_names]
+
+    def iter_true_pulses(self):
+        """
+        Replay the emission stage from the memory-mapped tables.
+
+        :return: Generator with the same items as pdw_stream.iter_true_pulses
+        """
+        tables = [load_columns(os.path.join(self.cache_dir, name))[0] for name in self.sensor_names]
+        n_radars = len(self.radar_names)
+        for window, (window_start, window_end) in enumerate(self.scenario.time_windows()):
+            batches = []
+            for table in tables:
+                lo, hi = np.searchsorted(table['Window'], [window, window + 1])
+                bounds = lo + np.searchsorted(table['RadarIndex'][lo:hi], np.arange(n_radars + 1))
+                batches.append([
+                    {name: np.asarray(column[bounds[k]:bounds[k + 1]]) for name, column in table.items()
+                     if name not in ('Window', 'RadarIndex')} if bounds[k] < bounds[k + 1] else None
+                    for k in range(n_radars)])
+            yield window_start, window_end, batches